@@ -0,0 +1,395 @@
+import asyncio
+import codecs
+import contextlib
+import copy
+import subprocess
+import time
+from typing import Callable, Iterable, Optional
+
+from gpg_keys import KeyRegistry, parse_colons
+from gpg_process import CHUNK_SIZE, IMPORT_CHANGE_FLAGS, GpgProcess
+from gpg_trace import Tracer
+
+# Concurrent gpg processes per AsyncGpgProcess, further operations wait for a slot
+DEFAULT_MAX_CONCURRENT = 64
+
+
+def _shared(name: str) -> property:
+    """Attribute read and written through to the wrapped GpgProcess"""
+    return property(lambda self: getattr(self._gpg, name), lambda self, value: setattr(self._gpg, name, value))
+
+
+class AsyncGpgProcess:
+    """GpgProcess operations as coroutines running gpg through asyncio subprocesses
+
+    encrypt, encrypt_with_key, decrypt, list_secret_keys, import_key, export_key and delete_key
+    keep the GpgProcess arguments and results but must be awaited. At most max_concurrent gpg
+    processes run at once. Every operation is bounded by `timeout` seconds (None for no limit),
+    and cancelling the awaiting task kills its gpg process. Keys are not listed on construction,
+    await list_secret_keys() first.
+
+    It wraps a GpgProcess for its settings, keys, caches and agent session instead of deriving
+    from it, so none of the blocking GpgProcess methods can be called from the event loop.
+    """
+
+    def __init__(
+        self,
+        file_path=None,
+        passphrase=None,
+        tracer: Optional[Tracer] = None,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        timeout: Optional[float] = None,
+    ):
+        self._gpg = GpgProcess(file_path, passphrase, tracer, load_keys=False)
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        # Shared with the clones, so max_concurrent bounds them all. The semaphore is created on first
+        # use so it belongs to the running event loop.
+        self._limiter = {"semaphore": None}
+        self._processes = set()
+
+    file_path = _shared("file_path")
+    passphrase = _shared("passphrase")
+    selected_keys = _shared("selected_keys")
+    trust_recipients = _shared("trust_recipients")
+    selected_key = _shared("selected_key")
+    compression = _shared("compression")
+    crypto_profile = _shared("crypto_profile")
+    decrypt_cache = _shared("decrypt_cache")
+    session_keys = _shared("session_keys")
+    on_status = _shared("on_status")
+    keys = _shared("keys")
+    tracer = _shared("tracer")
+    agent = _shared("agent")
+    gpg_path = _shared("gpg_path")
+
+    @property
+    def secret_keys(self) -> list:
+        return self._gpg.secret_keys
+
+    def clone(self, **attributes) -> "AsyncGpgProcess":
+        """Copy with its own settings over the same keys, agent session and tracer, see GpgProcess.clone"""
+        other = copy.copy(self)
+        other._gpg = self._gpg.clone(**attributes)
+        return other
+
+    async def lock(self) -> None:
+        """GpgProcess.lock, the agent round trip runs on a thread"""
+        await asyncio.to_thread(self._gpg.lock)
+
+    async def encrypt(self, content: str) -> None:
+        if not self.file_path:
+            raise ValueError("encrypt: File path is required")
+        if not self.passphrase:
+            raise ValueError("encrypt: Passphrase is required")
+
+        self._gpg._discard_cached(self.file_path)
+        try:
+            compression = self._gpg._compression_args(self._gpg._text_sample(content), len(content))
+            await self._exec(
+                "encrypt",
+                self._gpg._symmetric_args() + compression + ["--yes", "--output", self.file_path],
+                self._gpg._iter_text(content),
+            )
+        except asyncio.TimeoutError:
+            raise ValueError(f"encrypt: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("encrypt: Failed to encrypt file", e)
+        except Exception as e:
+            raise ValueError(f"encrypt: Unexpected error: {str(e)}")
+
+    async def encrypt_with_key(self, content: str) -> None:
+        if not self.file_path:
+            raise ValueError("encrypt_with_key: File path is required")
+        if not self.selected_key:
+            raise ValueError("encrypt_with_key: No key selected")
+
+        self._gpg._discard_cached(self.file_path)
+        try:
+            async with self._agent_operation():
+                compression = self._gpg._compression_args(self._gpg._text_sample(content), len(content))
+                await self._exec(
+                    "encrypt_with_key",
+                    self._gpg._recipient_args() + compression + ["--output", self.file_path],
+                    self._gpg._iter_text(content),
+                )
+        except asyncio.TimeoutError:
+            raise ValueError(f"encrypt_with_key: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("encrypt_with_key: Failed to encrypt file", e)
+        except Exception as e:
+            raise ValueError(f"encrypt_with_key: Unexpected error: {str(e)}")
+
+    async def decrypt(self) -> str:
+        if not self.file_path:
+            raise ValueError("decrypt: File path is required")
+        if not self.passphrase:
+            raise ValueError("decrypt: Passphrase is required")
+
+        cache_key = None
+        if self.decrypt_cache is not None:
+            cache_key = self.decrypt_cache.file_key(self.file_path)
+            content = self.decrypt_cache.get(cache_key, self.passphrase)
+            if content is not None:
+                return content
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = []
+        try:
+            async with self._agent_operation():
+                await self._decrypt_path(self.file_path, lambda chunk: parts.append(decoder.decode(chunk)))
+                parts.append(decoder.decode(b"", final=True))
+        except asyncio.TimeoutError:
+            raise ValueError(f"decrypt: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("decrypt: Failed to decrypt file", e)
+        except Exception as e:
+            raise ValueError(f"decrypt: Unexpected error: {str(e)}")
+
+        content = "".join(parts)
+        if self.decrypt_cache is not None:
+            self.decrypt_cache.put(cache_key, self.passphrase, content)
+        return content
+
+    @contextlib.asynccontextmanager
+    async def _agent_operation(self):
+        """agent.operation() for coroutines, the agent round trip of begin_operation runs on a thread"""
+        begin = asyncio.ensure_future(asyncio.to_thread(self.agent.begin_operation))
+        try:
+            token = await asyncio.shield(begin)
+        except asyncio.CancelledError:
+            # The thread still begins the operation, end it once it did
+            def end_begun(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.agent.end_operation(future.result())
+
+            begin.add_done_callback(end_begun)
+            raise
+        try:
+            yield
+        finally:
+            self.agent.end_operation(token)
+
+    async def _decrypt_path(self, src: str, on_output: Callable[[bytes], None]) -> None:
+        """Decrypt a file, through its cached session key when there is one (see GpgProcess._decrypt_path_chunks)"""
+        cache = self.session_keys
+        if cache is None:
+            await self._exec("decrypt", self._gpg._decrypt_args() + [src], on_output=on_output)
+            return
+
+        key = cache.file_key(src)
+        session_key = cache.get(key, self.passphrase)
+        if session_key is not None:
+            produced = [False]
+
+            def forward(chunk: bytes) -> None:
+                produced[0] = True
+                on_output(chunk)
+
+            try:
+                # gpg reads the session key on stdin and skips the passphrase S2K entirely
+                args = [self.gpg_path, "--batch", "--yes", "--override-session-key-fd", "0", "--decrypt", src]
+                await self._exec("decrypt", args, [memoryview(session_key), b"\n"], on_output=forward)
+                return
+            except subprocess.CalledProcessError:
+                # The file was replaced without its mtime or size changing: forget the key, use the passphrase
+                cache.discard(src)
+                if produced[0]:
+                    raise
+            finally:
+                cache.release(session_key)
+
+        events = []
+        args = self._gpg._decrypt_args() + ["--show-session-key", src]
+        await self._exec("decrypt", args, on_output=on_output, events=events)
+        for event in events:
+            if event.keyword == "SESSION_KEY" and event.args:
+                cache.put(key, self.passphrase, event.args[0])
+
+    async def list_secret_keys(self, force: bool = False) -> None:
+        """Load the secret keys, reusing the cached list while the keyring files are unchanged"""
+        if not self.gpg_path:
+            raise ValueError("list_secret_keys: GPG path is required")
+
+        state = self._gpg._keyring_state()
+        if not force and self._gpg._keyring_signature is not None and state == self._gpg._keyring_signature:
+            return
+
+        try:
+            self.keys = KeyRegistry(await self._query_keys_async())
+            self._gpg._keyring_signature = state
+        except asyncio.TimeoutError:
+            raise ValueError(f"list_secret_keys: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("list_secret_keys: Failed to list secret keys", e)
+        except Exception as e:
+            raise ValueError(f"list_secret_keys: Unexpected error: {str(e)}")
+
+    async def _query_keys_async(self, fingerprints: Iterable[str] = ()) -> list:
+        output = await self._exec("list_secret_keys", self._gpg._keys_args(fingerprints))
+        return parse_colons(output.decode("utf-8", errors="replace"))
+
+    async def delete_key(self, fingerprint: str):
+        try:
+            # Delete the secret key first, then the public key (order is mandatory)
+            await self._exec("delete_key", [self.gpg_path, "--batch", "--yes", "--delete-secret-key", fingerprint])
+            await self._exec("delete_key", [self.gpg_path, "--batch", "--yes", "--delete-keys", fingerprint])
+            self.keys.remove(fingerprint)
+            self._gpg._keyring_signature = self._gpg._keyring_state()
+        except asyncio.TimeoutError:
+            raise ValueError(f"delete_key: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("delete_key: Failed to delete key", e)
+        except Exception as e:
+            raise ValueError(f"delete_key: Unexpected error: {str(e)}")
+
+    async def import_key(self, key_file: str, passphrase: str):
+        try:
+            cmd = [
+                self.gpg_path,
+                "--pinentry-mode=loopback",
+                "--passphrase",
+                passphrase,
+                "--import",
+                key_file,
+            ]
+            events = []
+            await self._exec("import_key", cmd, events=events)
+            # Without change flags the key was already there unchanged (16 alone: a known secret key)
+            fingerprints = [
+                event.fingerprint
+                for event in events
+                if event.keyword == "IMPORT_OK" and event.flags & IMPORT_CHANGE_FLAGS
+            ]
+            if fingerprints:
+                self.keys.update(await self._query_keys_async(dict.fromkeys(fingerprints)))
+            self._gpg._keyring_signature = self._gpg._keyring_state()
+        except asyncio.TimeoutError:
+            raise ValueError(f"import_key: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("gpg failed to import key", e)
+        except Exception as e:
+            raise ValueError(f"unexpected gpg error: {str(e)}")
+
+    async def export_key(self, fingerprint: str, output_file: str, passphrase: str):
+        try:
+            cmd = [
+                self.gpg_path,
+                "--armor",
+                "--export-secret-keys",
+                "--pinentry-mode=loopback",
+                "--passphrase",
+                passphrase,
+                fingerprint,
+            ]
+            with open(output_file, "wb") as f:
+                await self._exec("export_key", cmd, on_output=f.write)
+        except asyncio.TimeoutError:
+            raise ValueError(f"export_key: Timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg._gpg_error("export_key: Failed to export key", e)
+        except Exception as e:
+            raise ValueError(f"export_key: Unexpected error: {str(e)}")
+
+    def cancel(self) -> None:
+        """Kill every running gpg process, the operations awaiting them raise"""
+        for proc in list(self._processes):
+            if proc.returncode is None:
+                proc.kill()
+
+    async def _exec(
+        self,
+        operation: str,
+        args: list,
+        chunks: Optional[Iterable[bytes]] = None,
+        on_output: Optional[Callable[[bytes], None]] = None,
+        events: Optional[list] = None,
+    ) -> bytes:
+        """Run gpg, feeding chunks to its stdin while reading its stdout
+
+        stdout goes to on_output chunk by chunk, or is returned when on_output is None. The
+        status events of the run are appended to `events` when given.
+        Raises CalledProcessError on failure and asyncio.TimeoutError after self.timeout.
+        """
+        if self._limiter["semaphore"] is None:
+            self._limiter["semaphore"] = asyncio.Semaphore(self.max_concurrent)
+
+        async with self._limiter["semaphore"]:
+            started, start = time.time(), time.perf_counter()
+            status = self._gpg._status_reader(args)
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *(status.command(args) if status else args),
+                    stdin=subprocess.PIPE if chunks is not None else subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    pass_fds=status.pass_fds if status else (),
+                )
+            except BaseException:
+                if status:
+                    status.close()
+                raise
+            if status:
+                status.start()
+            self._processes.add(proc)
+            counts = {"in": 0, "out": 0}
+            parts = []
+
+            async def feed():
+                try:
+                    for chunk in chunks:
+                        proc.stdin.write(chunk)
+                        counts["in"] += len(chunk)
+                        # Waits while gpg's pipe is full, memory stays bounded
+                        await proc.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # gpg exited early, its return code tells why
+                finally:
+                    proc.stdin.close()
+
+            async def read():
+                while True:
+                    chunk = await proc.stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    counts["out"] += len(chunk)
+                    if on_output is None:
+                        parts.append(chunk)
+                    else:
+                        on_output(chunk)
+
+            io = [read(), proc.stderr.read()] + ([feed()] if chunks is not None else [])
+            tasks = [asyncio.ensure_future(coroutine) for coroutine in io]
+            try:
+                done, pending = await asyncio.wait(tasks, timeout=self.timeout, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+                if pending:
+                    raise asyncio.TimeoutError()
+                stderr = tasks[1].result()
+                await proc.wait()
+            except BaseException:
+                # Timed out, cancelled or an I/O task failed: do not leave gpg nor the other tasks running
+                for task in tasks:
+                    task.cancel()
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                # Retrieves their outcome, so asyncio does not log it as never retrieved
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                self._processes.discard(proc)
+                if status:
+                    # gpg has exited, the reader is at most a few lines from the end of the pipe
+                    await asyncio.to_thread(status.close)
+                self._gpg._trace(operation, args, started, start, counts["in"], counts["out"], proc.returncode)
+
+        status_events = status.events if status else []
+        if events is not None:
+            events.extend(status_events)
+        if proc.returncode != 0:
+            error = subprocess.CalledProcessError(proc.returncode, args, stderr=stderr)
+            error.status_events = status_events
+            raise error
+        return b"".join(parts)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+BACKUP_DIR_NAME = ".gpg_gui_backups"
+MANIFEST_NAME = "manifest.json"
+# Blob suffixes of OpenPGP data and of anything else (e.g. the plaintext a decrypt overwrote)
+ENCRYPTED_SUFFIX = ".gpg"
+PLAIN_SUFFIX = ".bak"
+# Packet tags an OpenPGP message can start with: session key packets and encrypted data packets
+OPENPGP_MESSAGE_TAGS = (1, 3, 9, 18, 20)
+
+
+class BackupStore:
+    """Versioned backups of a file, kept in a sidecar directory next to it
+
+    <dir>/.gpg_gui_backups/<file name>/manifest.json lists the versions of the file,
+    each one pointing to a content-addressed blob in the same directory: <sha256>.gpg
+    for OpenPGP data, <sha256>.bak for anything else, as recorded by the version's
+    "encrypted" flag.
+    Identical ciphertexts are stored once, and finding the versions of a file never
+    lists the (possibly huge) vault directory.
+    """
+
+    def __init__(
+        self,
+        keep_count: Optional[int] = 2,
+        max_age_days: Optional[float] = None,
+        max_total_bytes: Optional[int] = None,
+    ):
+        self.keep_count = keep_count
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+
+    def store_dir(self, file_path: str) -> str:
+        directory, name = os.path.split(os.path.abspath(file_path))
+        return os.path.join(directory, BACKUP_DIR_NAME, name)
+
+    def backup(self, file_path: str) -> Optional[str]:
+        """Move file_path into the store and return the path of its blob, None if there is nothing to back up"""
+        if not os.path.exists(file_path):
+            return None
+
+        store_dir = self.store_dir(file_path)
+        os.makedirs(store_dir, exist_ok=True)
+        version = {
+            "timestamp": time.time(),
+            "sha256": self._sha256(file_path),
+            "size": os.path.getsize(file_path),
+            "encrypted": self._is_encrypted(file_path),
+        }
+        blob_path = os.path.join(store_dir, self._blob_name(version))
+        if os.path.exists(blob_path):
+            # Same content already stored, only the version entry is new
+            os.unlink(file_path)
+        else:
+            os.replace(file_path, blob_path)
+
+        manifest = self._load_manifest(store_dir)
+        manifest["versions"].append(version)
+        self._apply_retention(store_dir, manifest)
+        self._save_manifest(store_dir, manifest)
+        return blob_path
+
+    def versions(self, file_path: str) -> list:
+        """Versions of file_path, oldest first, each with timestamp, sha256, size, encrypted and path"""
+        store_dir = self.store_dir(file_path)
+        return [
+            {
+                **version,
+                "encrypted": version.get("encrypted", True),
+                "path": os.path.join(store_dir, self._blob_name(version)),
+            }
+            for version in self._load_manifest(store_dir)["versions"]
+        ]
+
+    def restore(self, file_path: str, index: int = -1) -> str:
+        """Copy a stored version (the latest by default) back to file_path, backing up the current file first"""
+        versions = self.versions(file_path)
+        if not versions:
+            raise ValueError(f"restore: No backup of {os.path.basename(file_path)}")
+        blob_path = versions[index]["path"]
+        # Copy aside first: backing up the current file may prune the version being restored
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+        os.close(fd)
+        shutil.copyfile(blob_path, temp_path)
+        self.backup(file_path)
+        os.replace(temp_path, file_path)
+        return file_path
+
+    def _apply_retention(self, store_dir: str, manifest: dict) -> None:
+        versions = sorted(manifest["versions"], key=lambda v: v["timestamp"])
+        # The newest version is always kept
+        if self.max_age_days is not None:
+            limit = time.time() - self.max_age_days * 86400
+            versions = [v for v in versions[:-1] if v["timestamp"] >= limit] + versions[-1:]
+        if self.keep_count is not None and len(versions) > max(self.keep_count, 1):
+            versions = versions[-max(self.keep_count, 1) :]
+        if self.max_total_bytes is not None:
+            while len(versions) > 1 and self._stored_bytes(versions) > self.max_total_bytes:
+                versions.pop(0)
+
+        kept = {v["sha256"] for v in versions}
+        removed = set()
+        for version in manifest["versions"]:
+            digest = version["sha256"]
+            if digest not in kept and digest not in removed:
+                removed.add(digest)
+                try:
+                    os.unlink(os.path.join(store_dir, self._blob_name(version)))
+                except FileNotFoundError:
+                    pass
+        manifest["versions"] = versions
+
+    @staticmethod
+    def _blob_name(version: dict) -> str:
+        # Versions recorded before the flag existed were all ciphertexts
+        suffix = ENCRYPTED_SUFFIX if version.get("encrypted", True) else PLAIN_SUFFIX
+        return version["sha256"] + suffix
+
+    @staticmethod
+    def _is_encrypted(path: str) -> bool:
+        """Whether a file starts like an OpenPGP message, ASCII armored or binary"""
+        with open(path, "rb") as f:
+            head = f.read(64)
+        if head.startswith(b"-----BEGIN PGP MESSAGE-----"):
+            return True
+        if not head or not head[0] & 0x80:
+            return False
+        # New format headers carry the tag in the low 6 bits, old format ones in bits 2-5
+        tag = head[0] & 0x3F if head[0] & 0x40 else (head[0] >> 2) & 0x0F
+        return tag in OPENPGP_MESSAGE_TAGS
+
+    @staticmethod
+    def _stored_bytes(versions: list) -> int:
+        # Deduplicated blobs only count once
+        return sum({v["sha256"]: v["size"] for v in versions}.values())
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _load_manifest(store_dir: str) -> dict:
+        try:
+            with open(os.path.join(store_dir, MANIFEST_NAME), "r") as f:
+                manifest = json.load(f)
+            if isinstance(manifest.get("versions"), list):
+                return manifest
+        except (json.JSONDecodeError, IOError, AttributeError):
+            pass
+        return {"versions": []}
+
+    @staticmethod
+    def _save_manifest(store_dir: str, manifest: dict) -> None:
+        # Write then rename so an interrupted save never leaves a truncated manifest
+        fd, temp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, os.path.join(store_dir, MANIFEST_NAME))
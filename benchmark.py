@@ -0,0 +1,241 @@
+"""Benchmarks for GpgProcess, run against a throwaway GNUPGHOME
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --baseline bench.json
+
+With --baseline, any benchmark slower than the baseline by more than
+--threshold makes the script exit with status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+DEFAULT_SIZES = ["1K", "1M", "100M", "1G"]
+DEFAULT_KEY_COUNTS = [1, 100, 1000]
+DEFAULT_BACKUP_COUNTS = [1000, 10000]
+
+PASSPHRASE = "benchmark-passphrase"
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def measure(func, repeat, setup=None):
+    """Run func `repeat` times and return the wall times, setup() runs untimed before each run"""
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def make_payload(size):
+    # Repeated text compresses well, which is what notes look like
+    line = "The quick brown fox jumps over the lazy dog 0123456789\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def generate_keys(gpg_path, start, count):
+    """Add passwordless ed25519 keys to the benchmark keyring, cheap enough to build large keyrings"""
+    for i in range(start, start + count):
+        subprocess.run(
+            [
+                gpg_path,
+                "--batch",
+                "--passphrase",
+                "",
+                "--quick-gen-key",
+                f"Bench {i} <bench{i}@example.com>",
+                "ed25519",
+                "default",
+                "never",
+            ],
+            check=True,
+            capture_output=True,
+        )
+
+
+def bench_payloads(gpg, sizes, repeat, workdir, results):
+    path = os.path.join(workdir, "payload.gpg")
+    gpg.file_path = path
+    gpg.passphrase = PASSPHRASE
+
+    def remove_output():
+        if os.path.exists(path):
+            os.unlink(path)
+
+    for size_text in sizes:
+        size = parse_size(size_text)
+        content = make_payload(size)
+        params = {"size": size}
+
+        results[f"encrypt[{size_text}]"] = {
+            "runs": measure(lambda content=content: gpg.encrypt(content), repeat, remove_output),
+            **params,
+        }
+        results[f"decrypt[{size_text}]"] = {"runs": measure(gpg.decrypt, repeat), **params}
+
+        results[f"encrypt_with_key[{size_text}]"] = {
+            "runs": measure(lambda content=content: gpg.encrypt_with_key(content), repeat, remove_output),
+            **params,
+        }
+        results[f"decrypt_with_key[{size_text}]"] = {"runs": measure(gpg.decrypt, repeat), **params}
+        remove_output()
+
+
+def bench_key_listing(gpg, key_counts, repeat, results):
+    existing = len(gpg.secret_keys)
+    for count in sorted(key_counts):
+        if count > existing:
+            generate_keys(gpg.gpg_path, existing, count - existing)
+            existing = count
+        params = {"keys": count}
+        results[f"list_secret_keys[{count}]"] = {
+            "runs": measure(lambda: gpg.list_secret_keys(force=True), repeat),
+            **params,
+        }
+        results[f"list_secret_keys_cached[{count}]"] = {"runs": measure(gpg.list_secret_keys, repeat), **params}
+
+
+def bench_create_key(gpg, repeat, results):
+    from gpg_process import KEY_ALGORITHMS
+
+    counter = iter(range(repeat * len(KEY_ALGORITHMS)))
+    for algorithm in KEY_ALGORITHMS:
+
+        def create():
+            gpg.create_key(f"create{next(counter)}@example.com", "Create Bench", PASSPHRASE, algorithm)
+
+        results[f"create_key[{algorithm}]"] = {"runs": measure(create, repeat), "algorithm": algorithm}
+
+
+def bench_backups(backup_counts, repeat, workdir, results):
+    from backup_store import BackupStore
+
+    store = BackupStore()
+    for count in backup_counts:
+        directory = os.path.join(workdir, f"backups_{count}")
+        target = os.path.join(directory, "vault.gpg")
+
+        def populate():
+            # Legacy timestamped backups, the store must not have to look at them
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            stamp = datetime(2020, 1, 1)
+            for i in range(count):
+                name = f"vault_{(stamp + timedelta(seconds=i)).strftime('%Y%m%d_%H%M%S')}.gpg"
+                with open(os.path.join(directory, name), "wb") as f:
+                    f.write(b"x")
+            with open(target, "wb") as f:
+                f.write(b"ciphertext")
+
+        results[f"backup_existing_file[{count}]"] = {
+            "runs": measure(lambda: store.backup(target), repeat, populate),
+            "backups": count,
+        }
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def summarize(results):
+    for result in results.values():
+        result["median"] = statistics.median(result["runs"])
+        result["min"] = min(result["runs"])
+
+
+def compare(results, baseline, threshold):
+    """Print the ratio against the baseline for every benchmark, return the names that regressed"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"] if baseline[name]["median"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {baseline[name]['median']:10.4f}s -> {result['median']:10.4f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GpgProcess against a temporary GNUPGHOME")
+    parser.add_argument("--output", default="bench_output.json", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated slowdown ratio (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sizes", nargs="*", default=DEFAULT_SIZES, help="payload sizes, e.g. 1K 1M 1G")
+    parser.add_argument("--key-counts", nargs="*", type=int, default=DEFAULT_KEY_COUNTS)
+    parser.add_argument("--backup-counts", nargs="*", type=int, default=DEFAULT_BACKUP_COUNTS)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["payloads", "keys", "create_key", "backups"])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="gpg_gui_bench_")
+    gnupg_home = os.path.join(workdir, "gnupg")
+    os.makedirs(gnupg_home, mode=0o700)
+    os.environ["GNUPGHOME"] = gnupg_home
+
+    # Imported once GNUPGHOME points to the throwaway keyring
+    from gpg_process import GpgProcess
+
+    try:
+        gpg = GpgProcess()
+        gpg.create_key("bench@example.com", "Bench", PASSPHRASE)
+        gpg.selected_key = gpg.secret_keys[0]
+
+        results = {}
+        if "payloads" not in args.skip:
+            bench_payloads(gpg, args.sizes, args.repeat, workdir, results)
+        if "create_key" not in args.skip:
+            bench_create_key(gpg, args.repeat, results)
+        if "keys" not in args.skip:
+            bench_key_listing(gpg, args.key_counts, args.repeat, results)
+        if "backups" not in args.skip:
+            bench_backups(args.backup_counts, args.repeat, workdir, results)
+        summarize(results)
+
+        gpg_version = subprocess.run([gpg.gpg_path, "--version"], capture_output=True, text=True).stdout
+        gpg_version = gpg_version.split("\n")[0]
+    finally:
+        subprocess.run(["gpgconf", "--kill", "gpg-agent"], capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "gpg": gpg_version,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def wipe(buffer: bytearray) -> None:
+    """Overwrite a plaintext buffer in place"""
+    buffer[:] = bytes(len(buffer))
+
+
+class DecryptCache:
+    """Recently decrypted documents, kept in memory for the session
+
+    Entries are keyed by path, inode, mtime and size, so any change to the encrypted file
+    misses the cache. The cache holds at most max_bytes of plaintext, least recently used
+    entries go first, and entries expire ttl seconds after they were stored. Plaintext is
+    kept in bytearrays that are zeroed when an entry is evicted, expires or the cache is cleared.
+    An entry is only returned for the passphrase it was decrypted with, compared through an
+    HMAC keyed with a per-cache random key so the passphrase itself is never stored.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hmac_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_key(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _passphrase_tag(self, passphrase: Optional[str]) -> bytes:
+        return hmac.new(self._hmac_key, (passphrase or "").encode("utf-8"), hashlib.sha256).digest()
+
+    def get(self, key: Optional[tuple], passphrase: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None or not hmac.compare_digest(entry[1], self._passphrase_tag(passphrase)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return bytes(entry[0]).decode("utf-8")
+
+    def put(self, key: Optional[tuple], passphrase: Optional[str], content: str) -> None:
+        if key is None:
+            return
+        buffer = bytearray(content.encode("utf-8"))
+        if len(buffer) > self.max_bytes:
+            wipe(buffer)
+            return
+        with self._lock:
+            # Older versions of the same file can never be hit again
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._remove(stale)
+            self._entries[key] = (buffer, self._passphrase_tag(passphrase), time.monotonic())
+            self._size += len(buffer)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, path: str) -> None:
+        """Drop every entry of path, e.g. when it is about to be overwritten"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def _remove(self, key: tuple) -> None:
+        buffer = self._entries.pop(key)[0]
+        self._size -= len(buffer)
+        wipe(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,224 @@
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from gpg_trace import Span, Tracer
+
+
+class AgentSession:
+    """Keeps one Assuan connection to gpg-agent and flushes its cache by policy
+
+    The agent cache is only cleared (RELOADAGENT) when the TTL since the last
+    flush has expired, when the session has been idle for too long, or when
+    lock_now() is called. Everything else reuses the agent and its unlocked keys.
+    A timer flushes an idle session even when no further operation comes.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = 600,
+        idle_timeout: Optional[float] = 300,
+        tracer: Optional[Tracer] = None,
+    ):
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.tracer = tracer
+        self._gpgconf_path = shutil.which("gpgconf")
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._last_flush: Optional[float] = None
+        self._last_activity: Optional[float] = None
+        self._cold = False
+        # Operations between begin_operation and end_operation, the timer never flushes under them
+        self._active = 0
+        self._timer: Optional[threading.Timer] = None
+
+        # Statistics used to estimate the time saved by not flushing every time
+        self.flush_count = 0
+        self.skipped_flushes = 0
+        self._flush_seconds = 0.0
+        self._cold_ops = [0, 0.0]
+        self._warm_ops = [0, 0.0]
+
+    def _socket_path(self) -> str:
+        if self._gpgconf_path:
+            args = [self._gpgconf_path, "--list-dirs", "agent-socket"]
+            with Span(self.tracer, "agent_connect", args):
+                result = subprocess.run(args, check=True, capture_output=True, text=True)
+            return result.stdout.strip()
+        home = os.environ.get("GNUPGHOME") or os.path.expanduser("~/.gnupg")
+        return os.path.join(home, "S.gpg-agent")
+
+    def _connect(self) -> None:
+        path = self._socket_path()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            # The agent is not running yet, let gpgconf start it and retry once
+            if not self._gpgconf_path:
+                sock.close()
+                raise
+            args = [self._gpgconf_path, "--launch", "gpg-agent"]
+            with Span(self.tracer, "agent_launch", args):
+                subprocess.run(args, check=True, capture_output=True)
+            sock.connect(path)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        greeting = self._reader.readline()
+        if not greeting.startswith(b"OK"):
+            self._disconnect()
+            raise ValueError(f"AgentSession: Unexpected agent greeting: {greeting!r}")
+
+    def _command(self, command: str) -> list:
+        """Send an Assuan command and return its data lines, reconnecting once if the agent went away"""
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(command.encode("utf-8") + b"\n")
+                data = []
+                while True:
+                    line = self._reader.readline()
+                    if not line:
+                        raise ConnectionError("agent closed the connection")
+                    if line.startswith(b"OK"):
+                        return data
+                    if line.startswith(b"ERR"):
+                        raise ValueError(f"AgentSession: {command} failed: {line.decode(errors='replace').strip()}")
+                    if line.startswith(b"D "):
+                        data.append(line[2:].rstrip(b"\n").decode("utf-8", errors="replace"))
+            except (OSError, ConnectionError):
+                self._disconnect()
+                if attempt:
+                    raise
+        return []
+
+    def flush(self) -> None:
+        """Clear the agent passphrase cache"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        # Called with self._lock held
+        start = time.perf_counter()
+        with Span(self.tracer, "agent_flush", ["gpg-agent", "RELOADAGENT"]):
+            self._command("RELOADAGENT")
+        self._flush_seconds += time.perf_counter() - start
+        self.flush_count += 1
+        self._last_flush = time.monotonic()
+        self._cold = True
+        self._cancel_timer()
+
+    def lock_now(self) -> None:
+        self.flush()
+
+    def _flush_due(self, now: float) -> bool:
+        if self._last_flush is None:
+            return True
+        if self.ttl is not None and now - self._last_flush >= self.ttl:
+            return True
+        if self.idle_timeout is not None and self._last_activity is not None:
+            return now - self._last_activity >= self.idle_timeout
+        return False
+
+    def begin_operation(self) -> tuple:
+        """Apply the flush policy before a gpg operation, returns a token for end_operation"""
+        with self._lock:
+            if self._flush_due(time.monotonic()):
+                self._flush()
+            else:
+                self.skipped_flushes += 1
+            self._active += 1
+            cold, self._cold = self._cold, False
+        return time.perf_counter(), cold
+
+    def end_operation(self, token: tuple) -> None:
+        start, cold = token
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            bucket = self._cold_ops if cold else self._warm_ops
+            bucket[0] += 1
+            bucket[1] += elapsed
+            self._active -= 1
+            self._last_activity = time.monotonic()
+            self._schedule_timer()
+
+    @contextmanager
+    def operation(self):
+        """begin_operation/end_operation around a block, end_operation runs even when gpg fails"""
+        token = self.begin_operation()
+        try:
+            yield
+        finally:
+            self.end_operation(token)
+
+    def _schedule_timer(self) -> None:
+        # Called with self._lock held, after an operation may have unlocked keys
+        delays = []
+        if self.idle_timeout is not None:
+            delays.append(self.idle_timeout)
+        if self.ttl is not None and self._last_flush is not None:
+            delays.append(self.ttl - (time.monotonic() - self._last_flush))
+        self._cancel_timer()
+        if delays:
+            self._timer = threading.Timer(max(min(delays), 0.0), self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expire(self) -> None:
+        with self._lock:
+            if self._active or not self._flush_due(time.monotonic()):
+                # Still in use: the end of the running operations schedules the next check
+                return
+            try:
+                self._flush()
+            except (OSError, ValueError):
+                pass  # The agent went away, and its cache with it
+
+    def stats(self) -> dict:
+        """Report flushes done/skipped and the estimated time saved per operation"""
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        avg_flush = self._flush_seconds / self.flush_count if self.flush_count else 0.0
+        avg_cold = self._cold_ops[1] / self._cold_ops[0] if self._cold_ops[0] else 0.0
+        avg_warm = self._warm_ops[1] / self._warm_ops[0] if self._warm_ops[0] else 0.0
+        # A skipped flush saves the flush itself plus the unlock cost a cold operation pays
+        saved_per_op = avg_flush
+        if self._cold_ops[0] and self._warm_ops[0]:
+            saved_per_op += max(avg_cold - avg_warm, 0.0)
+        return {
+            "flushes": self.flush_count,
+            "skipped_flushes": self.skipped_flushes,
+            "avg_flush_seconds": avg_flush,
+            "avg_cold_operation_seconds": avg_cold,
+            "avg_warm_operation_seconds": avg_warm,
+            "saved_seconds_per_operation": saved_per_op,
+            "saved_seconds_total": saved_per_op * self.skipped_flushes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._cancel_timer()
+            self._disconnect()
+
+    def _disconnect(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
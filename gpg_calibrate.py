@@ -0,0 +1,182 @@
+"""Ranks the ciphers, AEAD modes and digests of the local gpg by speed
+
+    python gpg_calibrate.py            calibrate and store the profile in the preferences
+    python gpg_calibrate.py --dry-run  only print the measurements
+
+The stored profile orders the key preferences written by create_key and
+set_key_trust_and_prefs, and picks the cipher and S2K digest of symmetric encryption.
+Only algorithms considered secure are candidates: 3DES, CAST5, IDEA, BLOWFISH, SHA1
+and RIPEMD160 are never benchmarked, whatever their speed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+# Candidates, strongest first: ties in speed keep this order
+SECURE_CIPHERS = ("AES256", "AES192", "AES", "TWOFISH", "CAMELLIA256", "CAMELLIA192", "CAMELLIA128")
+SECURE_DIGESTS = ("SHA512", "SHA384", "SHA256", "SHA224")
+SECURE_AEAD = ("OCB", "EAX")
+COMPRESSION_PREFERENCES = ("ZLIB", "BZIP2", "ZIP", "Uncompressed")
+
+# Used until the host has been calibrated
+DEFAULT_PROFILE = {
+    "ciphers": ["AES256", "AES192", "AES"],
+    "digests": ["SHA512", "SHA384", "SHA256"],
+    "aead": [],
+}
+
+# Ranked within this fraction of the fastest, an algorithm keeps its place in the strongest-first order
+SPEED_TOLERANCE = 0.05
+
+CALIBRATION_SIZE = 16 * 1024 * 1024
+CALIBRATION_PASSPHRASE = "gpg-gui-calibration"
+
+
+def supported_algorithms(gpg_process) -> dict:
+    """Cipher, Hash and AEAD names listed by gpg --version, in upper case"""
+    output = gpg_process._run([gpg_process.gpg_path, "--version"], capture_output=True, text=True).stdout
+    supported = {}
+    section = None
+    for line in output.splitlines():
+        if ":" in line and not line.startswith(" "):
+            section, line = line.split(":", 1)
+        if section in ("Cipher", "Hash", "AEAD"):
+            names = [name.strip().upper() for name in line.split(",")]
+            supported.setdefault(section, []).extend(name for name in names if name)
+    return supported
+
+
+def preference_list(profile: Optional[dict]) -> str:
+    """Key preference string (--default-preference-list / setpref) of a profile"""
+    profile = profile or DEFAULT_PROFILE
+    return " ".join([*profile["ciphers"], *profile.get("aead", []), *profile["digests"], *COMPRESSION_PREFERENCES])
+
+
+def symmetric_args(profile: Optional[dict]) -> list:
+    """Cipher and S2K digest options for gpg --symmetric"""
+    profile = profile or DEFAULT_PROFILE
+    args = ["--cipher-algo", profile["ciphers"][0], "--s2k-digest-algo", profile["digests"][0]]
+    if profile.get("aead"):
+        args += ["--force-aead", "--aead-algo", profile["aead"][0]]
+    return args
+
+
+def _rank(timings: dict, candidates: tuple) -> list:
+    fastest = min(timings.values())
+    # Strongest-first among those close enough to the fastest, then the rest by speed
+    close = [name for name in candidates if name in timings and timings[name] <= fastest * (1 + SPEED_TOLERANCE)]
+    rest = sorted((name for name in timings if name not in close), key=timings.get)
+    return close + rest
+
+
+def _best_time(gpg_process, args: list, repeat: int) -> Optional[float]:
+    """Fastest of `repeat` runs after an untimed warm-up run, None when gpg rejects the options"""
+    try:
+        # Takes the cold start (agent launch, page cache) off whatever is measured first
+        gpg_process._run(args, capture_output=True)
+    except subprocess.CalledProcessError:
+        return None
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            gpg_process._run(args, capture_output=True)
+        except subprocess.CalledProcessError:
+            return None
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def calibrate(gpg_process, size: int = CALIBRATION_SIZE, repeat: int = 3) -> dict:
+    """Benchmark the supported secure algorithms on a random payload and return the ranked profile"""
+    supported = supported_algorithms(gpg_process)
+    # AES128 is listed as "AES" by gpg
+    ciphers = [name for name in SECURE_CIPHERS if name in supported.get("Cipher", [])]
+    digests = [name for name in SECURE_DIGESTS if name in supported.get("Hash", [])]
+    aead_modes = [name for name in SECURE_AEAD if name in supported.get("AEAD", [])]
+    if not ciphers or not digests:
+        raise ValueError("calibrate: gpg supports none of the secure ciphers or digests")
+
+    fd, payload = tempfile.mkstemp(prefix="gpg_gui_calibrate_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(size))
+        # Minimal S2K work and no compression: only the cipher is measured
+        symmetric = [
+            gpg_process.gpg_path, "--batch", "--yes", "--symmetric",
+            "--passphrase", CALIBRATION_PASSPHRASE,
+            "--s2k-mode", "3", "--s2k-count", "1024",
+            "--compress-algo", "none",
+            "--output", os.devnull,
+        ]
+
+        cipher_times = {}
+        for cipher in ciphers:
+            seconds = _best_time(gpg_process, symmetric + ["--cipher-algo", cipher, payload], repeat)
+            if seconds is not None:
+                cipher_times[cipher] = seconds
+        if not cipher_times:
+            raise ValueError("calibrate: gpg could not encrypt with any secure cipher")
+
+        # The AEAD modes run on top of the fastest cipher
+        aead_times = {}
+        for mode in aead_modes:
+            args = symmetric + ["--cipher-algo", min(cipher_times, key=cipher_times.get)]
+            seconds = _best_time(gpg_process, args + ["--force-aead", "--aead-algo", mode, payload], repeat)
+            if seconds is not None:
+                aead_times[mode] = seconds
+
+        digest_times = {}
+        for digest in digests:
+            seconds = _best_time(gpg_process, [gpg_process.gpg_path, "--print-md", digest, payload], repeat)
+            if seconds is not None:
+                digest_times[digest] = seconds
+        if not digest_times:
+            raise ValueError("calibrate: gpg could not hash with any secure digest")
+    finally:
+        os.unlink(payload)
+
+    version = gpg_process._run([gpg_process.gpg_path, "--version"], capture_output=True, text=True).stdout
+    return {
+        "ciphers": _rank(cipher_times, SECURE_CIPHERS),
+        "digests": _rank(digest_times, SECURE_DIGESTS),
+        "aead": _rank(aead_times, SECURE_AEAD) if aead_times else [],
+        "measurements": {
+            "bytes": size,
+            # MB/s, gpg start-up included
+            "ciphers": {name: size / seconds / 1e6 for name, seconds in cipher_times.items()},
+            "aead": {name: size / seconds / 1e6 for name, seconds in aead_times.items()},
+            "digests": {name: size / seconds / 1e6 for name, seconds in digest_times.items()},
+        },
+        "gpg": version.split("\n")[0],
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the gpg ciphers and digests of this host by speed")
+    parser.add_argument("--size", type=int, default=CALIBRATION_SIZE, help="payload size in bytes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dry-run", action="store_true", help="print the profile without storing it")
+    args = parser.parse_args()
+
+    from gpg_process import GpgProcess
+    from preferences import Preferences
+
+    profile = calibrate(GpgProcess(), args.size, args.repeat)
+    print(json.dumps(profile, indent=2))
+    print(f"Key preferences: {preference_list(profile)}")
+    if not args.dry_run:
+        Preferences().set_crypto_profile(profile)
+        print("Profile stored in the preferences")
+
+
+if __name__ == "__main__":
+    main()
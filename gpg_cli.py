@@ -0,0 +1,325 @@
+"""Command-line interface to GpgProcess, usable without a display
+
+    gpg-gui-cli encrypt < notes.txt > notes.txt.gpg
+    gpg-gui-cli encrypt -r alice@example.com -r bob@example.com -i report.pdf -o report.pdf.gpg
+    gpg-gui-cli decrypt < notes.txt.gpg
+    gpg-gui-cli keys list
+    gpg-gui-cli bulk encrypt ~/Documents/vault --workers 4
+    gpg-gui-cli daemon --max-concurrent 4
+
+Passphrases come from --passphrase-file, --passphrase-fd or the GPG_GUI_PASSPHRASE
+environment variable, otherwise they are asked on the terminal. Errors are reported
+on stderr with exit status 1.
+"""
+
+import argparse
+import getpass
+import json
+import os
+import signal
+import sys
+import threading
+
+from gpg_process import CHUNK_SIZE, DEFAULT_KEY_ALGORITHM, KEY_ALGORITHMS, GpgProcess
+from preferences import Preferences
+
+PASSPHRASE_ENV = "GPG_GUI_PASSPHRASE"
+
+
+def read_passphrase(args, prompt="Passphrase: ", confirm=False) -> str:
+    if args.passphrase_file:
+        with open(args.passphrase_file, "r") as f:
+            return f.readline().rstrip("\n")
+    if args.passphrase_fd is not None:
+        with os.fdopen(args.passphrase_fd, "r", closefd=False) as f:
+            return f.readline().rstrip("\n")
+    if os.environ.get(PASSPHRASE_ENV):
+        return os.environ[PASSPHRASE_ENV]
+    # getpass reads from the terminal, stdin stays free for the data
+    passphrase = getpass.getpass(prompt)
+    if confirm and getpass.getpass("Repeat passphrase: ") != passphrase:
+        raise ValueError("Passphrases do not match")
+    return passphrase
+
+
+def make_gpg(args, load_keys=False) -> GpgProcess:
+    """GpgProcess set up from the saved preferences, without listing the keyring unless asked to"""
+    gpg = GpgProcess(load_keys=load_keys)
+    preferences = Preferences()
+    gpg.compression = getattr(args, "compression", None) or preferences.get_compression()
+    gpg.crypto_profile = preferences.get_crypto_profile()
+    recipients = getattr(args, "recipient", None)
+    if recipients:
+        # gpg resolves fingerprints, key IDs and emails itself
+        gpg.selected_keys = [(recipient, recipient) for recipient in recipients]
+        gpg.trust_recipients = getattr(args, "trust_recipients", False)
+    elif getattr(args, "selected_keys", False):
+        gpg.selected_keys = preferences.get_selected_keys()
+        if not gpg.selected_keys:
+            raise ValueError("No saved recipient keys, select them in the GUI or use --recipient")
+        # Picked in the GUI key dialog, which encrypts for them whatever their validity
+        gpg.trust_recipients = True
+    return gpg
+
+
+def iter_input(path):
+    if path in (None, "-"):
+        stream = sys.stdin.buffer
+        yield from iter(lambda: stream.read(CHUNK_SIZE), b"")
+    else:
+        yield from GpgProcess.iter_file(path)
+
+
+def write_output(path, chunks) -> None:
+    if path in (None, "-"):
+        out = sys.stdout.buffer
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+        return
+    # Written next to the target and renamed, a failed run leaves no truncated file behind
+    temp_path = f"{path}.part"
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def is_file(path) -> bool:
+    return path not in (None, "-")
+
+
+def cmd_encrypt(args) -> int:
+    gpg = make_gpg(args)
+    use_key = bool(gpg.selected_keys)
+    if not use_key:
+        gpg.passphrase = read_passphrase(args, confirm=sys.stdin.isatty() or is_file(args.input))
+    if is_file(args.input) and is_file(args.output):
+        # gpg reads and writes the files itself
+        gpg.encrypt_file(args.input, args.output, use_key)
+    else:
+        write_output(args.output, gpg.encrypt_stream(iter_input(args.input), use_key))
+    return 0
+
+
+def cmd_decrypt(args) -> int:
+    gpg = make_gpg(args)
+    gpg.passphrase = read_passphrase(args)
+    if is_file(args.input) and is_file(args.output):
+        gpg.decrypt_file(args.input, args.output)
+    else:
+        write_output(args.output, gpg.decrypt_stream(iter_input(args.input)))
+    return 0
+
+
+def cmd_keys_list(args) -> int:
+    gpg = make_gpg(args, load_keys=True)
+    if args.query:
+        records = gpg.keys.lookup(args.query)
+    else:
+        records = list(gpg.keys)
+    records = [record for record in records if args.public or record.secret]
+    if args.json:
+        print(json.dumps([{"uid": record.uid, **record.as_dict()} for record in records], indent=2))
+    else:
+        for record in records:
+            for uid in record.uids:
+                print(f"{record.fingerprint}  {'sec' if record.secret else 'pub'}  {uid}")
+    return 0
+
+
+def cmd_keys_create(args) -> int:
+    gpg = make_gpg(args)
+    algorithm = args.algorithm or Preferences().get_key_algorithm()
+    passphrase = read_passphrase(args, "Passphrase for the new key: ", confirm=True)
+    result = gpg.create_key(args.email, args.name, passphrase, algorithm)
+    print(result["fingerprint"])
+    return 0
+
+
+def cmd_keys_import(args) -> int:
+    gpg = make_gpg(args)
+    report = gpg.import_keys(args.files, read_passphrase(args, "Passphrase of the imported keys: "))
+    for result in report.results:
+        if not result.ok:
+            status = f"rejected: {result.problem}"
+        elif result.unchanged:
+            status = "unchanged"
+        else:
+            status = ", ".join(
+                name for flag, name in ((1, "new"), (2, "new user IDs"), (8, "new subkeys"), (16, "secret"))
+                if result.flags & flag
+            ) or "new signatures"
+        print(f"{result.fingerprint or '-'}  {status}")
+    print(report.summary(), file=sys.stderr)
+    return 1 if report.failed or not report.results else 0
+
+
+def cmd_keys_export(args) -> int:
+    gpg = make_gpg(args, load_keys=True)
+    fingerprints = []
+    for query in args.keys:
+        records = gpg.keys.lookup(query)
+        if not records:
+            raise ValueError(f"No key matches {query}")
+        fingerprints.extend(record.fingerprint for record in records)
+    passphrase = None if args.public else read_passphrase(args, "Passphrase of the keys: ")
+    output = args.output_dir or args.output
+    report = gpg.export_keys(fingerprints, output, passphrase, per_key=bool(args.output_dir))
+    for fingerprint, path in report.outputs.items():
+        print(f"{fingerprint}  {path}")
+    for fingerprint in report.missing:
+        print(f"{fingerprint}  not exported: {report.problems[fingerprint]}", file=sys.stderr)
+    return 1 if report.missing else 0
+
+
+def cmd_keys_delete(args) -> int:
+    if not args.yes:
+        if not sys.stdin.isatty():
+            raise ValueError("Refusing to delete a key without --yes when not run interactively")
+        if input(f"Delete the secret and public key {args.fingerprint}? [y/N] ").strip().lower() != "y":
+            return 1
+    make_gpg(args).delete_key(args.fingerprint)
+    return 0
+
+
+def cmd_bulk(args) -> int:
+    gpg = make_gpg(args)
+
+    def progress(done, total, result):
+        status = "ok" if result.ok else f"FAILED: {result.error}"
+        print(f"[{done}/{total}] {result.source}: {status}", file=sys.stderr)
+
+    if args.action == "encrypt":
+        use_key = bool(gpg.selected_keys)
+        if not use_key:
+            gpg.passphrase = read_passphrase(args, confirm=True)
+        report = gpg.encrypt_many(args.directory, args.output_dir, use_key, args.workers, progress)
+    else:
+        gpg.passphrase = read_passphrase(args)
+        report = gpg.decrypt_many(args.directory, args.output_dir, args.workers, progress)
+
+    print(
+        f"{len(report.succeeded)} succeeded, {len(report.failed)} failed in {report.seconds:.2f}s "
+        f"({report.files_per_second:.1f} files/s, {report.bytes_per_second / 1e6:.1f} MB/s)",
+        file=sys.stderr,
+    )
+    return 1 if report.failed else 0
+
+
+def cmd_daemon(args) -> int:
+    from gpg_daemon import DaemonClient, GpgDaemon
+
+    if args.metrics:
+        with DaemonClient(args.socket) as client:
+            print(json.dumps(client.metrics(), indent=2))
+        return 0
+
+    daemon = GpgDaemon(make_gpg(args, load_keys=True), args.socket, args.max_concurrent, args.max_queue)
+    # shutdown() waits for serve_forever to return, it cannot run on the serving thread itself
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.shutdown).start())
+    print(f"Listening on {daemon.socket_path}", file=sys.stderr)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    passphrase = argparse.ArgumentParser(add_help=False)
+    passphrase.add_argument("--passphrase-file", help="read the passphrase from the first line of this file")
+    passphrase.add_argument("--passphrase-fd", type=int, help="read the passphrase from this file descriptor")
+
+    recipients = argparse.ArgumentParser(add_help=False)
+    group = recipients.add_mutually_exclusive_group()
+    group.add_argument(
+        "-r", "--recipient", action="append", help="encrypt for this key (repeatable), symmetric otherwise"
+    )
+    group.add_argument("--selected-keys", action="store_true", help="encrypt for the keys selected in the GUI")
+    recipients.add_argument(
+        "--trust-recipients",
+        action="store_true",
+        help="use the --recipient keys even if nobody certified them (e.g. freshly imported public keys)",
+    )
+
+    parser = argparse.ArgumentParser(prog="gpg-gui-cli", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    encrypt = commands.add_parser("encrypt", parents=[passphrase, recipients], help="encrypt stdin or a file")
+    encrypt.add_argument("-i", "--input", help="file to encrypt (default stdin)")
+    encrypt.add_argument("-o", "--output", help="where to write the ciphertext (default stdout)")
+    encrypt.add_argument("--compression", choices=["auto", "none", "zip", "zlib", "bzip2"])
+    encrypt.set_defaults(func=cmd_encrypt)
+
+    decrypt = commands.add_parser("decrypt", parents=[passphrase], help="decrypt stdin or a file")
+    decrypt.add_argument("-i", "--input", help="file to decrypt (default stdin)")
+    decrypt.add_argument("-o", "--output", help="where to write the plaintext (default stdout)")
+    decrypt.set_defaults(func=cmd_decrypt)
+
+    keys = commands.add_parser("keys", help="manage secret keys").add_subparsers(dest="keys_command", required=True)
+    key_list = keys.add_parser("list", help="list the secret keys")
+    key_list.add_argument("query", nargs="?", help="only the keys with this fingerprint, key ID or email")
+    key_list.add_argument("--public", action="store_true", help="include keys without a secret part")
+    key_list.add_argument("--json", action="store_true")
+    key_list.set_defaults(func=cmd_keys_list)
+
+    key_create = keys.add_parser("create", parents=[passphrase], help="create a key pair")
+    key_create.add_argument("--name", required=True)
+    key_create.add_argument("--email", required=True)
+    key_create.add_argument(
+        "--algorithm", choices=list(KEY_ALGORITHMS), help=f"default: saved preference or {DEFAULT_KEY_ALGORITHM}"
+    )
+    key_create.set_defaults(func=cmd_keys_create)
+
+    key_import = keys.add_parser("import", parents=[passphrase], help="import key files in one gpg run")
+    key_import.add_argument("files", nargs="+", help="key files, or directories of .asc/.gpg/.key/.pgp files")
+    key_import.set_defaults(func=cmd_keys_import)
+
+    key_export = keys.add_parser("export", parents=[passphrase], help="export secret keys, ASCII armored")
+    key_export.add_argument("keys", nargs="+", help="fingerprints, key IDs or emails")
+    output = key_export.add_mutually_exclusive_group(required=True)
+    output.add_argument("-o", "--output", help="write all the keys into this file")
+    output.add_argument("--output-dir", help="write one <fingerprint>.asc file per key into this directory")
+    key_export.add_argument("--public", action="store_true", help="export the public keys, no passphrase needed")
+    key_export.set_defaults(func=cmd_keys_export)
+
+    key_delete = keys.add_parser("delete", help="delete a secret and public key")
+    key_delete.add_argument("fingerprint")
+    key_delete.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    key_delete.set_defaults(func=cmd_keys_delete)
+
+    bulk = commands.add_parser("bulk", parents=[passphrase, recipients], help="encrypt or decrypt a directory tree")
+    bulk.add_argument("action", choices=["encrypt", "decrypt"])
+    bulk.add_argument("directory")
+    bulk.add_argument("-o", "--output-dir", help="mirror the tree here instead of writing next to the sources")
+    bulk.add_argument("--workers", type=int, help="parallel gpg processes (default: CPU count)")
+    bulk.set_defaults(func=cmd_bulk)
+
+    daemon = commands.add_parser("daemon", help="serve requests from a warm GpgProcess over a Unix socket")
+    daemon.add_argument("--socket", help="socket path (default: S.gpg-gui-daemon in GNUPGHOME)")
+    daemon.add_argument("--max-concurrent", type=int, help="requests run at once (default: CPU count)")
+    daemon.add_argument("--max-queue", type=int, default=32, help="requests waiting before new ones are rejected")
+    daemon.add_argument("--metrics", action="store_true", help="print the metrics of the running daemon and exit")
+    daemon.set_defaults(func=cmd_daemon)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"gpg-gui-cli: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""Local encryption daemon: one warm GpgProcess shared by many short-lived clients
+
+    gpg-gui-cli daemon                      serve on the default socket
+    gpg-gui-cli daemon --metrics            print the metrics of the running daemon
+
+Clients talk to a Unix socket (mode 0600, in GNUPGHOME by default). Every message,
+in both directions, is a 4-byte big-endian length followed by that many bytes of
+UTF-8 JSON. Binary payloads travel base64 encoded in the "data" field.
+
+    {"op": "encrypt", "data": ..., "passphrase": ...}        symmetric
+    {"op": "encrypt", "data": ..., "recipients": [...]}      key encryption
+    {"op": "decrypt", "data": ..., "passphrase": ...}
+    {"op": "list_keys"}, {"op": "metrics"}, {"op": "ping"}
+
+Replies are {"ok": true, ...} or {"ok": false, "error": message}, with a
+"reason" (see gpg_status.REASON_MESSAGES) when gpg told why it failed. At most
+max_concurrent requests run at once and max_queue more wait for a slot; beyond
+that requests are rejected straight away with a "busy" error.
+
+The daemon shares one gpg-agent session between its clients, under the session's
+TTL/idle flush policy. A key stays unlocked only for requests bringing the passphrase
+that unlocked it: a decrypt request with another passphrase waits for the running
+ones to finish and flushes the agent cache first.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from gpg_process import GpgProcess
+from gpg_status import GpgError
+
+SOCKET_NAME = "S.gpg-gui-daemon"
+HEADER = struct.Struct(">I")
+# Largest message accepted, payloads are held in memory on both sides
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+DEFAULT_MAX_QUEUE = 32
+
+
+def default_socket_path() -> str:
+    home = os.environ.get("GNUPGHOME") or os.path.expanduser("~/.gnupg")
+    return os.path.join(home, SOCKET_NAME)
+
+
+def read_frame(stream) -> Optional[dict]:
+    """Next message of a binary stream, None when the peer closed the connection"""
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ValueError("read_frame: Truncated header")
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"read_frame: Message of {length} bytes exceeds {MAX_FRAME_SIZE}")
+    body = stream.read(length)
+    if len(body) < length:
+        raise ValueError("read_frame: Truncated message")
+    return json.loads(body.decode("utf-8"))
+
+
+def write_frame(stream, message: dict) -> None:
+    body = json.dumps(message).encode("utf-8")
+    stream.write(HEADER.pack(len(body)) + body)
+    stream.flush()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = read_frame(self.rfile)
+            except (ValueError, UnicodeDecodeError) as e:
+                # The stream cannot be resynchronized after a framing error
+                write_frame(self.wfile, {"ok": False, "error": str(e)})
+                return
+            if request is None:
+                return
+            write_frame(self.wfile, self.server.daemon.handle(request))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class GpgDaemon:
+    """Serves encrypt/decrypt/list_keys requests from one GpgProcess over a Unix socket"""
+
+    def __init__(
+        self,
+        gpg: GpgProcess,
+        socket_path: Optional[str] = None,
+        max_concurrent: Optional[int] = None,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self.gpg = gpg
+        self.socket_path = socket_path or default_socket_path()
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.max_queue = max_queue
+        # Admission covers running and waiting requests, the worker semaphore only running ones
+        self._admission = threading.BoundedSemaphore(self.max_concurrent + max_queue)
+        self._workers = threading.BoundedSemaphore(self.max_concurrent)
+        self._keys_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._started = time.time()
+        self._queued = 0
+        self._running = 0
+        self._rejected = 0
+        self._max_queued = 0
+        self._operations = {}
+        self._server = None
+        # Decrypt requests running on the agent and the (HMAC of the) passphrase they all use
+        self._agent_cond = threading.Condition()
+        self._agent_users = 0
+        self._agent_owner = None
+        self._hmac_key = secrets.token_bytes(32)
+
+    def handle(self, request: dict) -> dict:
+        """Run one request under the concurrency limits and return its reply"""
+        op = request.get("op") if isinstance(request, dict) else None
+        if op == "ping":
+            return {"ok": True}
+        if op == "metrics":
+            return {"ok": True, "metrics": self.metrics()}
+        if op not in ("encrypt", "decrypt", "list_keys"):
+            return {"ok": False, "error": f"Unknown operation {op!r}"}
+
+        if not self._admission.acquire(blocking=False):
+            with self._metrics_lock:
+                self._rejected += 1
+            return {"ok": False, "error": "busy: request queue is full"}
+        try:
+            with self._metrics_lock:
+                self._queued += 1
+                self._max_queued = max(self._max_queued, self._queued)
+            queued_at = time.perf_counter()
+            with self._workers:
+                with self._metrics_lock:
+                    self._queued -= 1
+                    self._running += 1
+                started = time.perf_counter()
+                try:
+                    reply = {"ok": True, **getattr(self, f"_op_{op}")(request)}
+                except (ValueError, TypeError, KeyError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                    if getattr(e, "reason", None):
+                        reply["reason"] = e.reason
+                except Exception as e:
+                    # A failure of the daemon itself: the client still gets its reply and keeps the connection
+                    reply = {"ok": False, "error": f"Internal error: {type(e).__name__}: {e}"}
+                finally:
+                    with self._metrics_lock:
+                        self._running -= 1
+            self._count(op, reply["ok"], started - queued_at, time.perf_counter() - started)
+            return reply
+        finally:
+            self._admission.release()
+
+    def _op_encrypt(self, request: dict) -> dict:
+        recipients = request.get("recipients") or []
+        # Each request gets its own view of the warm instance, so settings never leak between clients
+        gpg = self.gpg.clone(
+            passphrase=request.get("passphrase"),
+            selected_keys=[(recipient, recipient) for recipient in recipients],
+            compression=request.get("compression") or self.gpg.compression,
+        )
+        data = gpg.encrypt_bytes(base64.b64decode(request["data"]), use_key=bool(recipients))
+        return {"data": base64.b64encode(data).decode("ascii")}
+
+    def _op_decrypt(self, request: dict) -> dict:
+        passphrase = request.get("passphrase")
+        gpg = self.gpg.clone(passphrase=passphrase)
+        with self._agent_user(passphrase):
+            data = gpg.decrypt_bytes(base64.b64decode(request["data"]))
+        return {"data": base64.b64encode(data).decode("ascii")}
+
+    @contextmanager
+    def _agent_user(self, passphrase: Optional[str]):
+        """Share the agent's unlocked keys only between requests with the same passphrase
+
+        gpg does not check the passphrase of a key gpg-agent already unlocked, so a request
+        with another passphrase than the running ones waits for them and flushes the cache.
+        """
+        tag = hmac.new(self._hmac_key, (passphrase or "").encode("utf-8"), hashlib.sha256).digest()
+        with self._agent_cond:
+            while self._agent_users and not hmac.compare_digest(self._agent_owner, tag):
+                self._agent_cond.wait()
+            if self._agent_owner is None or not hmac.compare_digest(self._agent_owner, tag):
+                self.gpg.agent.flush()
+                self._agent_owner = tag
+            self._agent_users += 1
+        try:
+            yield
+        finally:
+            with self._agent_cond:
+                self._agent_users -= 1
+                self._agent_cond.notify_all()
+
+    def _op_list_keys(self, request: dict) -> dict:
+        with self._keys_lock:
+            # Only asks gpg again when the keyring files changed
+            self.gpg.list_secret_keys()
+            keys = list(self.gpg.secret_keys)
+        return {"keys": [{"fingerprint": key[0], "uid": key[1]} for key in keys]}
+
+    def _count(self, op: str, ok: bool, wait_seconds: float, seconds: float) -> None:
+        with self._metrics_lock:
+            counter = self._operations.setdefault(
+                op, {"count": 0, "errors": 0, "wait_seconds": 0.0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            counter["count"] += 1
+            counter["errors"] += 0 if ok else 1
+            counter["wait_seconds"] += wait_seconds
+            counter["seconds"] += seconds
+            counter["max_seconds"] = max(counter["max_seconds"], seconds)
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            operations = {
+                op: {**counter, "avg_seconds": counter["seconds"] / counter["count"]}
+                for op, counter in self._operations.items()
+            }
+            return {
+                "uptime_seconds": time.time() - self._started,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "rejected": self._rejected,
+                "operations": operations,
+                "gpg": self.gpg.tracer.stats(),
+                "agent": self.gpg.agent.stats(),
+            }
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+            except OSError:
+                # Left behind by a daemon that did not shut down cleanly
+                os.unlink(self.socket_path)
+            else:
+                raise ValueError(f"serve_forever: A daemon is already listening on {self.socket_path}")
+
+        # Only the owner may connect: the daemon encrypts and decrypts with the owner's keys
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.gpg.lock()
+
+    def shutdown(self) -> None:
+        """Stop serve_forever from another thread"""
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class DaemonClient:
+    """Connection to a running GpgDaemon, requests are sent one at a time"""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.socket_path = socket_path or default_socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+        self._stream = self._sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def request(self, op: str, **fields) -> dict:
+        with self._lock:
+            write_frame(self._stream, {"op": op, **fields})
+            reply = read_frame(self._stream)
+        if reply is None:
+            raise ValueError(f"{op}: The daemon closed the connection")
+        if not reply.get("ok"):
+            raise GpgError(f"{op}: {reply.get('error')}", reply.get("reason"))
+        return reply
+
+    def encrypt(self, data: bytes, passphrase: Optional[str] = None, recipients=None) -> bytes:
+        reply = self.request(
+            "encrypt",
+            data=base64.b64encode(data).decode("ascii"),
+            passphrase=passphrase,
+            recipients=list(recipients or []),
+        )
+        return base64.b64decode(reply["data"])
+
+    def decrypt(self, data: bytes, passphrase: str) -> bytes:
+        reply = self.request("decrypt", data=base64.b64encode(data).decode("ascii"), passphrase=passphrase)
+        return base64.b64decode(reply["data"])
+
+    def list_keys(self) -> list:
+        return [(key["fingerprint"], key["uid"]) for key in self.request("list_keys")["keys"]]
+
+    def metrics(self) -> dict:
+        return self.request("metrics")["metrics"]
+
+    def close(self) -> None:
+        self._stream.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -1,24 +1,46 @@
+import json
 import os
-import re
+import time
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 
-from gpg_process import GpgProcess
+from backup_store import BackupStore
+from decrypt_cache import DecryptCache
+from gpg_process import KEY_ALGORITHMS, GpgProcess
+from gpg_status import ProgressEvent
+from gpg_worker import BackgroundExecutor
 from preferences import Preferences
+from search_index import SearchIndex
+from session_keys import SessionKeyCache
 
 # Set environment variable to suppress deprecation warning
 os.environ["TK_SILENCE_DEPRECATION"] = "1"
 
 VERSION = "2.0"
 
+# Reference point for the startup timings
+STARTUP_TIME = time.perf_counter()
+
+# Documents longer than this (in characters) are loaded into the viewer in chunks
+LARGE_DOCUMENT_THRESHOLD = 1_000_000
+LOAD_CHUNK_SIZE = 64 * 1024
+
 
 class GpgGui:
     def __init__(self, root):
         self.root = root
         self.root.title("GPG File Encryption/Decryption")
-        self.root.geometry("500x300+400+200")
+        self.root.geometry("500x400+400+200")
         self.save_to_new_file = tk.BooleanVar()
         self.new_passphrase = tk.BooleanVar()
+        self.executor = BackgroundExecutor(root)
+
+        # GPG discovery, key listing and preferences are loaded in the background once the window is shown
+        self.gpg_process = None
+        self.preferences = None
+        self.last_directory = None
+        self.backup_store = BackupStore()
+        self.startup_timings = {}
 
         # Set app icon
         icon_path = "GpgGui.png"
@@ -32,24 +54,10 @@ class GpgGui:
                 # Silently fail if icon loading fails
                 pass
 
-        try:
-            self.gpg_process = GpgProcess()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to initialize GPG process: {str(e)}")
-
         # Bring window to front and give it focus
         self.root.lift()
         self.root.focus_force()
 
-        # Initialize preferences and load settings
-        self.preferences = Preferences()
-        self.last_directory = self.preferences.load_last_directory()
-
-        # Load saved selected key
-        saved_key = self.preferences.get_selected_key()
-        if saved_key and saved_key in self.gpg_process.secret_keys:
-            self.gpg_process.selected_key = saved_key
-
         # Create main frame
         main_frame = tk.Frame(root, padx=20, pady=20)
         main_frame.pack(expand=True, fill="both")
@@ -62,25 +70,79 @@ class GpgGui:
         button_frame = tk.Frame(main_frame)
         button_frame.pack(pady=20)
 
-        tk.Button(
+        create_button = tk.Button(
             button_frame,
             text="Create & Encrypt",
             command=lambda: self.show_content_window(None, "New File Content"),
             relief="raised",
             borderwidth=2,
-        ).pack(side="left", padx=10)
-        tk.Button(
+        )
+        create_button.pack(side="left", padx=10)
+        decrypt_button = tk.Button(
             button_frame,
             text="Decrypt & View",
             command=self.decrypt,
             relief="raised",
             borderwidth=2,
-        ).pack(side="left", padx=10)
+        )
+        decrypt_button.pack(side="left", padx=10)
 
-        # Use private / public key toggle
+        # Actions on existing files of any type, and bulk actions on whole directories
+        bulk_frame = tk.Frame(main_frame)
+        bulk_frame.pack()
+
+        encrypt_file_button = tk.Button(
+            bulk_frame,
+            text="Encrypt File",
+            command=lambda: self.process_file("encrypt"),
+            relief="raised",
+            borderwidth=2,
+        )
+        encrypt_file_button.pack(side="left", padx=5)
+        decrypt_file_button = tk.Button(
+            bulk_frame,
+            text="Decrypt File",
+            command=lambda: self.process_file("decrypt"),
+            relief="raised",
+            borderwidth=2,
+        )
+        decrypt_file_button.pack(side="left", padx=5)
+        encrypt_folder_button = tk.Button(
+            bulk_frame,
+            text="Encrypt Folder",
+            command=lambda: self.process_folder("encrypt"),
+            relief="raised",
+            borderwidth=2,
+        )
+        encrypt_folder_button.pack(side="left", padx=5)
+        decrypt_folder_button = tk.Button(
+            bulk_frame,
+            text="Decrypt Folder",
+            command=lambda: self.process_folder("decrypt"),
+            relief="raised",
+            borderwidth=2,
+        )
+        decrypt_folder_button.pack(side="left", padx=5)
+
+        # Full-text search across a folder of encrypted documents
+        search_frame = tk.Frame(main_frame)
+        search_frame.pack(pady=5)
+        self.search_entry = tk.Entry(search_frame, width=30)
+        self.search_entry.pack(side="left", padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+        search_button = tk.Button(
+            search_frame,
+            text="Search",
+            command=self.search,
+            relief="raised",
+            borderwidth=2,
+        )
+        search_button.pack(side="left", padx=5)
+        # Vault directory -> SearchIndex, kept for the session so later searches only refresh it
+        self.search_indexes = {}
+
+        # Use private / public key toggle, the saved preference is applied once loaded
         self.use_key = tk.BooleanVar()
-        # Load saved preference for encryption method
-        self.use_key.set(self.preferences.get_use_key_encryption())
 
         def on_use_key_toggle():
             # Save preference when changed
@@ -89,12 +151,13 @@ class GpgGui:
                 # Show key selection dialog if no key is selected
                 self.manage_keys()
 
-        tk.Checkbutton(
+        use_key_toggle = tk.Checkbutton(
             main_frame,
             text="Use Key for Encryption",
             variable=self.use_key,
             command=on_use_key_toggle,
-        ).pack(pady=5)
+        )
+        use_key_toggle.pack(pady=5)
 
         # Manage Keys button (initially hidden)
         self.manage_keys_button = tk.Button(
@@ -118,73 +181,374 @@ class GpgGui:
         # Initial state
         update_manage_keys_button()
 
+        # Controls that need GPG stay disabled until the background loading is done
+        self.gpg_controls = [
+            create_button,
+            decrypt_button,
+            encrypt_file_button,
+            decrypt_file_button,
+            encrypt_folder_button,
+            decrypt_folder_button,
+            self.search_entry,
+            search_button,
+            use_key_toggle,
+            self.manage_keys_button,
+        ]
+        for control in self.gpg_controls:
+            control.config(state="disabled")
+
+        self.status_label = tk.Label(main_frame, text="Loading GPG keys...", fg="gray")
+        self.status_label.pack()
+
         # Close button
         close_button = tk.Button(
             main_frame,
             text="Close",
-            command=root.destroy,
+            command=self.close,
             relief="raised",
             borderwidth=2,
         )
         close_button.pack(pady=10)
 
-    def decrypt(self):
-        # Get input file
+        root.protocol("WM_DELETE_WINDOW", self.close)
+        root.after_idle(self.on_first_paint)
+
+    def on_first_paint(self):
+        self.startup_timings["first_paint"] = time.perf_counter() - STARTUP_TIME
+
+        def load():
+            preferences = Preferences()
+            preferences.load()
+            return preferences, GpgProcess()
+
+        self.executor.submit(load, self.on_gpg_ready, self.on_gpg_failed)
+
+    def on_gpg_ready(self, loaded):
+        self.preferences, self.gpg_process = loaded
+        self.last_directory = self.preferences.load_last_directory()
+        self.backup_store = BackupStore(**self.preferences.get_backup_retention())
+
+        # Recipients are only ever picked in the key dialog, their validity does not matter
+        self.gpg_process.trust_recipients = True
+        # Load saved recipient keys, skipping those no longer in the keyring
+        self.gpg_process.selected_keys = [
+            key for key in self.preferences.get_selected_keys() if key[0] in self.gpg_process.keys
+        ]
+
+        # Load saved preference for encryption method
+        self.use_key.set(self.preferences.get_use_key_encryption())
+
+        self.gpg_process.compression = self.preferences.get_compression()
+        self.gpg_process.crypto_profile = self.preferences.get_crypto_profile()
+        decrypt_cache = self.preferences.get_decrypt_cache()
+        if decrypt_cache is not None:
+            self.gpg_process.decrypt_cache = DecryptCache(**decrypt_cache)
+        if self.preferences.get_session_key_cache():
+            self.gpg_process.session_keys = SessionKeyCache()
+
+        # Pre-generate keys in the background if the user opted in
+        pool_algorithms = self.preferences.get_key_pool_algorithms()
+        if pool_algorithms:
+            self.gpg_process.enable_key_pool(pool_algorithms)
+
+        for control in self.gpg_controls:
+            control.config(state="normal")
+        self.status_label.config(text="")
+        self.startup_timings["keys_ready"] = time.perf_counter() - STARTUP_TIME
+        self.report_startup_timings()
+
+    def on_gpg_failed(self, e):
+        self.status_label.config(text="GPG is not available", fg="red")
+        messagebox.showerror("Error", f"Failed to initialize GPG process: {str(e)}")
+
+    def report_startup_timings(self):
+        """Print the cold-start timings as JSON when GPG_GUI_STARTUP_REPORT is set"""
+        if os.environ.get("GPG_GUI_STARTUP_REPORT"):
+            print(json.dumps({"version": VERSION, **self.startup_timings}))
+
+    def close(self):
+        # Do not leave unlocked keys behind in gpg-agent once the app is gone
+        if self.gpg_process:
+            try:
+                self.gpg_process.lock()
+            except Exception:
+                pass
+        if self.preferences:
+            try:
+                self.preferences.flush()
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save preferences: {str(e)}")
+        self.root.destroy()
+
+    def run_in_background(self, func, message, on_success, on_error=None):
+        """Run a blocking gpg operation on a worker thread behind a progress dialog with a Cancel button"""
+        # Remember which window had the grab so it can be restored once the operation is over
+        parent = self.root.grab_current() or self.root
+
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Please wait")
+        progress_window.geometry("320x130+490+320")
+        progress_window.transient(parent)
+        progress_window.grab_set()
+
+        status_label = tk.Label(progress_window, text=message)
+        status_label.pack(pady=10)
+        progress_bar = ttk.Progressbar(progress_window, mode="indeterminate", length=260)
+        progress_bar.pack(pady=5)
+        progress_bar.start(10)
+
+        cancelled = [False]
+        # Latest gpg PROGRESS event with a known total, set from gpg's status reader thread
+        latest_progress = [None]
+
+        def on_status(event):
+            if isinstance(event, ProgressEvent) and event.total:
+                latest_progress[0] = event
+
+        self.gpg_process.on_status = on_status
+
+        def show_progress():
+            event = latest_progress[0]
+            if event is not None and not cancelled[0]:
+                # The bar turns determinate once gpg reports how much there is to do
+                if str(progress_bar["mode"]) != "determinate":
+                    progress_bar.stop()
+                    progress_bar.config(mode="determinate", maximum=1.0)
+                progress_bar["value"] = event.fraction
+            poll_id[0] = progress_window.after(100, show_progress)
+
+        poll_id = [progress_window.after(100, show_progress)]
+
+        def on_cancel():
+            cancelled[0] = True
+            status_label.config(text="Cancelling...")
+            cancel_btn.config(state="disabled")
+            self.gpg_process.cancel()
+
+        cancel_btn = tk.Button(progress_window, text="Cancel", command=on_cancel, relief="raised", borderwidth=2)
+        cancel_btn.pack(pady=10)
+        progress_window.protocol("WM_DELETE_WINDOW", on_cancel)
+
+        def finish():
+            self.gpg_process.on_status = None
+            progress_window.after_cancel(poll_id[0])
+            progress_bar.stop()
+            progress_window.destroy()
+            if parent is not self.root and parent.winfo_exists():
+                parent.grab_set()
+
+        def success(result):
+            finish()
+            if not cancelled[0]:
+                on_success(result)
+
+        def error(e):
+            finish()
+            if cancelled[0]:
+                return
+            if on_error:
+                on_error(e)
+            else:
+                messagebox.showerror("Error", str(e))
+
+        self.executor.submit(func, success, error)
+
+    def decrypt(self, input_file=None, passphrase=None):
+        # Get input file, unless given (e.g. a search result)
         filetypes = [("GPG files", "*.gpg")]
 
-        input_file = filedialog.askopenfilename(title="Select file to decrypt", filetypes=filetypes)
+        if not input_file:
+            input_file = filedialog.askopenfilename(title="Select file to decrypt", filetypes=filetypes)
         if not input_file:
             return
         self.gpg_process.file_path = input_file
         # Get passphrase
-        passphrase = self.get_passphrase("decrypt")
+        if not passphrase:
+            passphrase = self.get_passphrase("decrypt")
         if not passphrase:
             return
         self.gpg_process.passphrase = passphrase
 
+        def on_decrypted(content):
+            if content:
+                self.show_content_window(content, f"Decrypted: {os.path.basename(input_file)}")
+            else:
+                messagebox.showerror("Error", "Could not get decryption content")
+
+        def on_error(e):
+            # Only a wrong passphrase is worth another try, other failures would fail again
+            if getattr(e, "reason", None) == "bad_passphrase":
+                if messagebox.askretrycancel("Error", str(e)):
+                    self.decrypt(input_file)
+            else:
+                messagebox.showerror("Error", str(e))
+
         # Process the file
-        try:
-            content = self.gpg_process.decrypt()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.run_in_background(self.gpg_process.decrypt, "Decrypting...", on_decrypted, on_error)
+
+    def process_file(self, action):
+        """Encrypt or decrypt an existing file (PDF, archive...) straight to another file"""
+        initial_dir = self.last_directory if self.last_directory else os.path.expanduser("~")
+        filetypes = [("GPG files", "*.gpg")] if action == "decrypt" else [("All files", "*")]
+        source_file = filedialog.askopenfilename(
+            title=f"Select file to {action}", initialdir=initial_dir, filetypes=filetypes
+        )
+        if not source_file:
             return
 
-        if content:
-            self.show_content_window(content, f"Decrypted: {os.path.basename(input_file)}")
+        if action == "encrypt":
+            default_output = source_file + ".gpg"
         else:
-            messagebox.showerror("Error", "Could not get decryption content")
+            default_output = source_file[: -len(".gpg")] if source_file.endswith(".gpg") else source_file + ".out"
+        output_file = filedialog.asksaveasfilename(
+            title="Select filename to save file",
+            initialdir=os.path.dirname(source_file),
+            initialfile=os.path.basename(default_output),
+        )
+        if not output_file:
+            return
+        # The backup would move the source away before gpg reads it
+        if os.path.exists(output_file) and os.path.samefile(output_file, source_file):
+            messagebox.showwarning("Warning", f"Please choose another file than the one to {action}")
+            return
+        self.preferences.save_last_directory(os.path.dirname(output_file))
 
-    def backup_existing_file(self, file_path):
-        """Backup existing file by adding timestamp to filename"""
-        if os.path.exists(file_path):
-            # Get file info
-            base_path = os.path.splitext(file_path)[0]
-            base_name = os.path.basename(base_path)
-            extension = os.path.splitext(file_path)[1]
+        use_key = action == "encrypt" and self.use_key.get()
+        if use_key and not self.gpg_process.selected_key:
+            messagebox.showwarning("Warning", "Please select a key first")
+            return
+        if not use_key:
+            passphrase = self.get_passphrase(action)
+            if not passphrase:
+                return
+            self.gpg_process.passphrase = passphrase
 
-            # Create timestamp
-            from datetime import datetime
+        backup_path = self.backup_existing_file(output_file)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        def operation():
+            if action == "encrypt":
+                return self.gpg_process.encrypt_file(source_file, output_file, use_key)
+            return self.gpg_process.decrypt_file(source_file, output_file)
 
-            # Create backup filename
-            backup_path = f"{base_path}_{timestamp}{extension}"
+        def on_done(_):
+            message = f"File {action}ed and saved as: {output_file}"
+            if backup_path:
+                backup_name = os.path.relpath(backup_path, os.path.dirname(output_file))
+                message += f"\n\nPrevious version backed up as: {backup_name}"
+            messagebox.showinfo("Success", message)
 
-            # clean up old backup files, deleting the ones with oldest timestamps
-            # but keep at least 2 backups
-            keep_backups = 2
-            pattern = re.compile(f"^{base_name}_(\\d{{8}})_(\\d{{6}}).*{extension}$")
+        self.run_in_background(operation, f"Processing file ({action})...", on_done)
 
-            backup_files = [f for f in os.listdir(os.path.dirname(file_path)) if pattern.match(f)]
-            backup_files.sort(key=lambda x: int(pattern.match(x).group(1) + pattern.match(x).group(2)))
-            for old_backup in backup_files[:-keep_backups]:
-                os.remove(os.path.join(os.path.dirname(file_path), old_backup))
+    def process_folder(self, action):
+        """Encrypt or decrypt every file of a directory tree in parallel"""
+        initial_dir = self.last_directory if self.last_directory else os.path.expanduser("~")
+        source_dir = filedialog.askdirectory(title=f"Select folder to {action}", initialdir=initial_dir)
+        if not source_dir:
+            return
 
-            # Rename existing file
-            os.rename(file_path, backup_path)
+        use_key = self.use_key.get()
+        if action == "encrypt" and use_key:
+            if not self.gpg_process.selected_key:
+                messagebox.showwarning("Warning", "Please select a key first")
+                return
+        else:
+            passphrase = self.get_passphrase(action)
+            if not passphrase:
+                return
+            self.gpg_process.passphrase = passphrase
 
-            return backup_path
-        return None
+        def operation():
+            if action == "encrypt":
+                return self.gpg_process.encrypt_many(source_dir, use_key=use_key)
+            return self.gpg_process.decrypt_many(source_dir)
+
+        def on_done(report):
+            message = (
+                f"{len(report.succeeded)} file(s) processed, {len(report.failed)} failed "
+                f"in {report.seconds:.1f}s ({report.bytes_per_second / 1e6:.2f} MB/s)"
+            )
+            # Only list a few failures, the folder may contain thousands of files
+            for failed in report.failed[:10]:
+                message += f"\n\n{os.path.relpath(failed.source, source_dir)}: {failed.error}"
+            if report.failed:
+                messagebox.showwarning("Completed with errors", message)
+            else:
+                messagebox.showinfo("Success", message)
+
+        self.run_in_background(operation, f"Processing folder ({action})...", on_done)
+
+    def search(self):
+        """Find the encrypted documents of a folder containing every word of the search box"""
+        query = self.search_entry.get().strip()
+        if not query:
+            messagebox.showwarning("Warning", "Please enter words to search for")
+            return
+        initial_dir = self.last_directory if self.last_directory else os.path.expanduser("~")
+        vault_dir = filedialog.askdirectory(title="Select folder to search", initialdir=initial_dir)
+        if not vault_dir:
+            return
+        use_key = self.use_key.get()
+        if use_key and not self.gpg_process.selected_key:
+            messagebox.showwarning("Warning", "Please select a key first")
+            return
+        passphrase = self.get_passphrase("search")
+        if not passphrase:
+            return
+        self.gpg_process.passphrase = passphrase
+
+        index = self.search_indexes.get(vault_dir)
+        if index is None or index.use_key != use_key:
+            index = self.search_indexes[vault_dir] = SearchIndex(self.gpg_process, vault_dir, use_key)
+
+        def run_search():
+            # Only documents added or changed since the last search are decrypted
+            stats = index.update()
+            return stats, index.search(query)
+
+        def on_error(e):
+            # A wrong passphrase must not leave a half-loaded index behind
+            self.search_indexes.pop(vault_dir, None)
+            messagebox.showerror("Error", str(e))
+
+        self.run_in_background(
+            run_search,
+            "Searching...",
+            lambda result: self.show_search_results(vault_dir, query, passphrase, *result),
+            on_error,
+        )
+
+    def show_search_results(self, vault_dir, query, passphrase, stats, results):
+        results_window = tk.Toplevel(self.root)
+        results_window.title(f"Search: {query}")
+        results_window.geometry("600x400")
+        results_window.transient(self.root)
+
+        frame = tk.Frame(results_window, padx=20, pady=20)
+        frame.pack(fill="both", expand=True)
+
+        summary = f"{len(results)} document(s) found among {stats['documents']}"
+        if stats["failed"]:
+            summary += f", {stats['failed']} could not be decrypted"
+        tk.Label(frame, text=summary).pack(anchor="w")
+
+        listbox = tk.Listbox(frame, width=70, height=15)
+        scrollbar = tk.Scrollbar(frame, orient="vertical", command=listbox.yview)
+        listbox.configure(yscrollcommand=scrollbar.set)
+        listbox.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        for name, score in results:
+            listbox.insert(tk.END, f"{name} ({score})")
+
+        def on_open(event=None):
+            selection = listbox.curselection()
+            if selection:
+                self.decrypt(os.path.join(vault_dir, results[selection[0]][0]), passphrase)
+
+        listbox.bind("<Double-Button-1>", on_open)
+
+    def backup_existing_file(self, file_path):
+        """Move an existing file into the backup store before it gets overwritten"""
+        return self.backup_store.backup(file_path)
 
     def show_content_window(self, content, title):
         """Show content in a text window with modify option"""
@@ -211,17 +575,20 @@ class GpgGui:
 
         # Label
         label_text = "Enter your content to encrypt:" if content is None else "Decrypted content:"
-        tk.Label(content_frame, text=label_text, font=("Arial", 12)).pack(pady=10)
+        content_label = tk.Label(content_frame, text=label_text, font=("Arial", 12))
+        content_label.pack(pady=10)
 
         # Text area (initially read-only)
         text_area = scrolledtext.ScrolledText(content_frame, wrap=tk.WORD, width=70, height=20, state="disabled")
         text_area.pack(expand=True, fill="both", pady=10)
 
-        # Enable temporarily to set content
-        text_area.config(state="normal")
-        if content is not None:
+        # Large documents are loaded in chunks once the window is shown (see below)
+        large_document = content is not None and len(content) > LARGE_DOCUMENT_THRESHOLD
+        if content is not None and not large_document:
+            # Enable temporarily to set content
+            text_area.config(state="normal")
             text_area.insert("1.0", content)
-        text_area.config(state="disabled")
+            text_area.config(state="disabled")
 
         # Button frame
         button_frame = tk.Frame(content_frame)
@@ -248,9 +615,8 @@ class GpgGui:
                 messagebox.showwarning("Warning", "Please enter some content to encrypt.")
                 return
 
-            # Use the new save method
-            if self.save_encrypted_content(modified_content):
-                content_window.destroy()
+            # The window is closed once the content has actually been saved
+            self.save_encrypted_content(modified_content, on_saved=content_window.destroy)
 
         def close_window():
             content_window.destroy()
@@ -303,6 +669,42 @@ class GpgGui:
 
         content_window.protocol("WM_DELETE_WINDOW", close_window)
 
+        if large_document:
+            # Editing a partially loaded document would save it truncated
+            modify_btn.config(state="disabled")
+
+            def on_progress(fraction):
+                content_label.config(text=f"{label_text} (loading {fraction:.0%})")
+
+            def on_loaded():
+                content_label.config(text=label_text)
+                modify_btn.config(state="normal")
+
+            self.load_text_incrementally(text_area, content, on_progress, on_loaded)
+
+    def load_text_incrementally(self, text_area, content, on_progress, on_done):
+        """Insert content chunk by chunk from the Tk loop, so the first screen shows immediately"""
+        position = [0]
+
+        def load_next():
+            # The window may have been closed while loading
+            if not text_area.winfo_exists():
+                return
+            start = position[0]
+            end = start + LOAD_CHUNK_SIZE
+            state = text_area.cget("state")
+            text_area.config(state="normal")
+            text_area.insert("end-1c", content[start:end])
+            text_area.config(state=state)
+            position[0] = end
+            if end < len(content):
+                on_progress(end / len(content))
+                text_area.after(1, load_next)
+            else:
+                on_done()
+
+        load_next()
+
     def get_passphrase(self, action):
         if action == "encrypt" and self.gpg_process.passphrase and not self.new_passphrase.get():
             return self.gpg_process.passphrase
@@ -398,7 +800,7 @@ class GpgGui:
         self.gpg_process.file_path = output_file
         return output_file
 
-    def save_encrypted_content(self, content):
+    def save_encrypted_content(self, content, on_saved=None):
         # Get output file
         output_file = self.get_output_file()
         if not output_file:
@@ -416,19 +818,22 @@ class GpgGui:
             self.gpg_process.passphrase = passphrase
 
         backup_path = self.backup_existing_file(output_file)
-        try:
-            if self.use_key.get():
-                self.gpg_process.encrypt_with_key(content)
-            else:
-                self.gpg_process.encrypt(content)
+        encrypt = self.gpg_process.encrypt_with_key if self.use_key.get() else self.gpg_process.encrypt
+
+        def on_encrypted(_):
             success_message = f"Content encrypted and saved as: {output_file}"
             if backup_path:
-                success_message += f"\n\nPrevious version backed up as: {os.path.basename(backup_path)}"
+                backup_name = os.path.relpath(backup_path, os.path.dirname(output_file))
+                success_message += f"\n\nPrevious version backed up as: {backup_name}"
             messagebox.showinfo("Success", success_message)
-            return True
-        except Exception as e:
+            if on_saved:
+                on_saved()
+
+        def on_error(e):
             messagebox.showerror("Error", f"Unexpected error: {str(e)}")
-            return False
+
+        self.run_in_background(lambda: encrypt(content), "Encrypting...", on_encrypted, on_error)
+        return True
 
 
     def manage_keys(self):
@@ -442,36 +847,54 @@ class GpgGui:
         frame = tk.Frame(key_window, padx=20, pady=20)
         frame.pack(fill="both", expand=True)
 
-        listbox = tk.Listbox(frame, width=70, height=15)
+        # Several keys can be selected: the file is then encrypted once for all of them
+        listbox = tk.Listbox(frame, width=70, height=15, selectmode=tk.EXTENDED)
         scrollbar = tk.Scrollbar(frame, orient="vertical", command=listbox.yview)
         listbox.configure(yscrollcommand=scrollbar.set)
 
         listbox.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
+        # Public keys (e.g. imported from correspondents) are recipients too
+        def key_label(key):
+            record = self.gpg_process.keys.get(key[0])
+            return f"{key[1]} ({key[0]})" + ("" if record and record.secret else " [public]")
+
+        def refresh_listbox():
+            listbox.delete(0, tk.END)
+            for key in self.gpg_process.public_keys:
+                listbox.insert(tk.END, key_label(key))
+
         # Populate listbox with keys
-        for i, key in enumerate(self.gpg_process.secret_keys):
-            listbox.insert(tk.END, f"{key[1]} ({key[0]})")
-            # Highlight currently selected key if any
-            if self.gpg_process.selected_key and key == self.gpg_process.selected_key:
+        for i, key in enumerate(self.gpg_process.public_keys):
+            listbox.insert(tk.END, key_label(key))
+            # Highlight currently selected keys if any
+            if key in self.gpg_process.selected_keys:
                 listbox.selection_set(i)
 
         def on_select():
             selection = listbox.curselection()
             if selection:
-                selected_key = self.gpg_process.secret_keys[selection[0]]
-                self.gpg_process.selected_key = selected_key
-                # Save selected key to preferences
-                self.preferences.set_selected_key(selected_key)
+                selected_keys = []
+                for index in selection:
+                    key = self.gpg_process.public_keys[index]
+                    # A key with several user IDs is listed once per user ID, keep one entry per key
+                    if key[0] not in (selected[0] for selected in selected_keys):
+                        selected_keys.append(key)
+                self.gpg_process.selected_keys = selected_keys
+                # Save selected keys to preferences
+                self.preferences.set_selected_keys(selected_keys)
                 key_window.destroy()
             else:
                 messagebox.showwarning("Warning", "Please first click a key to select")
 
         def on_delete():
             selection = listbox.curselection()
-            if selection:
+            if len(selection) > 1:
+                messagebox.showwarning("Warning", "Please select a single key to delete")
+            elif selection:
                 # Get the selected key info for confirmation
-                selected_key = self.gpg_process.secret_keys[selection[0]]
+                selected_key = self.gpg_process.public_keys[selection[0]]
                 key_info = f"{selected_key[1]} ({selected_key[0]})"
 
                 # Show confirmation dialog
@@ -479,19 +902,25 @@ class GpgGui:
                     "Confirm Deletion",
                     f"Are you sure you want to delete this key?\n\n{key_info}",
                 ):
-                    try:
-                        self.gpg_process.delete_key(selected_key[0])
-                        # Clear from preferences if this was the selected key
-                        if self.gpg_process.selected_key == selected_key:
-                            self.gpg_process.selected_key = None
-                            self.preferences.set_selected_key(None)
+
+                    def on_deleted(_):
+                        # Clear from preferences if this was a selected key
+                        selected_keys = [
+                            key for key in self.gpg_process.selected_keys if key[0] != selected_key[0]
+                        ]
+                        if selected_keys != self.gpg_process.selected_keys:
+                            self.gpg_process.selected_keys = selected_keys
+                            self.preferences.set_selected_keys(selected_keys)
                         messagebox.showinfo("Success", "Key deleted successfully")
                         # Refresh the listbox instead of closing
-                        listbox.delete(0, tk.END)
-                        for i, key in enumerate(self.gpg_process.secret_keys):
-                            listbox.insert(tk.END, f"{key[1]} ({key[0]})")
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to delete key: {str(e)}")
+                        refresh_listbox()
+
+                    self.run_in_background(
+                        lambda: self.gpg_process.delete_key(selected_key[0]),
+                        "Deleting key...",
+                        on_deleted,
+                        lambda e: messagebox.showerror("Error", f"Failed to delete key: {str(e)}"),
+                    )
             else:
                 messagebox.showwarning("Warning", "Please select a key to delete")
 
@@ -499,7 +928,7 @@ class GpgGui:
             # Create dialog for name and email
             create_window = tk.Toplevel(key_window)
             create_window.title("Create New GPG Key")
-            create_window.geometry("400x300")
+            create_window.geometry("400x360")
             create_window.transient(key_window)
             create_window.grab_set()
 
@@ -526,21 +955,33 @@ class GpgGui:
             passphrase_entry = tk.Entry(frame, textvariable=passphrase_var, show="", width=40)
             passphrase_entry.pack(pady=5, fill="x")
 
+            # Key algorithm, the elliptic curve keys are much faster to generate and use
+            tk.Label(frame, text="Key type:").pack(anchor="w")
+            algorithm_var = tk.StringVar(value=self.preferences.get_key_algorithm())
+            tk.OptionMenu(frame, algorithm_var, *KEY_ALGORITHMS).pack(anchor="w", pady=5)
+
             def create_key():
                 name = name_var.get().strip()
                 email = email_var.get().strip()
                 passphrase = passphrase_var.get().strip()
+                algorithm = algorithm_var.get()
                 if name and email and passphrase:
-                    try:
-                        self.gpg_process.create_key(email, name, passphrase)
-                        messagebox.showinfo("Success", "Key created successfully")
+                    self.preferences.set_key_algorithm(algorithm)
+
+                    def on_created(result):
+                        source = "taken from the key pool" if result["from_pool"] else "generated"
+                        details = f"{result['algorithm']} key {source} in {result['seconds']:.2f}s"
+                        messagebox.showinfo("Success", f"Key created successfully\n\n{details}")
                         create_window.destroy()
                         # Refresh the listbox instead of closing
-                        listbox.delete(0, tk.END)
-                        for i, key in enumerate(self.gpg_process.secret_keys):
-                            listbox.insert(tk.END, f"{key[1]} ({key[0]})")
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to create key: {str(e)}")
+                        refresh_listbox()
+
+                    self.run_in_background(
+                        lambda: self.gpg_process.create_key(email, name, passphrase, algorithm),
+                        "Generating key...",
+                        on_created,
+                        lambda e: messagebox.showerror("Error", f"Failed to create key: {str(e)}"),
+                    )
                 else:
                     messagebox.showwarning("Warning", "Please enter name, email and passphrase")
 
@@ -560,45 +1001,81 @@ class GpgGui:
             passphrase_entry.bind("<Return>", lambda e: create_key())
 
         def on_import():
-            # Get file to import
-            filetypes = [("GPG key files", "*.asc")]
-            import_file = filedialog.askopenfilename(title="Select key file to import", filetypes=filetypes)
-            if import_file:
+            # Get files to import, all of them go through a single gpg run
+            filetypes = [("GPG key files", "*.asc *.gpg *.key *.pgp"), ("All files", "*")]
+            import_files = filedialog.askopenfilenames(title="Select key files to import", filetypes=filetypes)
+            if import_files:
                 # Get passphrase for import
                 passphrase = self.get_passphrase("import")
                 if not passphrase:
                     return
 
-                try:
-                    self.gpg_process.import_key(import_file, passphrase)
-                    messagebox.showinfo("Success", "Key imported successfully")
+                def on_imported(report):
+                    message = report.summary()
+                    for result in report.failed[:10]:
+                        message += f"\n\n{result.fingerprint or 'Unknown key'}: {result.problem}"
+                    if report.results and not report.failed:
+                        messagebox.showinfo("Success", message)
+                    else:
+                        messagebox.showwarning("Completed with errors", message)
                     # Refresh the listbox
-                    listbox.delete(0, tk.END)
-                    for i, key in enumerate(self.gpg_process.secret_keys):
-                        listbox.insert(tk.END, f"{key[1]} ({key[0]})")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to import key: {str(e)}")
+                    refresh_listbox()
+
+                self.run_in_background(
+                    lambda: self.gpg_process.import_keys(import_files, passphrase),
+                    "Importing keys...",
+                    on_imported,
+                    lambda e: messagebox.showerror("Error", f"Failed to import keys: {str(e)}"),
+                )
 
         def on_export():
             selection = listbox.curselection()
             if selection:
-                selected_key = self.gpg_process.secret_keys[selection[0]]
-                filetypes = [("GPG key files", "*.asc")]
-                export_file = filedialog.asksaveasfilename(
-                    title="Save exported key as",
-                    filetypes=filetypes,
-                    defaultextension=".asc",
-                )
-                if export_file:
-                    # Prompt for passphrase
-                    passphrase = self.get_passphrase("export")
-                    if not passphrase:
+                # A key with several user IDs is listed once per user ID
+                fingerprints = list(dict.fromkeys(self.gpg_process.public_keys[index][0] for index in selection))
+                per_key = False
+                if len(fingerprints) > 1:
+                    per_key = messagebox.askyesnocancel(
+                        "Export keys",
+                        f"Export the {len(fingerprints)} keys into a single file?\n\n"
+                        "Choose No to save one file per key in a folder.",
+                    )
+                    if per_key is None:
                         return
-                    try:
-                        self.gpg_process.export_key(selected_key[0], export_file, passphrase)
-                        messagebox.showinfo("Success", f"Key exported successfully to {export_file}")
-                    except Exception as e:
-                        messagebox.showerror("Error", f"Failed to export key: {str(e)}")
+                    per_key = not per_key
+                if per_key:
+                    export_path = filedialog.askdirectory(title="Select folder for the exported keys")
+                else:
+                    filetypes = [("GPG key files", "*.asc")]
+                    export_path = filedialog.asksaveasfilename(
+                        title="Save exported keys as",
+                        filetypes=filetypes,
+                        defaultextension=".asc",
+                    )
+                if export_path:
+                    # Secret keys need their passphrase, a selection of public keys only exports those
+                    passphrase = None
+                    if any(self.gpg_process.keys.get(fingerprint).secret for fingerprint in fingerprints):
+                        passphrase = self.get_passphrase("export")
+                        if not passphrase:
+                            return
+
+                    def on_exported(report):
+                        message = f"{len(report.outputs)} key(s) exported to {export_path}"
+                        if report.missing:
+                            message += "\n\nNot exported:\n" + "\n".join(
+                                f"{fingerprint}: {report.problems[fingerprint]}" for fingerprint in report.missing
+                            )
+                            messagebox.showwarning("Completed with errors", message)
+                        else:
+                            messagebox.showinfo("Success", message)
+
+                    self.run_in_background(
+                        lambda: self.gpg_process.export_keys(fingerprints, export_path, passphrase, per_key),
+                        "Exporting keys...",
+                        on_exported,
+                        lambda e: messagebox.showerror("Error", f"Failed to export keys: {str(e)}"),
+                    )
             else:
                 messagebox.showwarning("Warning", "Please select a key to export")
 
@@ -0,0 +1,215 @@
+import re
+from typing import Iterable, List, Optional
+
+# Validity values of keys gpg will not use
+UNUSABLE_VALIDITY = ("i", "d", "r", "e", "n")
+EMAIL_PATTERN = re.compile(r"<([^<>]+)>\s*$")
+ESCAPE_PATTERN = re.compile(rb"\\x([0-9a-fA-F]{2})")
+
+
+def unescape(field: str) -> str:
+    """Undo the \\xNN escaping gpg applies to user IDs in --with-colons output"""
+    if "\\x" not in field:
+        return field
+    raw = ESCAPE_PATTERN.sub(lambda m: bytes([int(m.group(1), 16)]), field.encode("utf-8"))
+    return raw.decode("utf-8", errors="replace")
+
+
+def uid_email(uid: str) -> Optional[str]:
+    """Lower-cased email of a "Name <email>" user ID, or of a bare email user ID"""
+    match = EMAIL_PATTERN.search(uid)
+    if match:
+        return match.group(1).strip().lower()
+    return uid.strip().lower() if "@" in uid else None
+
+
+def _timestamp(field: str) -> Optional[int]:
+    return int(field) if field.isdigit() else None
+
+
+class SubkeyRecord:
+    __slots__ = (
+        "fingerprint",
+        "keyid",
+        "algorithm",
+        "length",
+        "curve",
+        "created",
+        "expires",
+        "validity",
+        "capabilities",
+        "keygrip",
+    )
+
+    def __init__(self, fields: list):
+        self.fingerprint = ""
+        self.keyid = fields[4]
+        self.algorithm = int(fields[3]) if fields[3].isdigit() else None
+        self.length = int(fields[2]) if fields[2].isdigit() else None
+        self.curve = fields[16] if len(fields) > 16 else ""
+        self.created = _timestamp(fields[5])
+        self.expires = _timestamp(fields[6])
+        self.validity = fields[1]
+        self.capabilities = fields[11]
+        self.keygrip = ""
+
+    @property
+    def usable(self) -> bool:
+        return self.validity not in UNUSABLE_VALIDITY
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.fingerprint or self.keyid} {self.capabilities}>"
+
+
+class KeyRecord(SubkeyRecord):
+    """A primary key of the keyring with its user IDs and subkeys
+
+    capabilities are gpg's: lower-case letters for the primary key itself, upper-case ones
+    for the key as a whole (e.g. "E" when any usable subkey can encrypt). validity is the
+    calculated validity and ownertrust the trust set by the user, as gpg's single letters.
+    """
+
+    __slots__ = ("ownertrust", "secret", "uids", "subkeys")
+
+    def __init__(self, fields: list):
+        super().__init__(fields)
+        self.ownertrust = fields[8]
+        # "+" in field 15 when the secret key is available (sec lines, or pub lines with --with-secret)
+        self.secret = fields[0] == "sec" or (len(fields) > 14 and fields[14] not in ("", "#"))
+        self.uids: List[str] = []
+        self.subkeys: List[SubkeyRecord] = []
+
+    @property
+    def uid(self) -> str:
+        return self.uids[0] if self.uids else ""
+
+    @property
+    def emails(self) -> List[str]:
+        return [email for email in map(uid_email, self.uids) if email]
+
+    @property
+    def can_encrypt(self) -> bool:
+        return "E" in self.capabilities and self.usable
+
+    def as_dict(self) -> dict:
+        record = {name: getattr(self, name) for name in SubkeyRecord.__slots__ + self.__slots__}
+        record["subkeys"] = [subkey.as_dict() for subkey in self.subkeys]
+        return record
+
+
+def parse_colons(output: str) -> List[KeyRecord]:
+    """Key records of a gpg --list-keys / --list-secret-keys --with-colons output"""
+    keys: List[KeyRecord] = []
+    # The record the next fpr/grp line belongs to
+    current = None
+    for line in output.splitlines():
+        fields = line.split(":")
+        kind = fields[0]
+        if kind in ("pub", "sec"):
+            current = KeyRecord(fields)
+            keys.append(current)
+        elif kind in ("sub", "ssb") and keys:
+            current = SubkeyRecord(fields)
+            keys[-1].subkeys.append(current)
+        elif kind == "fpr" and current is not None and not current.fingerprint:
+            current.fingerprint = fields[9]
+        elif kind == "grp" and current is not None and not current.keygrip:
+            current.keygrip = fields[9]
+        elif kind == "uid" and keys:
+            keys[-1].uids.append(unescape(fields[9]))
+    return [key for key in keys if key.fingerprint]
+
+
+class KeyRegistry:
+    """The keyring's keys, indexed by fingerprint, key ID (long and short, subkeys included) and email"""
+
+    def __init__(self, records: Iterable[KeyRecord] = ()):
+        self._by_fingerprint = {}
+        # Key ID -> fingerprints of the primary keys, short key IDs can collide
+        self._by_keyid = {}
+        self._by_email = {}
+        self._secret_keys = None
+        self._public_keys = None
+        self.update(records)
+
+    def update(self, records: Iterable[KeyRecord]) -> None:
+        """Add records, replacing those already known under the same fingerprint"""
+        for record in records:
+            old = self._by_fingerprint.get(record.fingerprint)
+            if old is not None:
+                self._unindex(old)
+            self._by_fingerprint[record.fingerprint] = record
+            for keyid in self._keyids(record):
+                self._by_keyid.setdefault(keyid, []).append(record.fingerprint)
+            for email in set(record.emails):
+                self._by_email.setdefault(email, []).append(record.fingerprint)
+        self._secret_keys = None
+        self._public_keys = None
+
+    def remove(self, fingerprint: str) -> None:
+        record = self._by_fingerprint.pop(fingerprint.upper(), None)
+        if record is not None:
+            self._unindex(record)
+            self._secret_keys = None
+            self._public_keys = None
+
+    @staticmethod
+    def _keyids(record: KeyRecord) -> set:
+        """Long and short key IDs of the key and of its subkeys"""
+        keyids = set()
+        for key in [record] + record.subkeys:
+            keyid = (key.keyid or key.fingerprint[-16:]).upper()
+            keyids.update((keyid, keyid[-8:]))
+        return keyids
+
+    def _unindex(self, record: KeyRecord) -> None:
+        for index, names in ((self._by_keyid, self._keyids(record)), (self._by_email, set(record.emails))):
+            for name in names:
+                fingerprints = index.get(name)
+                if fingerprints and record.fingerprint in fingerprints:
+                    fingerprints.remove(record.fingerprint)
+                    if not fingerprints:
+                        del index[name]
+
+    def get(self, fingerprint: str) -> Optional[KeyRecord]:
+        return self._by_fingerprint.get(fingerprint.upper())
+
+    def lookup(self, query: str) -> List[KeyRecord]:
+        """Keys matching a fingerprint, a long or short key ID (with or without 0x) or an email"""
+        query = query.strip()
+        if "@" in query:
+            fingerprints = self._by_email.get(uid_email(query) or "", [])
+        else:
+            name = query[2:] if query.lower().startswith("0x") else query
+            name = name.replace(" ", "").upper()
+            if name in self._by_fingerprint:
+                fingerprints = [name]
+            else:
+                fingerprints = self._by_keyid.get(name, [])
+        return [self._by_fingerprint[fingerprint] for fingerprint in dict.fromkeys(fingerprints)]
+
+    def secret_keys(self) -> list:
+        """(fingerprint, uid) per user ID of every secret key, the shape GpgProcess.secret_keys always had"""
+        if self._secret_keys is None:
+            self._secret_keys = [
+                (record.fingerprint, uid) for record in self if record.secret for uid in record.uids
+            ]
+        return self._secret_keys
+
+    def public_keys(self) -> list:
+        """(fingerprint, uid) per user ID of every key, those with a secret part included"""
+        if self._public_keys is None:
+            self._public_keys = [(record.fingerprint, uid) for record in self for uid in record.uids]
+        return self._public_keys
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint.upper() in self._by_fingerprint
+
+    def __iter__(self):
+        return iter(self._by_fingerprint.values())
+
+    def __len__(self) -> int:
+        return len(self._by_fingerprint)
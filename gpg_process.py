@@ -1,18 +1,266 @@
+import codecs
+import copy
+import functools
+import itertools
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional
 
+from gpg_agent import AgentSession
+from gpg_calibrate import preference_list, symmetric_args
+from gpg_keys import KeyRegistry, parse_colons
+from gpg_status import REASON_MESSAGES, GpgError, StatusEvent, StatusReader, failure_reason
+from gpg_trace import Tracer, redact_argv
 from install_gpg import install_gpg
+from key_pool import KeyPool
+
+# Size of the blocks exchanged with gpg through its stdin/stdout pipes
+CHUNK_SIZE = 64 * 1024
+
+# Key types offered by create_key, as gpg --gen-key parameters
+KEY_ALGORITHMS = {
+    "ed25519": (
+        "Key-Type: EDDSA\nKey-Curve: ed25519\nKey-Usage: cert sign\n"
+        "Subkey-Type: ECDH\nSubkey-Curve: cv25519\nSubkey-Usage: encrypt"
+    ),
+    "rsa2048": (
+        "Key-Type: RSA\nKey-Length: 2048\nKey-Usage: cert sign\n"
+        "Subkey-Type: RSA\nSubkey-Length: 2048\nSubkey-Usage: encrypt auth"
+    ),
+    "rsa3072": (
+        "Key-Type: RSA\nKey-Length: 3072\nKey-Usage: cert sign\n"
+        "Subkey-Type: RSA\nSubkey-Length: 3072\nSubkey-Usage: encrypt auth"
+    ),
+    "rsa4096": (
+        "Key-Type: RSA\nKey-Length: 4096\nKey-Usage: cert sign\n"
+        "Subkey-Type: RSA\nSubkey-Length: 4096\nSubkey-Usage: encrypt auth"
+    ),
+}
+DEFAULT_KEY_ALGORITHM = "ed25519"
+
+# Compression used by encryption: "auto" picks one per payload from a sample of its first bytes
+COMPRESSION_CHOICES = ("auto", "none", "zip", "zlib", "bzip2")
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+# Sample compressed by zlib to more than this fraction of its size: not worth compressing
+INCOMPRESSIBLE_RATIO = 0.9
+# Payloads compressing better than this, and large enough, get the highest zlib level
+HIGHLY_COMPRESSIBLE_RATIO = 0.3
+LARGE_PAYLOAD_SIZE = 1024 * 1024
+
+# Files of GNUPGHOME that change whenever a key is added to or removed from the keyring, or its trust changes
+KEYRING_FILES = ("pubring.kbx", "pubring.gpg", "secring.gpg", "private-keys-v1.d", "trustdb.gpg")
+
+# Files import_keys picks up when given a directory
+KEY_FILE_EXTENSIONS = (".asc", ".gpg", ".key", ".pgp")
+# IMPORT_RES fields, in gpg's order
+IMPORT_RES_FIELDS = (
+    "count",
+    "no_user_id",
+    "imported",
+    "imported_rsa",
+    "unchanged",
+    "new_user_ids",
+    "new_subkeys",
+    "new_signatures",
+    "new_revocations",
+    "secret_read",
+    "secret_imported",
+    "secret_unchanged",
+    "skipped_new_keys",
+    "not_imported",
+    "skipped_v3_keys",
+)
+# IMPORT_OK bits telling that the key, or part of it, was new to the keyring
+IMPORT_CHANGE_FLAGS = 1 | 2 | 4 | 8
+
+# IMPORT_PROBLEM reason codes
+IMPORT_PROBLEMS = {
+    "0": "no specific reason given",
+    "1": "invalid certificate",
+    "2": "issuer certificate missing",
+    "3": "certificate chain too long",
+    "4": "error storing certificate",
+}
+
+
+@dataclass
+class FileResult:
+    """Outcome of one file in a bulk operation"""
+
+    source: str
+    output: str
+    ok: bool
+    error: Optional[str] = None
+    seconds: float = 0.0
+    size: int = 0
+
+
+@dataclass
+class BulkReport:
+    """Per-file results and totals of encrypt_many/decrypt_many"""
+
+    results: List[FileResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> List[FileResult]:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> List[FileResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(r.size for r in self.succeeded)
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.succeeded) / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.total_bytes / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class KeyImportResult:
+    """One key of an import_keys run, from gpg's IMPORT_OK and IMPORT_PROBLEM status lines"""
+
+    fingerprint: str
+    # IMPORT_OK reason bits: 1 new key, 2 new user IDs, 4 new signatures, 8 new subkeys, 16 secret key
+    flags: int = 0
+    problem: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.problem is None
+
+    @property
+    def new(self) -> bool:
+        return bool(self.flags & 1)
+
+    @property
+    def secret(self) -> bool:
+        return bool(self.flags & 16)
+
+    @property
+    def unchanged(self) -> bool:
+        # A secret key imported again comes with flags 16 alone, a new one with 17
+        return self.ok and not self.flags & IMPORT_CHANGE_FLAGS
+
+
+@dataclass
+class KeyImportReport:
+    """Per-key results and gpg's IMPORT_RES totals of import_keys"""
+
+    files: List[str] = field(default_factory=list)
+    results: List[KeyImportResult] = field(default_factory=list)
+    counts: dict = field(default_factory=dict)
+    # Files without any OpenPGP data (gpg does not say which ones)
+    files_without_keys: int = 0
+    seconds: float = 0.0
+
+    @property
+    def imported(self) -> List[KeyImportResult]:
+        return [r for r in self.results if r.ok and not r.unchanged]
+
+    @property
+    def failed(self) -> List[KeyImportResult]:
+        return [r for r in self.results if not r.ok]
+
+    def summary(self) -> str:
+        changed = self.imported
+        parts = [
+            f"{len(changed)} key(s) imported or updated ({sum(r.new for r in changed)} new, "
+            f"{sum(r.secret for r in changed)} secret)",
+            f"{len(self.results) - len(changed) - len(self.failed)} unchanged",
+        ]
+        if self.failed:
+            parts.append(f"{len(self.failed)} rejected")
+        if self.files_without_keys:
+            parts.append(f"{self.files_without_keys} file(s) without keys")
+        return ", ".join(parts)
+
+
+@dataclass
+class KeyExportReport:
+    """Files written by export_keys and the requested keys gpg did not export, with the reason"""
+
+    outputs: dict = field(default_factory=dict)
+    missing: List[str] = field(default_factory=list)
+    # Fingerprint of every missing key -> why its gpg run did not export it
+    problems: dict = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+class _CancelScope:
+    """One top-level operation, flagged by cancel() while it runs"""
+
+    __slots__ = ("cancelled",)
+
+    def __init__(self):
+        self.cancelled = False
+
+
+def cancellable(method):
+    """Marks a top-level operation: cancel() stops the remaining gpg runs of the operations running at that time
+
+    Nested operations (import_key calling import_keys, ...) belong to the outer one. Operations
+    started after cancel(), on any thread, are not affected by it.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._cancel_scope() is not None:
+            return method(self, *args, **kwargs)
+        with self._in_cancel_scope():
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class GpgProcess:
-    def __init__(self, file_path=None, passphrase=None):
+    def __init__(self, file_path=None, passphrase=None, tracer: Optional[Tracer] = None, load_keys: bool = True):
+        """load_keys=False leaves the keys empty until list_secret_keys(), for tools that may not need them"""
         self.file_path = file_path
         self.passphrase = passphrase
+        # Every process launched on behalf of this instance is recorded here
+        self.tracer = tracer or Tracer()
         self.gpg_path = shutil.which("gpg")
-        self.list_secret_keys()
-        self.selected_key = None
+        self._children = set()
+        self._children_lock = threading.Lock()
+        # _CancelScope of the running top-level operations, and the one of each thread
+        self._cancel_scopes = set()
+        self._thread_scope = threading.local()
+        # Public and secret keys of the keyring, see gpg_keys
+        self.keys = KeyRegistry()
+        self._keyring_signature = None
+        # (fingerprint, email) of every recipient of key encryption
+        self.selected_keys = []
+        # Encrypt for the selected keys whatever their validity (--trust-model always). Only for
+        # recipients the user picked explicitly: batch gpg refuses imported keys nobody certified.
+        self.trust_recipients = False
+        self.key_pool = None
+        self.compression = "auto"
+        # Ranked algorithms measured by gpg_calibrate, None until the host has been calibrated
+        self.crypto_profile = None
+        # Compression picked for the last encryption, with the sampled ratio and estimated savings
+        self.last_compression = None
+        # Opt-in DecryptCache used by decrypt(), cleared by lock()
+        self.decrypt_cache = None
+        # Opt-in SessionKeyCache used by decrypt() and decrypt_file(), cleared by lock()
+        self.session_keys = None
+        # Called with every gpg_status event (PROGRESS...) of the gpg runs, on a reader thread
+        self.on_status: Optional[Callable[[StatusEvent], None]] = None
 
         if not self.gpg_path:
             if install_gpg():
@@ -20,189 +268,863 @@ class GpgProcess:
             if not self.gpg_path:
                 raise FileNotFoundError("GPG installation failed")
 
+        if load_keys:
+            self.list_secret_keys()
+        self.agent = AgentSession(tracer=self.tracer)
+
+    @cancellable
     def encrypt(self, content: str) -> None:
         if not self.file_path:
             raise ValueError("encrypt: File path is required")
         if not self.passphrase:
             raise ValueError("encrypt: Passphrase is required")
 
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
-
+        self._discard_cached(self.file_path)
         try:
-            # Encrypt the temporary file
-            subprocess.run(
-                [
-                    self.gpg_path,
-                    "--batch",
-                    "--symmetric",
-                    "--passphrase",
-                    self.passphrase,
-                    "--output",
-                    self.file_path,
-                    temp_path,
-                ],
-                check=True,
+            size = self._text_size(content)
+            compression = self._compression_args(self._text_sample(content), size)
+            # Feed the plaintext to gpg on stdin, gpg writes the ciphertext itself
+            self._run_piped(
+                self._symmetric_args() + compression + ["--yes", "--output", self.file_path],
+                self._iter_text(content),
+                size,
             )
-        except subprocess.CalledProcessError:
-            raise ValueError("encrypt: Failed to encrypt file")
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("encrypt: Failed to encrypt file", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"encrypt: Unexpected error: {str(e)}")
-        finally:
-            os.unlink(temp_path)
 
+    @cancellable
     def encrypt_with_key(self, content: str) -> None:
         if not self.file_path:
             raise ValueError("encrypt_with_key: File path is required")
         if not self.selected_key:
             raise ValueError("encrypt_with_key: No key selected")
 
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
-
+        self._discard_cached(self.file_path)
         try:
-            subprocess.run("echo reloadagent | gpg-connect-agent", shell=True, check=True)
-            # Encrypt the temporary file using the selected key
-            subprocess.run(
-                [
-                    self.gpg_path,
-                    "--batch",
-                    "--yes",
-                    "--recipient",
-                    self.selected_key[0],  # Use fingerprint as recipient
-                    "--output",
-                    self.file_path,
-                    "--encrypt",
-                    temp_path,
-                ],
-                check=True,
-            )
-        except subprocess.CalledProcessError:
-            raise ValueError("encrypt_with_key: Failed to encrypt file")
+            with self.agent.operation():
+                size = self._text_size(content)
+                compression = self._compression_args(self._text_sample(content), size)
+                # Encrypt stdin using the selected key
+                self._run_piped(
+                    self._recipient_args() + compression + ["--output", self.file_path],
+                    self._iter_text(content),
+                    size,
+                )
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("encrypt_with_key: Failed to encrypt file", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"encrypt_with_key: Unexpected error: {str(e)}")
-        finally:
-            os.unlink(temp_path)
 
+    @cancellable
     def decrypt(self) -> str:
         if not self.file_path:
             raise ValueError("decrypt: File path is required")
         if not self.passphrase:
             raise ValueError("decrypt: Passphrase is required")
 
-        # Create a temporary file for decryption
-        # "Named" option because GPG needs a file to write to
-        with tempfile.NamedTemporaryFile(mode="w+b", delete=False) as temp_file:
-            temp_path = temp_file.name
-        # Clear GPG agent cache to force passphrase prompt
+        # Unchanged file decrypted recently with this passphrase: no gpg run at all
+        cache_key = None
+        if self.decrypt_cache is not None:
+            cache_key = self.decrypt_cache.file_key(self.file_path)
+            content = self.decrypt_cache.get(cache_key, self.passphrase)
+            if content is not None:
+                return content
+
+        # Decode the plaintext incrementally as gpg writes it to stdout
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = []
         try:
-            subprocess.run("echo reloadagent | gpg-connect-agent", shell=True, check=True)
-            # Decrypt to temporary file
-            subprocess.run(
-                [
-                    self.gpg_path,
-                    "--batch",
-                    "--yes",
-                    "--pinentry-mode=loopback",  # Add this
-                    "--decrypt",
-                    "--passphrase",
-                    self.passphrase,
-                    "--output",
-                    temp_path,
-                    self.file_path,
-                ],
-                check=True,
-            )
-            with open(temp_path, "r", encoding="utf-8") as f:
-                content = f.read()
-        except subprocess.CalledProcessError:
-            raise ValueError("Failed to decrypt file (wrong passphrase?)")
+            # The agent session decides whether the passphrase cache must be cleared first
+            with self.agent.operation():
+                for chunk in self._decrypt_path_chunks(self.file_path, []):
+                    parts.append(decoder.decode(chunk))
+                parts.append(decoder.decode(b"", final=True))
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("decrypt: Failed to decrypt file", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"decrypt: Unexpected error: {str(e)}")
-        finally:
-            os.unlink(temp_path)
 
+        content = "".join(parts)
+        if self.decrypt_cache is not None:
+            self.decrypt_cache.put(cache_key, self.passphrase, content)
         return content
 
-    def list_secret_keys(self) -> None:
-        self.secret_keys = []
-        if not self.gpg_path:
-            raise ValueError("list_secret_keys: GPG path is required")
+    @cancellable
+    def encrypt_many(
+        self,
+        source_dir: str,
+        output_dir: Optional[str] = None,
+        use_key: bool = False,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int, FileResult], None]] = None,
+    ) -> BulkReport:
+        """Encrypt every file under source_dir to <name>.gpg, running up to `workers` gpg processes at once
+
+        Files keep their relative layout under output_dir (next to the source when omitted).
+        A failing file is reported in the result and does not stop the others.
+        """
+        if use_key and not self.selected_key:
+            raise ValueError("encrypt_many: No key selected")
+        if not use_key and not self.passphrase:
+            raise ValueError("encrypt_many: Passphrase is required")
+
+        jobs = [
+            (src, self._bulk_output_path(source_dir, output_dir, src, src + ".gpg"))
+            for src in self._walk_files(source_dir, lambda name: not name.endswith(".gpg"))
+        ]
+        return self._run_many(jobs, lambda src, dst: self._encrypt_path(src, dst, use_key), workers, progress)
+
+    @cancellable
+    def decrypt_many(
+        self,
+        source_dir: str,
+        output_dir: Optional[str] = None,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int, FileResult], None]] = None,
+    ) -> BulkReport:
+        """Decrypt every .gpg file under source_dir, see encrypt_many"""
+        if not self.passphrase:
+            raise ValueError("decrypt_many: Passphrase is required")
+
+        jobs = [
+            (src, self._bulk_output_path(source_dir, output_dir, src, src[: -len(".gpg")]))
+            for src in self._walk_files(source_dir, lambda name: name.endswith(".gpg"))
+        ]
+        with self.agent.operation():
+            return self._run_many(jobs, self._decrypt_path, workers, progress)
+
+    @staticmethod
+    def _walk_files(source_dir: str, wanted: Callable[[str], bool]) -> List[str]:
+        if not os.path.isdir(source_dir):
+            raise ValueError(f"Not a directory: {source_dir}")
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            # Skip hidden directories such as .git or backup stores
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            paths.extend(os.path.join(dirpath, name) for name in filenames if not name.startswith(".") and wanted(name))
+        return sorted(paths)
+
+    @staticmethod
+    def _bulk_output_path(source_dir: str, output_dir: Optional[str], src: str, default: str) -> str:
+        if not output_dir:
+            return default
+        return os.path.join(output_dir, os.path.relpath(default, source_dir))
+
+    def _run_many(self, jobs: list, func: Callable[[str, str], None], workers, progress) -> BulkReport:
+        # Imported here: concurrent.futures pulls in logging, which slows down the command-line start-up
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = workers or os.cpu_count() or 1
+        done = [0]
+        done_lock = threading.Lock()
+        scope = self._cancel_scope()
+
+        def run_job(job) -> FileResult:
+            src, dst = job
+            result = FileResult(source=src, output=dst, ok=False)
+            start = time.perf_counter()
+            try:
+                # The jobs belong to the operation that started them, cancel() stops them all
+                with self._in_cancel_scope(scope):
+                    self._check_cancelled()
+                    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                    func(src, dst)
+                result.ok = True
+                result.size = os.path.getsize(src)
+            except subprocess.CalledProcessError as e:
+                reason = failure_reason(getattr(e, "status_events", []))
+                if reason:
+                    result.error = REASON_MESSAGES[reason]
+                else:
+                    # str(e) would show the whole command line, --passphrase value included
+                    fallback = str(subprocess.CalledProcessError(e.returncode, redact_argv(e.cmd)))
+                    result.error = (e.stderr or b"").decode("utf-8", errors="replace").strip() or fallback
+            except Exception as e:
+                result.error = str(e)
+            result.seconds = time.perf_counter() - start
+            if progress:
+                with done_lock:
+                    done[0] += 1
+                    progress(done[0], len(jobs), result)
+            return result
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_job, jobs))
+        return BulkReport(results=results, seconds=time.perf_counter() - start)
+
+    def _encrypt_path(self, src: str, dst: str, use_key: bool) -> None:
+        args = self._recipient_args() if use_key else self._symmetric_args() + ["--yes"]
+        with open(src, "rb") as f:
+            sample = f.read(COMPRESSION_SAMPLE_SIZE)
+        compression = self._compression_args(sample, os.path.getsize(src))
+        self._run_piped(args + compression + ["--output", dst, src], None)
 
+    def _decrypt_path(self, src: str, dst: str) -> None:
+        for _ in self._decrypt_path_chunks(src, ["--output", dst]):
+            pass
+
+    def _decrypt_path_chunks(self, src: str, output_args: list) -> Iterator[bytes]:
+        """Decrypt a file with gpg, yielding stdout, through its cached session key when there is one"""
+        cache = self.session_keys
+        if cache is None:
+            yield from self._stream_piped(self._decrypt_args() + output_args + [src], None)
+            return
+
+        key = cache.file_key(src)
+        session_key = cache.get(key, self.passphrase)
+        if session_key is not None:
+            produced = False
+            try:
+                # gpg reads the session key on stdin and skips the passphrase S2K entirely
+                args = [self.gpg_path, "--batch", "--yes", "--override-session-key-fd", "0", "--decrypt"]
+                for chunk in self._stream_piped(args + output_args + [src], [memoryview(session_key), b"\n"]):
+                    produced = True
+                    yield chunk
+                return
+            except subprocess.CalledProcessError:
+                # The file was replaced without its mtime or size changing: forget the key, use the passphrase
+                cache.discard(src)
+                if produced:
+                    raise
+            finally:
+                cache.release(session_key)
+
+        events = []
+        args = self._decrypt_args() + ["--show-session-key"] + output_args + [src]
+        yield from self._stream_piped(args, None, events=events)
+        for event in events:
+            if event.keyword == "SESSION_KEY" and event.args:
+                cache.put(key, self.passphrase, event.args[0])
+
+    def clone(self, **attributes) -> "GpgProcess":
+        """Shallow copy sharing the keys, agent session and tracer, with its own passphrase, recipients, etc.
+
+        Lets concurrent callers use one warm instance without overwriting each other's settings.
+        """
+        other = copy.copy(self)
+        for name, value in attributes.items():
+            if not hasattr(self, name):
+                raise ValueError(f"clone: Unknown attribute {name}")
+            setattr(other, name, value)
+        return other
+
+    def lock(self) -> None:
+        """Forget unlocked keys and cached passphrases in gpg-agent, decrypted documents and session keys"""
+        if self.decrypt_cache is not None:
+            self.decrypt_cache.clear()
+        if self.session_keys is not None:
+            self.session_keys.clear()
         try:
-            result = subprocess.run(
-                [
-                    self.gpg_path,
-                    "--list-secret-keys",
-                    "--with-colons",
-                ],
-                check=True,
-                capture_output=True,
-                text=True,
+            self.agent.lock_now()
+        except Exception as e:
+            raise ValueError(f"lock: Failed to clear agent cache: {str(e)}")
+
+    def _discard_cached(self, path: str) -> None:
+        """Drop what the caches hold for a file that is about to be overwritten"""
+        if self.decrypt_cache is not None:
+            self.decrypt_cache.discard(path)
+        if self.session_keys is not None:
+            self.session_keys.discard(path)
+
+    @cancellable
+    def encrypt_file(self, src: str, dst: Optional[str] = None, use_key: bool = False) -> str:
+        """Encrypt a file of any type and size to dst (src + ".gpg" by default), gpg reads it directly"""
+        if use_key and not self.selected_key:
+            raise ValueError("encrypt_file: No key selected")
+        if not use_key and not self.passphrase:
+            raise ValueError("encrypt_file: Passphrase is required")
+        dst = dst or src + ".gpg"
+
+        try:
+            self._encrypt_path(src, dst, use_key)
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("encrypt_file: Failed to encrypt file", e)
+        except GpgError:
+            raise
+        except Exception as e:
+            raise ValueError(f"encrypt_file: Unexpected error: {str(e)}")
+        return dst
+
+    @cancellable
+    def decrypt_file(self, src: str, dst: Optional[str] = None) -> str:
+        """Decrypt src to dst (src without ".gpg" by default) without loading the plaintext in memory"""
+        if not self.passphrase:
+            raise ValueError("decrypt_file: Passphrase is required")
+        if not dst:
+            dst = src[: -len(".gpg")] if src.endswith(".gpg") else src + ".out"
+
+        try:
+            with self.agent.operation():
+                self._decrypt_path(src, dst)
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("decrypt_file: Failed to decrypt file", e)
+        except GpgError:
+            raise
+        except Exception as e:
+            raise ValueError(f"decrypt_file: Unexpected error: {str(e)}")
+        return dst
+
+    def encrypt_stream(
+        self, chunks: Iterable[bytes], use_key: bool = False, size_hint: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """Encrypt an iterable of plaintext chunks, returns an iterator of ciphertext chunks
+
+        Checks the settings right away, gpg runs as the iterator is consumed. size_hint, the total
+        size when known, gives the PROGRESS events a total.
+        """
+        if use_key and not self.selected_key:
+            raise ValueError("encrypt_stream: No key selected")
+        if not use_key and not self.passphrase:
+            raise ValueError("encrypt_stream: Passphrase is required")
+
+        args = self._recipient_args() if use_key else self._symmetric_args()
+        return self._encrypt_stream(args, chunks, size_hint, self._cancel_scope())
+
+    def _encrypt_stream(
+        self, args: list, chunks: Iterable[bytes], size_hint: Optional[int], scope: Optional[_CancelScope]
+    ) -> Iterator[bytes]:
+        with self._registered_scope(scope) as scope:
+            # Read ahead enough of the stream to sample it, then hand gpg the sample followed by the rest
+            chunks = iter(chunks)
+            head = []
+            head_size = 0
+            for chunk in chunks:
+                head.append(bytes(chunk))
+                head_size += len(chunk)
+                if head_size >= COMPRESSION_SAMPLE_SIZE:
+                    break
+            sample = b"".join(head)
+            args = args + self._compression_args(sample[:COMPRESSION_SAMPLE_SIZE], None)
+            try:
+                with self.agent.operation():
+                    yield from self._stream_piped(args, itertools.chain([sample], chunks), size_hint, scope=scope)
+            except subprocess.CalledProcessError as e:
+                raise self._gpg_error("encrypt_stream: Failed to encrypt data", e)
+
+    def decrypt_stream(self, chunks: Iterable[bytes], size_hint: Optional[int] = None) -> Iterator[bytes]:
+        """Decrypt an iterable of ciphertext chunks, returns an iterator of plaintext chunks
+
+        Checks the settings right away, gpg runs as the iterator is consumed.
+        """
+        if not self.passphrase:
+            raise ValueError("decrypt_stream: Passphrase is required")
+
+        return self._decrypt_stream(self._decrypt_args(), chunks, size_hint, self._cancel_scope())
+
+    def _decrypt_stream(
+        self, args: list, chunks: Iterable[bytes], size_hint: Optional[int], scope: Optional[_CancelScope]
+    ) -> Iterator[bytes]:
+        with self._registered_scope(scope) as scope:
+            try:
+                # The agent session decides whether the passphrase cache must be cleared first
+                with self.agent.operation():
+                    yield from self._stream_piped(args, chunks, size_hint, scope=scope)
+            except subprocess.CalledProcessError as e:
+                raise self._gpg_error("decrypt_stream: Failed to decrypt data", e)
+
+    @cancellable
+    def encrypt_bytes(self, data: bytes, use_key: bool = False) -> bytes:
+        return b"".join(self.encrypt_stream(self._iter_bytes(data), use_key, len(data)))
+
+    @cancellable
+    def decrypt_bytes(self, data: bytes) -> bytes:
+        return b"".join(self.decrypt_stream(self._iter_bytes(data), len(data)))
+
+    @staticmethod
+    def _text_sample(content: str) -> bytes:
+        return content[:COMPRESSION_SAMPLE_SIZE].encode("utf-8")[:COMPRESSION_SAMPLE_SIZE]
+
+    def _compression_args(self, sample: bytes, total_size: Optional[int]) -> list:
+        """--compress-algo/-z arguments for a payload starting with sample, also stored in last_compression"""
+        choice = {"mode": self.compression, "sample_ratio": None, "sample_seconds": 0.0}
+        if self.compression != "auto":
+            algo = self.compression
+            level = 0 if algo == "none" else 6
+        elif not sample:
+            algo, level = "none", 0
+        else:
+            start = time.perf_counter()
+            # A fast zlib pass on the sample is a good estimate of how the whole payload compresses
+            ratio = len(zlib.compress(sample, 1)) / len(sample)
+            sample_seconds = time.perf_counter() - start
+            choice.update(sample_ratio=ratio, sample_seconds=sample_seconds)
+            if ratio > INCOMPRESSIBLE_RATIO:
+                # Archives, images, ciphertext: compressing only burns CPU
+                algo, level = "none", 0
+            elif ratio < HIGHLY_COMPRESSIBLE_RATIO and (total_size or 0) >= LARGE_PAYLOAD_SIZE:
+                algo, level = "zlib", 9
+            else:
+                algo, level = "zlib", 6
+            if total_size:
+                choice["estimated_size"] = int(total_size * (ratio if algo != "none" else 1.0))
+                if algo == "none":
+                    # Time gpg would have spent compressing the payload at its default level
+                    choice["estimated_seconds_saved"] = sample_seconds * total_size / len(sample)
+                else:
+                    choice["estimated_bytes_saved"] = int(total_size * (1 - ratio))
+        choice.update(algo=algo, level=level, size=total_size)
+        self.last_compression = choice
+
+        if algo == "none":
+            return ["--compress-algo", "none", "-z", "0"]
+        return ["--compress-algo", algo, "-z", str(level)]
+
+    def key_preferences(self) -> str:
+        """Cipher, digest and compression preferences of new keys, fastest secure ones first"""
+        return preference_list(self.crypto_profile)
+
+    def _symmetric_args(self) -> list:
+        return [
+            self.gpg_path,
+            "--batch",
+            "--symmetric",
+            *symmetric_args(self.crypto_profile),
+            "--passphrase",
+            self.passphrase,
+        ]
+
+    @property
+    def selected_key(self) -> Optional[tuple]:
+        """First of selected_keys, for callers that only deal with a single recipient"""
+        return self.selected_keys[0] if self.selected_keys else None
+
+    @selected_key.setter
+    def selected_key(self, key: Optional[tuple]) -> None:
+        self.selected_keys = [key] if key else []
+
+    def _recipient_args(self) -> list:
+        # One --recipient per key: gpg encrypts the data once and wraps its session key for each of them
+        recipients = []
+        for fingerprint in dict.fromkeys(key[0] for key in self.selected_keys):
+            recipients += ["--recipient", fingerprint]  # Use fingerprint as recipient
+        if self.trust_recipients:
+            recipients += ["--trust-model", "always"]
+        return [self.gpg_path, "--batch", "--yes", *recipients, "--encrypt"]
+
+    def _decrypt_args(self) -> list:
+        return [
+            self.gpg_path,
+            "--batch",
+            "--yes",
+            "--pinentry-mode=loopback",
+            "--decrypt",
+            "--passphrase",
+            self.passphrase,
+        ]
+
+    @staticmethod
+    def _iter_bytes(data: bytes) -> Iterator[bytes]:
+        view = memoryview(data)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start : start + CHUNK_SIZE]
+
+    @staticmethod
+    def _text_size(content: str) -> int:
+        """UTF-8 size of content, what gpg reads from _iter_text"""
+        if content.isascii():
+            return len(content)
+        return sum(len(chunk) for chunk in GpgProcess._iter_text(content))
+
+    @staticmethod
+    def _iter_text(content: str) -> Iterator[bytes]:
+        # Encode slice by slice so the whole payload is never duplicated as bytes
+        for start in range(0, len(content), CHUNK_SIZE):
+            yield content[start : start + CHUNK_SIZE].encode("utf-8")
+
+    @staticmethod
+    def iter_file(path: str) -> Iterator[bytes]:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def _run_piped(self, args: list, chunks: Optional[Iterable[bytes]], size_hint: Optional[int] = None) -> None:
+        """Run gpg feeding chunks on stdin, for commands that write their output to a file"""
+        for _ in self._stream_piped(args, chunks, size_hint):
+            pass
+
+    def _stream_piped(
+        self,
+        args: list,
+        chunks: Optional[Iterable[bytes]],
+        size_hint: Optional[int] = None,
+        events: Optional[list] = None,
+        scope: Optional[_CancelScope] = None,
+    ) -> Iterator[bytes]:
+        """Run gpg with chunks on stdin and yield stdout in CHUNK_SIZE blocks
+
+        stdin is fed and stderr drained from helper threads so that neither pipe
+        can fill up and deadlock the child while we read stdout. The status events
+        of the run are appended to `events` when given. scope, the operation the run belongs to,
+        defaults to the one of the current thread.
+        Raises subprocess.CalledProcessError if gpg exits with a non-zero code.
+        """
+        self._check_cancelled(scope)
+        operation = self._caller_operation()
+        started, start = time.time(), time.perf_counter()
+        status = self._status_reader(args)
+        try:
+            proc = subprocess.Popen(
+                status.command(args, size_hint) if status else args,
+                stdin=subprocess.PIPE if chunks is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=status.pass_fds if status else (),
             )
-            if result.returncode != 0:
-                raise ValueError(f"list_secret_keys: Failed to list secret keys: {result.stderr}")
-
-            # Parse the output
-            keys: list[tuple[str, str]] = []
-            lines = result.stdout.splitlines()
-            l_ind = 0
-            new_key = False
-            while l_ind < len(lines):
-                line = lines[l_ind]
-                if line.startswith("sec"):
-                    new_key = True
-                    fingerprint = ""
-                    email = ""
-                elif line.startswith("fpr") and new_key:
-                    fingerprint = line.split(":")[9]
-                elif line.startswith("uid") and new_key:
-                    email = line.split(":")[9]
-                elif line.startswith("ssb"):
-                    new_key = False
-
-                if fingerprint and email and new_key:
-                    keys.append((fingerprint, email))
-                l_ind += 1
-            self.secret_keys = keys
+        except BaseException:
+            if status:
+                status.close()
+            raise
+        if status:
+            status.start()
+        self._register_child(proc)
+        stderr_parts = []
+        writer_error = []
+        bytes_in = [0]
+        bytes_out = 0
 
-        except subprocess.CalledProcessError:
-            raise ValueError("list_secret_keys: Failed to list secret keys")
+        def feed():
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    bytes_in[0] += len(chunk)
+            except BrokenPipeError:
+                # gpg stopped reading, its exit code tells what happened
+                pass
+            except Exception as e:
+                writer_error.append(e)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        threads = [threading.Thread(target=lambda: stderr_parts.append(proc.stderr.read()), daemon=True)]
+        if chunks is not None:
+            threads.append(threading.Thread(target=feed, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        finished = False
+        try:
+            while True:
+                chunk = proc.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                bytes_out += len(chunk)
+                yield chunk
+            finished = True
+        finally:
+            if not finished and proc.poll() is None:
+                # The consumer stopped early, do not leave gpg running
+                proc.kill()
+            proc.stdout.close()
+            for thread in threads:
+                thread.join()
+            proc.wait()
+            if status:
+                status.close()
+            self._unregister_child(proc)
+            self._trace(operation, args, started, start, bytes_in[0], bytes_out, proc.returncode)
+
+        if events is not None and status:
+            events.extend(status.events)
+        if writer_error:
+            raise writer_error[0]
+        if proc.returncode != 0:
+            self._check_cancelled(scope)
+            error = subprocess.CalledProcessError(proc.returncode, args, stderr=b"".join(stderr_parts))
+            error.status_events = status.events if status else []
+            raise error
+
+    def _run(
+        self,
+        args: list,
+        input=None,
+        stdout=None,
+        capture_output: bool = False,
+        text: bool = False,
+    ) -> subprocess.CompletedProcess:
+        """subprocess.run(check=True) equivalent that keeps track of the child so cancel() can kill it"""
+        self._check_cancelled()
+        operation = self._caller_operation()
+        started, start = time.time(), time.perf_counter()
+        status = self._status_reader(args)
+        try:
+            proc = subprocess.Popen(
+                status.command(args) if status else args,
+                stdin=subprocess.PIPE if input is not None else None,
+                stdout=subprocess.PIPE if capture_output else stdout,
+                stderr=subprocess.PIPE if capture_output else None,
+                text=text,
+                pass_fds=status.pass_fds if status else (),
+            )
+        except BaseException:
+            if status:
+                status.close()
+            raise
+        if status:
+            status.start()
+        self._register_child(proc)
+        try:
+            out, err = proc.communicate(input)
+        finally:
+            if status:
+                status.close()
+            self._unregister_child(proc)
+            self._trace(
+                operation,
+                args,
+                started,
+                start,
+                len(input) if input is not None else 0,
+                len(out) if capture_output and out else 0,
+                proc.returncode,
+            )
+        if proc.returncode != 0:
+            self._check_cancelled()
+            error = subprocess.CalledProcessError(proc.returncode, args, out, err)
+            error.status_events = status.events if status else []
+            raise error
+        result = subprocess.CompletedProcess(args, proc.returncode, out, err)
+        result.status_events = status.events if status else []
+        return result
+
+    def _status_reader(self, args: list) -> Optional[StatusReader]:
+        """StatusReader for a gpg run, None for other programs and runs reading --status-fd themselves"""
+        if args[0] != self.gpg_path or "--status-fd" in args:
+            return None
+        return StatusReader(self.on_status)
+
+    @staticmethod
+    def _gpg_error(message: str, error: subprocess.CalledProcessError) -> GpgError:
+        """GpgError for a failed gpg run, naming the cause when its status lines tell it"""
+        return GpgError.from_status(message, getattr(error, "status_events", []))
+
+    def _caller_operation(self) -> str:
+        """Name of the GpgProcess method that launched the process
+
+        The outermost public method on the stack wins, otherwise the outermost helper (bulk worker threads).
+        """
+        frame = sys._getframe(2)
+        helper = None
+        while frame is not None:
+            name = frame.f_code.co_name
+            if frame.f_locals.get("self") is self and callable(getattr(type(self), name, None)):
+                if not name.startswith("_"):
+                    return name
+                helper = name.lstrip("_")
+            frame = frame.f_back
+        return helper or "unknown"
+
+    def _trace(self, operation, args, started, start, bytes_in, bytes_out, returncode) -> None:
+        # Count the files gpg reads and writes itself, the pipes only carry part of the traffic
+        output = None
+        if "--output" in args:
+            output = args[args.index("--output") + 1]
+            if output != "-" and os.path.isfile(output):
+                bytes_out += os.path.getsize(output)
+        last = str(args[-1])
+        if last != output and not last.startswith("-") and os.path.isfile(last):
+            bytes_in += os.path.getsize(last)
+        seconds = time.perf_counter() - start
+        self.tracer.record(operation, args, started, seconds, bytes_in, bytes_out, returncode)
+
+    def _register_child(self, proc: subprocess.Popen) -> None:
+        with self._children_lock:
+            self._children.add(proc)
+
+    def _unregister_child(self, proc: subprocess.Popen) -> None:
+        with self._children_lock:
+            self._children.discard(proc)
+
+    def _cancel_scope(self) -> Optional[_CancelScope]:
+        return getattr(self._thread_scope, "scope", None)
+
+    @contextmanager
+    def _registered_scope(self, scope: Optional[_CancelScope] = None):
+        """scope, or a new top-level operation that cancel() reaches until the block ends"""
+        if scope is not None:
+            yield scope
+            return
+        scope = _CancelScope()
+        with self._children_lock:
+            self._cancel_scopes.add(scope)
+        try:
+            yield scope
+        finally:
+            with self._children_lock:
+                self._cancel_scopes.discard(scope)
+
+    @contextmanager
+    def _in_cancel_scope(self, scope: Optional[_CancelScope] = None):
+        """Run the block on this thread as part of scope, or of a new top-level operation when None
+
+        Worker threads pass the scope of the operation that started them.
+        """
+        with self._registered_scope(scope) as scope:
+            previous = self._cancel_scope()
+            self._thread_scope.scope = scope
+            try:
+                yield scope
+            finally:
+                self._thread_scope.scope = previous
+
+    def _check_cancelled(self, scope: Optional[_CancelScope] = None) -> None:
+        scope = scope or self._cancel_scope()
+        if scope is not None and scope.cancelled:
+            raise GpgError(REASON_MESSAGES["cancelled"], "cancelled")
+
+    def cancel(self) -> None:
+        """Kill every gpg child currently running and stop the running operations from starting new ones
+
+        The interrupted operations raise ValueError (GpgError with reason "cancelled" when they
+        were about to start another gpg run).
+        """
+        with self._children_lock:
+            for scope in self._cancel_scopes:
+                scope.cancelled = True
+            children = list(self._children)
+        for proc in children:
+            if proc.poll() is None:
+                proc.kill()
+
+    @property
+    def secret_keys(self) -> list:
+        """(fingerprint, uid) per user ID of every secret key"""
+        return self.keys.secret_keys()
+
+    @property
+    def public_keys(self) -> list:
+        """(fingerprint, uid) per user ID of every key, the possible recipients of key encryption"""
+        return self.keys.public_keys()
+
+    @cancellable
+    def list_secret_keys(self, force: bool = False) -> None:
+        """Load the keyring (public and secret keys), reusing it while the keyring files are unchanged"""
+        if not self.gpg_path:
+            raise ValueError("list_secret_keys: GPG path is required")
+
+        state = self._keyring_state()
+        if not force and self._keyring_signature is not None and state == self._keyring_signature:
+            return
+
+        try:
+            self.keys = KeyRegistry(self._query_keys())
+            self._keyring_signature = state
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("list_secret_keys: Failed to list secret keys", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"list_secret_keys: Unexpected error: {str(e)}")
 
+    def _gnupg_home(self) -> str:
+        return os.environ.get("GNUPGHOME") or os.path.expanduser("~/.gnupg")
+
+    def _keyring_state(self) -> tuple:
+        """mtime/size of the keyring files, any key added or removed changes at least one of them"""
+        home = self._gnupg_home()
+        state = []
+        for name in KEYRING_FILES:
+            try:
+                st = os.stat(os.path.join(home, name))
+                state.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                state.append((name, None, None))
+        return tuple(state)
+
+    def _keys_args(self, fingerprints: Iterable[str] = ()) -> list:
+        # --with-secret flags the keys whose secret part is available, one listing covers both
+        return [self.gpg_path, "--list-keys", "--with-colons", "--with-secret", *fingerprints]
+
+    def _query_keys(self, fingerprints: Iterable[str] = ()) -> list:
+        result = self._run(self._keys_args(fingerprints), capture_output=True, text=True)
+        return parse_colons(result.stdout)
+
+    def _merge_keys(self, fingerprints: list) -> None:
+        """Patch the registry with the given (new or changed) keys instead of listing the whole keyring"""
+        if fingerprints:
+            self.keys.update(self._query_keys(dict.fromkeys(fingerprints)))
+        self._keyring_signature = self._keyring_state()
+
+    @staticmethod
+    def _status_events(result, keyword: str) -> List[StatusEvent]:
+        """Status events of a finished run (CompletedProcess or CalledProcessError) with this keyword"""
+        return [event for event in getattr(result, "status_events", []) if event.keyword == keyword]
+
+    @cancellable
     def delete_key(self, fingerprint: str):
         try:
             # Delete the secret key first, then the public key (order is mandatory)
-            subprocess.run(
-                [self.gpg_path, "--batch", "--yes", "--delete-secret-key", fingerprint],
-                check=True,
-            )
-            subprocess.run(
-                [self.gpg_path, "--batch", "--yes", "--delete-keys", fingerprint],
-                check=True,
-            )
-            # Refresh the key list
-            self.list_secret_keys()
-        except subprocess.CalledProcessError:
-            raise ValueError("delete_key: Failed to delete key")
+            record = self.keys.get(fingerprint)
+            if record is None or record.secret:
+                self._run([self.gpg_path, "--batch", "--yes", "--delete-secret-key", fingerprint])
+            self._run([self.gpg_path, "--batch", "--yes", "--delete-keys", fingerprint])
+            # Drop the key from the registry instead of listing the keyring again
+            self.keys.remove(fingerprint)
+            self._keyring_signature = self._keyring_state()
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("delete_key: Failed to delete key", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"delete_key: Unexpected error: {str(e)}")
 
-    def create_key(self, email: str, name: str, passphrase: str):
+    @cancellable
+    def create_key(self, email: str, name: str, passphrase: str, algorithm: str = DEFAULT_KEY_ALGORITHM) -> dict:
+        """Create a key pair, taken from the key pool when one is ready
+
+        Returns the fingerprint, the algorithm, whether the pool was used and the time it took.
+        """
+        if algorithm not in KEY_ALGORITHMS:
+            raise ValueError(f"create_key: Unknown key algorithm {algorithm}")
+
+        start = time.perf_counter()
         try:
-            with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
-                temp_path = temp_file.name
-                temp_file.write(
-                    f"""%echo Generate RSA + RSA key
-Key-Type: RSA
-Key-Length: 2048
-Subkey-Type: RSA
-Subkey-Length: 2048
-Key-Usage: cert sign
-Subkey-Usage: encrypt auth
+            fingerprint = None
+            if self.key_pool is not None:
+                fingerprint = self.key_pool.claim(algorithm, name, email, passphrase, self.key_preferences())
+            from_pool = fingerprint is not None
+            if from_pool:
+                # Preferences were set when the user ID was added, only the trust is missing
+                self._run([self.gpg_path, "--import-ownertrust"], input=f"{fingerprint}:6:\n", text=True)
+                self.key_pool.fill_async(algorithm)
+            else:
+                fingerprint = self._generate_key(email, name, passphrase, algorithm)
+                self.set_key_trust_and_prefs(fingerprint)
+            self._merge_keys([fingerprint])
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("gpg failed to create key", e)
+        except GpgError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Unexpected error: {str(e)}")
+
+        return {
+            "fingerprint": fingerprint,
+            "algorithm": algorithm,
+            "from_pool": from_pool,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _generate_key(self, email: str, name: str, passphrase: str, algorithm: str) -> str:
+        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as temp_file:
+            temp_path = temp_file.name
+            temp_file.write(
+                f"""%echo Generate {algorithm} key
+{KEY_ALGORITHMS[algorithm]}
 Name-Real: {name}
 Name-Email: {email}
 Expire-Date: 0
@@ -210,46 +1132,104 @@ Passphrase: {passphrase}
 %commit
 %echo Done
 """
-                )
-                temp_file.close()
+            )
+            temp_file.close()
 
-            subprocess.run([
+        try:
+            result = self._run([
                 self.gpg_path,
-                "--default-preference-list", "AES256 AES192 AES CAST5 SHA512 SHA256 SHA1 ZLIB BZIP2 ZIP Uncompressed",
+                "--default-preference-list", self.key_preferences(),
                 "--batch",
                 "--gen-key",
                 temp_path
-            ], check=True)
+            ], stdout=subprocess.DEVNULL)
+        finally:
+            # The parameter file holds the passphrase, remove it even if gpg was cancelled
             os.unlink(temp_path)
-            # Refresh the key list
-            self.list_secret_keys()
-            # Find the key with matching name and email
-            for fingerprint, key_email in self.secret_keys:
-                if key_email == f"{name} <{email}>":
-                    self.set_key_trust_and_prefs(fingerprint)
-                    break
-        except subprocess.CalledProcessError:
-            raise ValueError("gpg failed to create key")
-        except Exception as e:
-            raise ValueError(f"Unexpected error: {str(e)}")
+        # KEY_CREATED <type> <fingerprint> tells which key was generated
+        created = self._status_events(result, "KEY_CREATED")
+        if not created:
+            raise ValueError("gpg did not report the created key")
+        return created[0].key
+
+    def key_type_params(self, algorithm: str) -> str:
+        """Key-Type/Subkey-Type lines of a gpg --gen-key parameter file"""
+        return KEY_ALGORITHMS[algorithm]
+
+    def enable_key_pool(self, algorithms: Iterable[str], size: int = 1) -> None:
+        """Keep `size` pre-generated keys per algorithm ready for create_key, filled in the background"""
+        self.key_pool = KeyPool(self, size)
+        for algorithm in algorithms:
+            if algorithm in KEY_ALGORITHMS:
+                self.key_pool.fill_async(algorithm)
 
+    @cancellable
     def import_key(self, key_file: str, passphrase: str):
-        try:
-            cmd = [
-                self.gpg_path,
-                "--pinentry-mode=loopback",
-                "--passphrase",
-                passphrase,
-                "--import",
-                key_file,
-            ]
-            subprocess.run(cmd, check=True)
-            self.list_secret_keys()
-        except subprocess.CalledProcessError:
+        report = self.import_keys([key_file], passphrase)
+        if not report.results or report.failed:
             raise ValueError("gpg failed to import key")
+
+    @cancellable
+    def import_keys(self, paths: Iterable[str], passphrase: Optional[str] = None) -> KeyImportReport:
+        """Import key files, and the key files of directories, in a single gpg run
+
+        The registry is patched once with the keys that changed. A bad file does not stop the
+        others, the report tells which keys got in and how many files held no key.
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(self._walk_files(path, lambda name: name.lower().endswith(KEY_FILE_EXTENSIONS)))
+            else:
+                files.append(path)
+        if not files:
+            raise ValueError("import_keys: No key files to import")
+
+        start = time.perf_counter()
+        args = [self.gpg_path, "--batch"]
+        if passphrase is not None:
+            # gpg-agent asks for the passphrase of imported secret keys
+            args += ["--pinentry-mode=loopback", "--passphrase", passphrase]
+        try:
+            try:
+                result = self._run(args + ["--import", *files], capture_output=True)
+            except subprocess.CalledProcessError as e:
+                # gpg also fails when only some of the files were bad, the totals tell whether it ran
+                result = e
+                if not self._status_events(result, "IMPORT_RES"):
+                    raise
+            report = self._parse_import_status(result.status_events)
+            report.files = files
+            self._merge_keys([result.fingerprint for result in report.imported])
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("import_keys: gpg failed to import keys", e)
+        except GpgError:
+            raise
         except Exception as e:
-            raise ValueError(f"unexpected gpg error: {str(e)}")
+            raise ValueError(f"import_keys: Unexpected error: {str(e)}")
+        report.seconds = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def _parse_import_status(events: List[StatusEvent]) -> KeyImportReport:
+        report = KeyImportReport()
+        results = {}
+        for event in events:
+            if event.keyword == "IMPORT_OK":
+                # A key found in several files gets one IMPORT_OK per file
+                results.setdefault(event.fingerprint, KeyImportResult(event.fingerprint)).flags |= event.flags
+            elif event.keyword == "IMPORT_PROBLEM" and event.args:
+                fingerprint = event.args[1] if len(event.args) > 1 else ""
+                problem = IMPORT_PROBLEMS.get(event.args[0], f"reason {event.args[0]}")
+                results.setdefault(fingerprint, KeyImportResult(fingerprint)).problem = problem
+            elif event.keyword == "IMPORT_RES":
+                report.counts = dict(zip(IMPORT_RES_FIELDS, map(int, event.args)))
+            elif event.keyword == "NODATA":
+                report.files_without_keys += 1
+        report.results = list(results.values())
+        return report
 
+    @cancellable
     def export_key(self, fingerprint: str, output_file: str, passphrase: str):
         try:
             with open(output_file, "w") as f:
@@ -262,35 +1242,114 @@ Passphrase: {passphrase}
                     passphrase,
                     fingerprint,
                 ]
-                subprocess.run(cmd, check=True, stdout=f)
-        except subprocess.CalledProcessError:
-            raise ValueError("export_key: Failed to export key")
+                self._run(cmd, stdout=f)
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("export_key: Failed to export key", e)
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"export_key: Unexpected error: {str(e)}")
 
-    def set_key_trust_and_prefs(self, fingerprint: str):
+    @cancellable
+    def export_keys(
+        self, fingerprints: Iterable[str], output: str, passphrase: Optional[str] = None, per_key: bool = False
+    ) -> KeyExportReport:
+        """Export keys ASCII armored into one bundle file, or with per_key into <output>/<fingerprint>.asc
+
+        Secret keys are exported when a passphrase is given, public keys otherwise. The bundle takes
+        a single gpg run; per-key files take one run each, all without listing the keyring. The keys
+        left out are reported with the reason, raises ValueError (GpgError) when no key was exported.
+        """
+        fingerprints = [fingerprint.upper() for fingerprint in dict.fromkeys(fingerprints)]
+        if not fingerprints:
+            raise ValueError("export_keys: No keys to export")
+
+        start = time.perf_counter()
+        report = KeyExportReport()
+        # (requested fingerprints, CalledProcessError or None) of every gpg run
+        runs = []
         try:
-            commands = (
-                "trust\n"
-                "5\n"
-                "setpref AES256 AES192 AES128 3DES SHA512 SHA384 SHA256 SHA224 SHA1 ZLIB BZIP2 ZIP\n"
-                "save\n"
-            )
-            subprocess.run(
-                [
-                    self.gpg_path,
-                    "--batch",
-                    "--command-fd",
-                    "0",
-                    "--edit-key",
-                    fingerprint,
-                ],
-                input=commands,
-                text=True,
-                check=True,
-            )
+            if per_key:
+                os.makedirs(output, exist_ok=True)
+                for fingerprint in fingerprints:
+                    path = os.path.join(output, f"{fingerprint}.asc")
+                    exported, error = self._export([fingerprint], path, passphrase)
+                    report.outputs.update(dict.fromkeys(exported, path))
+                    runs.append(([fingerprint], error))
+            else:
+                exported, error = self._export(fingerprints, output, passphrase)
+                report.outputs.update(dict.fromkeys(exported, output))
+                runs.append((fingerprints, error))
+            failed = [error for _, error in runs if error is not None]
+            if failed and not report.outputs:
+                raise failed[-1]
+        except subprocess.CalledProcessError as e:
+            raise self._gpg_error("export_keys: Failed to export keys", e)
+        except GpgError:
+            raise
+        except Exception as e:
+            raise ValueError(f"export_keys: Unexpected error: {str(e)}")
+        for requested, error in runs:
+            for fingerprint in requested:
+                if fingerprint not in report.outputs:
+                    report.missing.append(fingerprint)
+                    report.problems[fingerprint] = self._export_problem(error, passphrase)
+        if not report.outputs:
+            raise ValueError(f"export_keys: No key was exported: {report.problems[report.missing[-1]]}")
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _export(self, fingerprints: List[str], output: str, passphrase: Optional[str]) -> tuple:
+        """Fingerprints of the keys gpg exported to output (from its EXPORTED status lines), and the
+        CalledProcessError of the run if it failed"""
+        args = [self.gpg_path, "--batch", "--yes", "--armor", "--output", output]
+        if passphrase is not None:
+            args += ["--pinentry-mode=loopback", "--passphrase", passphrase, "--export-secret-keys"]
+        else:
+            args += ["--export"]
+        error = None
+        try:
+            result = self._run(args + fingerprints, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            # A key whose passphrase does not match fails the run, the others were still written
+            result = error = e
+        exported = [event.key for event in self._status_events(result, "EXPORTED")]
+        if not exported and os.path.exists(output) and not os.path.getsize(output):
+            os.unlink(output)
+        return exported, error
+
+    @staticmethod
+    def _export_problem(error: Optional[subprocess.CalledProcessError], passphrase: Optional[str]) -> str:
+        """Why a key was not exported by its run"""
+        if error is None:
+            # gpg succeeds without exporting the secret part of a key it does not have
+            return "No secret key in the keyring" if passphrase is not None else "Not in the keyring"
+        reason = failure_reason(getattr(error, "status_events", []))
+        if reason:
+            return REASON_MESSAGES[reason]
+        stderr = (error.stderr or b"").decode("utf-8", errors="replace").strip()
+        return stderr.splitlines()[-1] if stderr else f"gpg exited with status {error.returncode}"
+
+    @cancellable
+    def set_key_trust_and_prefs(self, fingerprint: str, passphrase: Optional[str] = None):
+        """Trust the key ultimately and, given its passphrase, rewrite its preferences from the crypto profile
+
+        Keys made by create_key already carry these preferences. Changing them re-signs the user IDs,
+        which is why it needs the passphrase.
+        """
+        try:
+            args = [self.gpg_path, "--batch", "--command-fd", "0"]
+            # "y" confirms ultimate trust
+            commands = "trust\n5\ny\n"
+            if passphrase is not None:
+                args += ["--pinentry-mode", "loopback", "--passphrase", passphrase]
+                # "y" answers "Really update the preferences?"
+                commands += f"setpref {self.key_preferences()}\ny\n"
+            self._run(args + ["--edit-key", fingerprint], input=commands + "save\n", text=True)
         except subprocess.CalledProcessError:
             raise ValueError("Failed to set trust and preferences for key")
+        except GpgError:
+            raise
         except Exception as e:
             raise ValueError(f"Unexpected error: {str(e)}")
 
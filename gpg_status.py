@@ -0,0 +1,200 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+STATUS_PREFIX = "[GNUPG:] "
+
+# gpg-error codes (the low 16 bits of the numbers in ERROR/FAILURE lines)
+GPG_ERR_BAD_PASSPHRASE = 11
+# Operation cancelled by the user (e.g. closing pinentry)
+GPG_ERR_CANCELED = 99
+
+# Known causes of a failed gpg run, as told by its status lines
+REASON_MESSAGES = {
+    "bad_passphrase": "Wrong passphrase",
+    "missing_passphrase": "No passphrase was given",
+    "no_seckey": "No secret key for this file in the keyring",
+    "invalid_recipient": "A recipient key is missing or not usable",
+    "no_data": "Not an OpenPGP file",
+    "decryption_failed": "The file is damaged or was modified",
+    "cancelled": "Cancelled",
+}
+
+
+@dataclass
+class StatusEvent:
+    """One "[GNUPG:] KEYWORD args..." line of gpg's --status-fd output"""
+
+    keyword: str
+    args: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ProgressEvent(StatusEvent):
+    """PROGRESS <what> <char> <current> <total> [<units>], total is 0 when gpg does not know it"""
+
+    what: str = ""
+    current: int = 0
+    total: int = 0
+    units: str = ""
+
+    @property
+    def fraction(self) -> Optional[float]:
+        return min(self.current / self.total, 1.0) if self.total else None
+
+
+@dataclass
+class ErrorEvent(StatusEvent):
+    """ERROR/FAILURE <location> <code>, code being a gpg-error number, possibly with a name appended"""
+
+    location: str = ""
+    code: int = 0
+    name: str = ""
+
+
+@dataclass
+class ImportEvent(StatusEvent):
+    """IMPORT_OK <flags> <fingerprint>"""
+
+    flags: int = 0
+    fingerprint: str = ""
+
+
+@dataclass
+class KeyEvent(StatusEvent):
+    """Status lines about one key: NO_SECKEY, NO_PUBKEY, INV_RECP, KEY_CONSIDERED, KEY_CREATED, EXPORTED"""
+
+    key: str = ""
+
+
+KEY_KEYWORDS = {
+    # Keyword -> index of the key ID or fingerprint among the arguments
+    "NO_SECKEY": 0,
+    "NO_PUBKEY": 0,
+    "INV_RECP": 1,
+    "KEY_CONSIDERED": 0,
+    "KEY_CREATED": 1,
+    "EXPORTED": 0,
+}
+
+
+def _int(value: str) -> int:
+    return int(value) if value.isdigit() else 0
+
+
+def parse_status_line(line: str) -> Optional[StatusEvent]:
+    if not line.startswith(STATUS_PREFIX):
+        return None
+    keyword, *args = line[len(STATUS_PREFIX) :].split()
+    if keyword == "PROGRESS" and len(args) >= 4:
+        units = args[4] if len(args) > 4 else ""
+        return ProgressEvent(keyword, args, args[0], _int(args[2]), _int(args[3]), units)
+    if keyword in ("ERROR", "FAILURE") and len(args) >= 2:
+        code, _, name = args[1].partition("_")
+        return ErrorEvent(keyword, args, args[0], _int(code), name)
+    if keyword == "IMPORT_OK" and len(args) >= 2:
+        return ImportEvent(keyword, args, _int(args[0]), args[1])
+    if keyword in KEY_KEYWORDS:
+        index = KEY_KEYWORDS[keyword]
+        return KeyEvent(keyword, args, args[index] if len(args) > index else "")
+    return StatusEvent(keyword, args)
+
+
+def failure_reason(events: List[StatusEvent]) -> Optional[str]:
+    """Key of REASON_MESSAGES explaining a failed run, None when the status lines do not tell"""
+    keywords = {event.keyword for event in events}
+    errors = [event for event in events if isinstance(event, ErrorEvent)]
+    if "BAD_PASSPHRASE" in keywords or any(
+        # pkdecrypt_failed only carries the number when the secret key of a public-key file would not unlock
+        event.name == "BAD_PASSPHRASE" or event.code & 0xFFFF == GPG_ERR_BAD_PASSPHRASE
+        for event in errors
+    ):
+        return "bad_passphrase"
+    if any(event.code & 0xFFFF == GPG_ERR_CANCELED for event in errors):
+        return "cancelled"
+    if "MISSING_PASSPHRASE" in keywords:
+        return "missing_passphrase"
+    if "NO_SECKEY" in keywords and "DECRYPTION_OKAY" not in keywords:
+        return "no_seckey"
+    if "INV_RECP" in keywords:
+        return "invalid_recipient"
+    if "DECRYPTION_FAILED" in keywords:
+        return "decryption_failed"
+    if "NODATA" in keywords:
+        return "no_data"
+    return None
+
+
+class GpgError(ValueError):
+    """A failed gpg run, with the cause from its status lines in `reason` (a REASON_MESSAGES key) when known
+
+    A run that failed for a known reason fails the same way when repeated unchanged.
+    """
+
+    def __init__(self, message: str, reason: Optional[str] = None, events: Optional[List[StatusEvent]] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.events = events or []
+
+    @classmethod
+    def from_status(cls, message: str, events: List[StatusEvent]) -> "GpgError":
+        reason = failure_reason(events)
+        if reason:
+            message = f"{message}: {REASON_MESSAGES[reason]}"
+        return cls(message, reason, events)
+
+
+class StatusReader:
+    """Collects gpg's status lines from a dedicated pipe, leaving stdout to the data
+
+    command() adds --status-fd and --enable-progress-filter to a gpg command line, pass
+    `pass_fds` to the child and call start() once it is spawned, close() after it exited.
+    on_event is called on the reader thread for every event.
+    """
+
+    def __init__(self, on_event: Optional[Callable[[StatusEvent], None]] = None):
+        self.on_event = on_event
+        self.events: List[StatusEvent] = []
+        self._read_fd, self._write_fd = os.pipe()
+        self._thread = None
+
+    @property
+    def pass_fds(self) -> tuple:
+        return (self._write_fd,)
+
+    def command(self, args: list, size_hint: Optional[int] = None) -> list:
+        options = ["--status-fd", str(self._write_fd), "--enable-progress-filter"]
+        if size_hint is not None:
+            # Lets gpg report a total for data coming from stdin
+            options += ["--input-size-hint", str(size_hint)]
+        return [args[0], *options, *args[1:]]
+
+    def start(self) -> None:
+        # The child holds its own copy, gpg exiting then closes the pipe
+        os.close(self._write_fd)
+        self._write_fd = None
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        with os.fdopen(self._read_fd, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                event = parse_status_line(line)
+                if event is None:
+                    continue
+                self.events.append(event)
+                if self.on_event is not None:
+                    try:
+                        self.on_event(event)
+                    except Exception:
+                        pass  # A failing listener must not stop gpg's output from being drained
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            # Never started (the child could not be spawned)
+            os.close(self._read_fd)
+            if self._write_fd is not None:
+                os.close(self._write_fd)
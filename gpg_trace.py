@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+# Options whose value is a secret and must never end up in a trace
+SECRET_OPTIONS = ("--passphrase", "--override-session-key")
+
+
+def redact_argv(argv: list) -> list:
+    """Copy of argv with the values of SECRET_OPTIONS replaced"""
+    redacted = []
+    hide_next = False
+    for arg in argv:
+        arg = str(arg)
+        if hide_next:
+            redacted.append("***")
+            hide_next = False
+        elif arg in SECRET_OPTIONS:
+            redacted.append(arg)
+            hide_next = True
+        elif arg.startswith(tuple(option + "=" for option in SECRET_OPTIONS)):
+            redacted.append(arg.split("=", 1)[0] + "=***")
+        else:
+            redacted.append(arg)
+    return redacted
+
+
+@dataclass
+class TraceRecord:
+    """One gpg (or helper) process launched by GpgProcess"""
+
+    operation: str
+    argv: list
+    started: float
+    seconds: float
+    bytes_in: int
+    bytes_out: int
+    returncode: Optional[int]
+
+
+class Tracer:
+    """Keeps the last trace records in memory, aggregates them per operation and optionally logs them as JSONL
+
+    The log file defaults to the GPG_GUI_TRACE_LOG environment variable.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, max_records: int = 1000):
+        self.log_path = log_path or os.environ.get("GPG_GUI_TRACE_LOG")
+        self.records = deque(maxlen=max_records)
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        operation: str,
+        argv: list,
+        started: float,
+        seconds: float,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+        returncode: Optional[int] = None,
+    ) -> TraceRecord:
+        record = TraceRecord(operation, redact_argv(argv), started, seconds, bytes_in, bytes_out, returncode)
+        with self._lock:
+            self.records.append(record)
+            counter = self.counters.setdefault(
+                operation,
+                {"count": 0, "failures": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes_in": 0, "bytes_out": 0},
+            )
+            counter["count"] += 1
+            counter["failures"] += 1 if returncode else 0
+            counter["seconds"] += seconds
+            counter["max_seconds"] = max(counter["max_seconds"], seconds)
+            counter["bytes_in"] += bytes_in
+            counter["bytes_out"] += bytes_out
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a") as f:
+                        f.write(json.dumps(asdict(record)) + "\n")
+                except IOError:
+                    pass  # Tracing must never break the traced operation
+        return record
+
+    def stats(self) -> dict:
+        """Aggregate counters per operation, with the average time per call"""
+        with self._lock:
+            return {
+                operation: {**counter, "avg_seconds": counter["seconds"] / counter["count"]}
+                for operation, counter in self.counters.items()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+            self.counters.clear()
+
+
+class Span:
+    """Times a block and records it on exit, for work that does not go through GpgProcess._run"""
+
+    def __init__(self, tracer: Optional[Tracer], operation: str, argv: list):
+        self.tracer = tracer
+        self.operation = operation
+        self.argv = argv
+        self.returncode = 0
+
+    def __enter__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.tracer is not None:
+            returncode = self.returncode if exc_type is None else getattr(exc, "returncode", 1)
+            seconds = time.perf_counter() - self._start
+            self.tracer.record(self.operation, self.argv, self.started, seconds, 0, 0, returncode)
+        return False
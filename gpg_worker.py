@@ -0,0 +1,47 @@
+import queue
+import threading
+
+
+class BackgroundExecutor:
+    """Runs blocking work on worker threads and delivers results on the Tk main loop
+
+    Tk widgets must only be touched from the main thread, so workers push their
+    outcome on a queue that the main loop drains with after().
+    """
+
+    POLL_INTERVAL_MS = 50
+
+    def __init__(self, root):
+        self.root = root
+        self._results = queue.Queue()
+        self._pending = 0
+
+    def submit(self, func, on_success=None, on_error=None) -> None:
+        """Run func() on a worker thread, then call on_success(result) or on_error(exception) on the Tk thread"""
+
+        def work():
+            try:
+                self._results.put((on_success, func(), None))
+            except Exception as e:
+                self._results.put((on_error, None, e))
+
+        self._pending += 1
+        if self._pending == 1:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
+        threading.Thread(target=work, daemon=True).start()
+
+    @property
+    def busy(self) -> bool:
+        return self._pending > 0
+
+    def _poll(self) -> None:
+        while True:
+            try:
+                callback, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if callback is not None:
+                callback(error if error is not None else result)
+        if self._pending:
+            self.root.after(self.POLL_INTERVAL_MS, self._poll)
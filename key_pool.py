@@ -0,0 +1,151 @@
+import os
+import re
+import shutil
+import subprocess
+import threading
+from typing import Optional
+
+from gpg_keys import parse_colons
+
+POOL_DIR_NAME = "gpg_gui_key_pool"
+PLACEHOLDER_UID = "gpg-gui-pool"
+
+
+class KeyPool:
+    """Pre-generated key material kept in a separate GNUPGHOME, so create_key does not wait for key generation
+
+    Pool keys are generated without passphrase under a placeholder user ID. Claiming one gives it
+    the real user ID and protects every one of its secret keys with the user's passphrase while it is
+    still in the pool, then moves the key files into the main keyring, so an unprotected key never
+    gets there. The pool home is a 0700 directory inside the main GNUPGHOME.
+    """
+
+    def __init__(self, gpg_process, size: int = 1):
+        self.gpg = gpg_process
+        # Fills run on their own children and cancel scopes, so cancelling a user operation leaves them alone
+        self._filler = gpg_process.clone(_children=set(), _children_lock=threading.Lock(), _cancel_scopes=set())
+        self.size = size
+        self.home = os.path.join(gpg_process._gnupg_home(), POOL_DIR_NAME)
+        os.makedirs(self.home, mode=0o700, exist_ok=True)
+        self._lock = threading.Lock()
+        self._filling = set()
+
+    def _gpg(self, *args) -> list:
+        return [self.gpg.gpg_path, "--homedir", self.home, "--batch", *args]
+
+    def _key_file(self, keygrip: str) -> str:
+        return os.path.join(self.home, "private-keys-v1.d", f"{keygrip}.key")
+
+    @staticmethod
+    def _is_protected(path: str) -> bool:
+        """Whether a private-keys-v1.d file holds a passphrase protected key
+
+        The key is an S-expression, either alone in the file or as the "Key:" field of gpg-agent's
+        extended key format.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(b"("):
+            match = re.search(rb"^Key:\s*(\(.*)", data, re.MULTILINE)
+            data = match.group(1) if match else b""
+        return data.startswith(b"(protected-private-key")
+
+    def _stop_agent(self) -> None:
+        """Stop the pool's gpg-agent, the next fill starts a new one"""
+        gpgconf = shutil.which("gpgconf")
+        if gpgconf:
+            subprocess.run([gpgconf, "--homedir", self.home, "--kill", "gpg-agent"], capture_output=True)
+
+    def _pool_keys(self) -> list:
+        """(algorithm, fingerprint, keygrips) of the keys waiting in the pool"""
+        result = self._filler._run(self._gpg("--list-secret-keys", "--with-colons"), capture_output=True, text=True)
+        keys = []
+        for record in parse_colons(result.stdout):
+            for uid in record.uids:
+                if uid.startswith(PLACEHOLDER_UID + " "):
+                    keygrips = [key.keygrip for key in [record] + record.subkeys]
+                    keys.append((uid[len(PLACEHOLDER_UID) + 1 :], record.fingerprint, keygrips))
+        return keys
+
+    def available(self, algorithm: str) -> int:
+        return sum(1 for key in self._pool_keys() if key[0] == algorithm)
+
+    def fill(self, algorithm: str) -> None:
+        """Generate keys until the pool holds `size` keys of this algorithm (blocking)"""
+        key_type = self._filler.key_type_params(algorithm)
+        for _ in range(max(self.size - self.available(algorithm), 0)):
+            params = f"{key_type}\nName-Real: {PLACEHOLDER_UID} {algorithm}\nExpire-Date: 0\n"
+            self._filler._run(self._gpg("--gen-key"), input=params + "%no-protection\n%commit\n", text=True)
+        # Nothing needs the pool agent until the next claim
+        self._stop_agent()
+
+    def fill_async(self, algorithm: str) -> None:
+        """Refill the pool on a background thread, at most one filler per algorithm"""
+        with self._lock:
+            if algorithm in self._filling:
+                return
+            self._filling.add(algorithm)
+
+        def run():
+            try:
+                self.fill(algorithm)
+            except Exception:
+                pass  # The pool is an optimization, create_key falls back to generating keys
+            finally:
+                with self._lock:
+                    self._filling.discard(algorithm)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def claim(self, algorithm: str, name: str, email: str, passphrase: str, preferences: str) -> Optional[str]:
+        """Move one pooled key into the main keyring as "name <email>", returns its fingerprint or None"""
+        with self._lock:
+            keys = [key for key in self._pool_keys() if key[0] == algorithm]
+            if not keys:
+                return None
+            _, fingerprint, keygrips = keys[0]
+
+            # Real user ID first (self-signed with our preferences), then drop the placeholder one
+            self.gpg._run(
+                self._gpg("--default-preference-list", preferences, "--quick-add-uid", fingerprint, f"{name} <{email}>")
+            )
+            listing = self.gpg._run(
+                self._gpg("--list-keys", "--with-colons", fingerprint), capture_output=True, text=True
+            )
+            uids = parse_colons(listing.stdout)[0].uids
+            placeholder = next(i for i, uid in enumerate(uids, 1) if uid.startswith(PLACEHOLDER_UID + " "))
+            self.gpg._run(
+                self._gpg("--command-fd", "0", "--edit-key", fingerprint),
+                input=f"uid {placeholder}\ndeluid\ny\nsave\n",
+                text=True,
+            )
+            # Protect the primary key and every subkey while they are still in the pool
+            self.gpg._run(
+                self._gpg("--pinentry-mode", "loopback", "--passphrase-fd", "0", "--passwd", fingerprint),
+                input=f"{passphrase}\n",
+                text=True,
+            )
+            unprotected = [keygrip for keygrip in keygrips if not self._is_protected(self._key_file(keygrip))]
+            if unprotected:
+                # Never hand out a key the passphrase does not protect, nor keep it for a later claim
+                self.gpg._run(self._gpg("--yes", "--delete-secret-and-public-key", fingerprint))
+                self._stop_agent()
+                raise ValueError(f"claim: Keys {', '.join(unprotected)} are not protected by the passphrase")
+            public_key = self.gpg._run(self._gpg("--export", fingerprint), capture_output=True).stdout
+
+            main_home = self.gpg._gnupg_home()
+            self.gpg._run([self.gpg.gpg_path, "--batch", "--import"], input=public_key, capture_output=True)
+            private_dir = os.path.join(main_home, "private-keys-v1.d")
+            os.makedirs(private_dir, mode=0o700, exist_ok=True)
+            for keygrip in keygrips:
+                shutil.move(self._key_file(keygrip), os.path.join(private_dir, f"{keygrip}.key"))
+            # The revocation certificate goes where gpg puts those of the keys it generates
+            revocation = os.path.join(self.home, "openpgp-revocs.d", f"{fingerprint}.rev")
+            if os.path.exists(revocation):
+                revocs_dir = os.path.join(main_home, "openpgp-revocs.d")
+                os.makedirs(revocs_dir, mode=0o700, exist_ok=True)
+                shutil.move(revocation, os.path.join(revocs_dir, f"{fingerprint}.rev"))
+            self.gpg._run(self._gpg("--yes", "--delete-keys", fingerprint))
+            # It may still hold the passphrase just set
+            self._stop_agent()
+        return fingerprint
@@ -1,66 +1,244 @@
+import atexit
+import fcntl
 import json
 import os
+import sys
+import tempfile
+import threading
+import time
+
+# Version of the config file layout, stored in it as "schema_version"
+SCHEMA_VERSION = 2
+# Changes made within this window are written together
+SAVE_DELAY_SECONDS = 0.5
 
 
 class Preferences:
-    """Handles application preferences and configuration"""
+    """Handles application preferences and configuration
+
+    The config file is read on first access. Setters only update memory and schedule a background
+    write, so callers never wait on the disk. Each write holds an flock on <config>.lock and re-reads
+    the file first: keys changed by another running instance are kept, only keys changed here win.
+    The file is replaced atomically. A corrupt file is moved aside instead of being overwritten.
+    """
 
-    def __init__(self):
-        self.config_file = os.path.expanduser("~") + "/.gpg_gui_config.json"
+    def __init__(self, config_file=None, save_delay=SAVE_DELAY_SECONDS):
+        self.config_file = config_file or os.path.expanduser("~") + "/.gpg_gui_config.json"
+        self.save_delay = save_delay
         self.defaults = {
             "last_directory": None,
             "use_key_encryption": False,
-            "selected_key": None
+            "selected_keys": [],
+            "backup_keep_count": 2,
+            "backup_max_age_days": None,
+            "backup_max_total_mb": None,
+            "key_algorithm": "ed25519",
+            "key_pool_algorithms": [],
+            "compression": "auto",
+            "crypto_profile": None,
+            "decrypt_cache_enabled": False,
+            "decrypt_cache_max_mb": 64,
+            "decrypt_cache_ttl_seconds": 300,
+            "session_key_cache_enabled": False,
         }
-        self._preferences = self._load_preferences()
+        self._loaded = None
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        # Error of the last failed write, None once a write succeeds
+        self.last_error = None
+        atexit.register(self._flush_at_exit)
+
+    @property
+    def _preferences(self):
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = self._load_preferences()
+            return self._loaded
+
+    def load(self):
+        """Read the config file now instead of on first access, e.g. from a worker thread"""
+        return self._preferences is not None
 
     def _load_preferences(self):
-        if os.path.exists(self.config_file):
+        # Merge with defaults to ensure all keys exist
+        merged = self.defaults.copy()
+        merged.update(self._read_file())
+        return merged
+
+    def _read_file(self):
+        """Stored preferences migrated to SCHEMA_VERSION, {} when there is no usable file"""
+        try:
+            with open(self.config_file, "r") as f:
+                prefs = json.load(f)
+            if not isinstance(prefs, dict):
+                raise ValueError("not a JSON object")
+        except FileNotFoundError:
+            return {}
+        except (ValueError, IOError) as e:
+            # Keep the broken file for inspection rather than silently replacing it with defaults
+            corrupt_path = f"{self.config_file}.corrupt-{time.strftime('%Y%m%d_%H%M%S')}"
             try:
-                with open(self.config_file, "r") as f:
-                    prefs = json.load(f)
-                # Merge with defaults to ensure all keys exist
-                merged = self.defaults.copy()
-                merged.update(prefs)
-                return merged
-            except (json.JSONDecodeError, IOError):
-                # If file is corrupted, return defaults
-                return self.defaults.copy()
-        return self.defaults.copy()
+                os.replace(self.config_file, corrupt_path)
+                print(f"Unreadable preferences ({e}) moved to {corrupt_path}", file=sys.stderr)
+            except OSError:
+                pass
+            return {}
+        return self._migrate(prefs)
+
+    @staticmethod
+    def _migrate(prefs):
+        # Version 0 was the same flat mapping without schema_version
+        version = prefs.get("schema_version", 0)
+        if version < 2:
+            # A single "selected_key" became the "selected_keys" recipient list
+            selected_key = prefs.pop("selected_key", None)
+            prefs.setdefault("selected_keys", [selected_key] if selected_key else [])
+        if version < SCHEMA_VERSION:
+            prefs["schema_version"] = SCHEMA_VERSION
+        return prefs
+
+    def _set(self, key, value):
+        with self._lock:
+            self._preferences[key] = value
+            self._dirty.add(key)
+            if self._timer is None:
+                self._timer = threading.Timer(self.save_delay, self._save_preferences)
+                self._timer.daemon = True
+                self._timer.start()
 
     def _save_preferences(self):
+        """Write the pending changes, run by the save timer and flush()"""
+        with self._write_lock:
+            with self._lock:
+                self._timer = None
+                changes = {key: self._preferences[key] for key in self._dirty}
+                self._dirty.clear()
+            if not changes:
+                return
+            try:
+                self._write(changes)
+                self.last_error = None
+            except OSError as e:
+                with self._lock:
+                    # Retried with the next change or flush(), newer values win
+                    self._dirty.update(changes)
+                self.last_error = e
+                print(f"Failed to save preferences to {self.config_file}: {e}", file=sys.stderr)
+
+    def _write(self, changes):
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        with open(self.config_file + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another instance may have saved since we loaded: start from what is on disk
+            prefs = self._read_file()
+            prefs.update(changes)
+            prefs["schema_version"] = SCHEMA_VERSION
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".gpg_gui_config.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(prefs, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.config_file)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        with self._lock:
+            # Pick up what the other instances saved, except keys changed here in the meantime
+            for key, value in prefs.items():
+                if key not in self._dirty:
+                    self._preferences[key] = value
+
+    def flush(self):
+        """Write pending changes now, raises OSError if the write fails"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self._save_preferences()
+        if self.last_error is not None:
+            raise self.last_error
+
+    def _flush_at_exit(self):
         try:
-            with open(self.config_file, "w") as f:
-                json.dump(self._preferences, f, indent=2)
-        except IOError:
-            pass  # Silently fail if can't save
+            self.flush()
+        except OSError:
+            pass  # Already reported on stderr
 
     def load_last_directory(self):
         return self._preferences.get("last_directory")
 
     def save_last_directory(self, directory):
-        self._preferences["last_directory"] = directory
-        self._save_preferences()
+        self._set("last_directory", directory)
 
     def get_use_key_encryption(self):
         return self._preferences.get("use_key_encryption", False)
 
     def set_use_key_encryption(self, use_key):
-        self._preferences["use_key_encryption"] = bool(use_key)
-        self._save_preferences()
+        self._set("use_key_encryption", bool(use_key))
+
+    def get_backup_retention(self):
+        """Retention policy of the backup store, as BackupStore keyword arguments"""
+        max_total_mb = self._preferences.get("backup_max_total_mb")
+        return {
+            "keep_count": self._preferences.get("backup_keep_count"),
+            "max_age_days": self._preferences.get("backup_max_age_days"),
+            "max_total_bytes": int(max_total_mb * 1024 * 1024) if max_total_mb else None,
+        }
+
+    def get_key_algorithm(self):
+        return self._preferences.get("key_algorithm") or "ed25519"
+
+    def set_key_algorithm(self, algorithm):
+        self._set("key_algorithm", algorithm)
+
+    def get_key_pool_algorithms(self):
+        """Key algorithms to keep a pre-generated key ready for, e.g. ["rsa4096"]"""
+        return list(self._preferences.get("key_pool_algorithms") or [])
+
+    def get_compression(self):
+        """Compression for encryption: auto (chosen per payload), none, zip, zlib or bzip2"""
+        return self._preferences.get("compression") or "auto"
+
+    def set_compression(self, compression):
+        self._set("compression", compression)
+
+    def get_crypto_profile(self):
+        """Profile stored by gpg_calibrate, None if this host was never calibrated"""
+        return self._preferences.get("crypto_profile")
+
+    def set_crypto_profile(self, profile):
+        self._set("crypto_profile", profile)
+
+    def get_decrypt_cache(self):
+        """DecryptCache keyword arguments, None unless the user opted in to caching decrypted documents"""
+        if not self._preferences.get("decrypt_cache_enabled"):
+            return None
+        return {
+            "max_bytes": int((self._preferences.get("decrypt_cache_max_mb") or 64) * 1024 * 1024),
+            "ttl": self._preferences.get("decrypt_cache_ttl_seconds"),
+        }
+
+    def get_session_key_cache(self):
+        """Whether the user opted in to reusing session keys when reopening files"""
+        return bool(self._preferences.get("session_key_cache_enabled"))
+
+    def get_selected_keys(self):
+        """Get the saved recipient keys as a list of (fingerprint, email) tuples"""
+        keys = self._preferences.get("selected_keys") or []
+        return [tuple(key) for key in keys if isinstance(key, list) and len(key) == 2]
+
+    def set_selected_keys(self, keys):
+        """Save the recipient keys, a list of (fingerprint, email) tuples"""
+        # Convert tuples to lists for JSON serialization
+        self._set("selected_keys", [list(key) for key in keys])
 
     def get_selected_key(self):
-        """Get the saved selected key (fingerprint, email) tuple"""
-        key_data = self._preferences.get("selected_key")
-        if key_data and isinstance(key_data, list) and len(key_data) == 2:
-            return tuple(key_data)
-        return None
+        """Get the first saved (fingerprint, email) tuple"""
+        keys = self.get_selected_keys()
+        return keys[0] if keys else None
 
     def set_selected_key(self, key_tuple):
-        """Save the selected key (fingerprint, email) tuple"""
-        if key_tuple is None:
-            self._preferences["selected_key"] = None
-        else:
-            # Convert tuple to list for JSON serialization
-            self._preferences["selected_key"] = list(key_tuple)
-        self._save_preferences()
+        """Save a single selected key (fingerprint, email) tuple"""
+        self.set_selected_keys([] if key_tuple is None else [key_tuple])
@@ -0,0 +1,201 @@
+import bisect
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from gpg_status import GpgError
+
+INDEX_NAME = ".gpg_gui_index.gpg"
+INDEX_VERSION = 1
+# Words of at least this many letters or digits are indexed
+MIN_TERM_LENGTH = 2
+TERM_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> dict:
+    """Term -> occurrence count of a document"""
+    counts = {}
+    for term in TERM_PATTERN.findall(text.lower()):
+        if len(term) >= MIN_TERM_LENGTH:
+            counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+class SearchIndex:
+    """Full-text inverted index over the .gpg documents of a vault directory
+
+    The index is stored next to the documents as <vault>/.gpg_gui_index.gpg, encrypted like
+    them (with the passphrase, or for the selected keys when use_key is set), so it leaks
+    nothing the documents do not. update() only decrypts documents that are new or whose
+    mtime or size changed since they were indexed, and search() never decrypts documents.
+    Files that are not UTF-8 text are remembered as unindexable until they change, files gpg
+    cannot decrypt (another passphrase or key) are retried by the next update().
+    """
+
+    def __init__(self, gpg_process, vault_dir: str, use_key: bool = False):
+        self.gpg = gpg_process
+        self.vault_dir = os.path.abspath(vault_dir)
+        self.use_key = use_key
+        self.index_path = os.path.join(self.vault_dir, INDEX_NAME)
+        # Relative path -> {"mtime_ns", "size", "terms": {term: count}, "error"}
+        self.documents = {}
+        self._postings = {}
+        # Sorted vocabulary, for prefix lookups
+        self._terms = []
+        self._loaded = False
+
+    def load(self) -> None:
+        """Decrypt the stored index, raises ValueError if it cannot be decrypted (wrong passphrase)
+
+        A damaged index or one of another version is dropped and rebuilt by the next update().
+        """
+        self.documents = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                plaintext = self.gpg.decrypt_bytes(f.read())
+            try:
+                data = json.loads(plaintext.decode("utf-8"))
+                if data.get("version") == INDEX_VERSION:
+                    self.documents = data["documents"]
+            except (ValueError, AttributeError, KeyError):
+                pass
+        self._rebuild_postings()
+        self._loaded = True
+
+    def save(self) -> None:
+        data = json.dumps({"version": INDEX_VERSION, "documents": self.documents}).encode("utf-8")
+        ciphertext = self.gpg.encrypt_bytes(data, self.use_key)
+        # Write then rename so an interrupted save never leaves a truncated index
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(ciphertext)
+        os.replace(temp_path, self.index_path)
+
+    def update(
+        self,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> dict:
+        """Index new and changed documents, forget deleted ones, and save the index if anything changed
+
+        GpgProcess.cancel() stops the update, which raises GpgError with reason "cancelled" and
+        leaves the stored index as it was.
+        """
+        # One cancellable operation of the GpgProcess, or part of the caller's
+        with self.gpg._in_cancel_scope(self.gpg._cancel_scope()) as scope:
+            try:
+                return self._update(scope, workers, progress)
+            except GpgError:
+                # documents may hold part of the update, the next one starts again from the stored index
+                self._loaded = False
+                raise
+
+    def _update(self, scope, workers: Optional[int], progress: Optional[Callable[[int, int], None]]) -> dict:
+        start = time.perf_counter()
+        if not self._loaded:
+            self.load()
+
+        current = {}
+        for path in self.gpg._walk_files(self.vault_dir, lambda name: name.endswith(".gpg")):
+            st = os.stat(path)
+            current[os.path.relpath(path, self.vault_dir)] = (st.st_mtime_ns, st.st_size)
+
+        removed = [name for name in self.documents if name not in current]
+        for name in removed:
+            del self.documents[name]
+        stale = [
+            name
+            for name, (mtime_ns, size) in current.items()
+            if name not in self.documents
+            or (self.documents[name]["mtime_ns"], self.documents[name]["size"]) != (mtime_ns, size)
+        ]
+
+        def index_document(name):
+            mtime_ns, size = current[name]
+            entry = {"mtime_ns": mtime_ns, "size": size, "terms": {}, "error": None}
+            try:
+                # The worker threads run as part of the update, so cancel() reaches them
+                with self.gpg._in_cancel_scope(scope):
+                    self.gpg._check_cancelled()
+                    with open(os.path.join(self.vault_dir, name), "rb") as f:
+                        plaintext = self.gpg.decrypt_bytes(f.read())
+            except GpgError as e:
+                if e.reason == "cancelled":
+                    raise
+                return name, None
+            except (ValueError, OSError):
+                return name, None
+            try:
+                entry["terms"] = tokenize(plaintext.decode("utf-8"))
+            except UnicodeDecodeError:
+                entry["error"] = "not a text document"
+            return name, entry
+
+        indexed = unindexable = failed = 0
+        if stale:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                for done, (name, entry) in enumerate(pool.map(index_document, stale), 1):
+                    if entry is None:
+                        failed += 1
+                    else:
+                        self.documents[name] = entry
+                        indexed += 0 if entry["error"] else 1
+                        unindexable += 1 if entry["error"] else 0
+                    if progress:
+                        progress(done, len(stale))
+                    self.gpg._check_cancelled(scope)
+
+        # Nothing decrypted (e.g. a wrong passphrase) must not overwrite the index
+        if indexed or unindexable or removed:
+            self._rebuild_postings()
+            self.save()
+        return {
+            "documents": len(self.documents),
+            "indexed": indexed,
+            "unindexable": unindexable,
+            "failed": failed,
+            "removed": len(removed),
+            "unchanged": len(current) - len(stale),
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _rebuild_postings(self) -> None:
+        postings = {}
+        for name, entry in self.documents.items():
+            for term, count in entry["terms"].items():
+                postings.setdefault(term, {})[name] = count
+        self._postings = postings
+        self._terms = sorted(postings)
+
+    def search(self, query: str) -> list:
+        """Documents containing every term of the query, as (relative path, score), best first
+
+        The last term also matches as a prefix, so results show up while a word is being typed.
+        """
+        words = TERM_PATTERN.findall(query.lower())
+        if not words:
+            return []
+        # Short words are not indexed, except as the prefix being typed
+        terms = [word for word in words[:-1] if len(word) >= MIN_TERM_LENGTH] + words[-1:]
+        scores = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                matches = {}
+                # Terms starting with the prefix are contiguous in the sorted vocabulary
+                position = bisect.bisect_left(self._terms, term)
+                while position < len(self._terms) and self._terms[position].startswith(term):
+                    for name, count in self._postings[self._terms[position]].items():
+                        matches[name] = matches.get(name, 0) + count
+                    position += 1
+            else:
+                matches = self._postings.get(term, {})
+            if scores is None:
+                scores = dict(matches)
+            else:
+                scores = {name: score + matches[name] for name, score in scores.items() if name in matches}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,141 @@
+import ctypes
+import ctypes.util
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+from decrypt_cache import DecryptCache, wipe
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        except OSError:
+            _libc = False
+    return _libc
+
+
+def _memory_call(name: str, buffer: bytearray) -> bool:
+    libc = _get_libc()
+    if not libc or not buffer or not hasattr(libc, name):
+        return False
+    # The ctypes view only lives for the call, the bytearray must not be resized while locked
+    view = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+    try:
+        return getattr(libc, name)(ctypes.c_void_p(ctypes.addressof(view)), ctypes.c_size_t(len(buffer))) == 0
+    finally:
+        del view
+
+
+def lock_memory(buffer: bytearray) -> bool:
+    """mlock a buffer so it is never written to swap, False where the OS refuses (e.g. RLIMIT_MEMLOCK)"""
+    return _memory_call("mlock", buffer)
+
+
+def unlock_memory(buffer: bytearray) -> None:
+    _memory_call("munlock", buffer)
+
+
+def _clear_entries(entries: OrderedDict, lock: threading.Lock) -> None:
+    with lock:
+        while entries:
+            _, (buffer, _, _) = entries.popitem()
+            wipe(buffer)
+            unlock_memory(buffer)
+
+
+class SessionKeyCache:
+    """Session keys of the files decrypted in this session, so reopening one skips the passphrase S2K
+
+    gpg prints a file's session key on the first decrypt (--show-session-key), later decrypts
+    hand it back with --override-session-key-fd and skip the key derivation (or the secret key
+    unlock of key-encrypted files). Entries are keyed like DecryptCache by path, inode, mtime
+    and size, and are only used for the passphrase they were captured with, compared through
+    an HMAC with a per-cache random key. Keys are kept in mlock'ed bytearrays, zeroed when an
+    entry is dropped, by clear() (GpgProcess.lock) and at interpreter exit.
+
+    Encrypting cannot reuse them: every encryption derives a new key from a fresh S2K salt.
+    """
+
+    file_key = staticmethod(DecryptCache.file_key)
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._hmac_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Wipes the keys at exit even if lock() is never called
+        self._finalizer = weakref.finalize(self, _clear_entries, self._entries, self._lock)
+
+    def _passphrase_tag(self, passphrase: Optional[str]) -> bytes:
+        return hmac.new(self._hmac_key, (passphrase or "").encode("utf-8"), hashlib.sha256).digest()
+
+    def get(self, key: Optional[tuple], passphrase: Optional[str]) -> Optional[bytearray]:
+        """A locked copy of the session key ("<algo>:<hex>"), the caller wipes it with release()"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None or not hmac.compare_digest(entry[1], self._passphrase_tag(passphrase)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            session_key = bytearray(len(entry[0]))
+            lock_memory(session_key)
+            session_key[:] = entry[0]
+            return session_key
+
+    @staticmethod
+    def release(session_key: bytearray) -> None:
+        wipe(session_key)
+        unlock_memory(session_key)
+
+    def put(self, key: Optional[tuple], passphrase: Optional[str], session_key: str) -> None:
+        if key is None:
+            return
+        buffer = bytearray(len(session_key))
+        lock_memory(buffer)
+        buffer[:] = session_key.encode("ascii")
+        with self._lock:
+            # Older versions of the same file can never be hit again
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._remove(stale)
+            self._entries[key] = (buffer, self._passphrase_tag(passphrase), time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, path: str) -> None:
+        """Drop the key of path, e.g. when the file is about to be overwritten"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for stale in [k for k in self._entries if k[0] == path]:
+                self._remove(stale)
+
+    def clear(self) -> None:
+        _clear_entries(self._entries, self._lock)
+
+    def _remove(self, key: tuple) -> None:
+        buffer = self._entries.pop(key)[0]
+        wipe(buffer)
+        unlock_memory(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,20 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def gnupg_home(tmp_path, monkeypatch):
+    """A throwaway GNUPGHOME, its gpg-agent is stopped afterwards"""
+    if not shutil.which("gpg"):
+        pytest.skip("gpg is not installed")
+    home = tmp_path / "gnupg"
+    home.mkdir(mode=0o700)
+    monkeypatch.setenv("GNUPGHOME", str(home))
+    yield str(home)
+    subprocess.run(["gpgconf", "--kill", "gpg-agent"], capture_output=True)
@@ -0,0 +1,72 @@
+import asyncio
+import gc
+import logging
+import time
+
+import pytest
+
+from async_gpg_process import AsyncGpgProcess
+from session_keys import SessionKeyCache
+
+
+def test_blocking_methods_are_not_exposed():
+    for name in ("create_key", "import_keys", "encrypt_file", "decrypt_many", "decrypt_bytes"):
+        assert not hasattr(AsyncGpgProcess, name)
+
+
+def test_timeout_leaves_no_unretrieved_task(gnupg_home, caplog):
+    gpg = AsyncGpgProcess(timeout=0.2)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(gpg._exec("sleep", ["sleep", "5"], [b"x"]))
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        gc.collect()
+    assert "never retrieved" not in caplog.text
+
+
+def test_decrypt_reuses_session_keys(gnupg_home, tmp_path):
+    async def run():
+        gpg = AsyncGpgProcess(file_path=str(tmp_path / "note.gpg"), passphrase="passphrase")
+        gpg.session_keys = SessionKeyCache()
+        await gpg.encrypt("hello")
+        assert await gpg.decrypt() == "hello"
+        assert await gpg.decrypt() == "hello"
+        return gpg.session_keys.stats()
+
+    assert asyncio.run(run())["hits"] == 1
+
+
+def test_clones_share_the_concurrency_limit(gnupg_home):
+    async def run():
+        gpg = AsyncGpgProcess(max_concurrent=1)
+        clone = gpg.clone()
+        await clone.list_secret_keys()
+        return gpg._limiter["semaphore"]
+
+    assert asyncio.run(run()) is not None
+
+
+def test_cancel_while_beginning_ends_the_agent_operation(gnupg_home, tmp_path, monkeypatch):
+    gpg = AsyncGpgProcess(file_path=str(tmp_path / "note.gpg"), passphrase="passphrase")
+    begin_operation = gpg.agent.begin_operation
+    begun = []
+
+    def slow_begin():
+        time.sleep(0.2)
+        begun.append(True)
+        return begin_operation()
+
+    monkeypatch.setattr(gpg.agent, "begin_operation", slow_begin)
+
+    async def run():
+        task = asyncio.create_task(gpg.decrypt())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Let the thread finish begin_operation and the loop run the done callback
+        while not begun:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert gpg.agent._active == 0
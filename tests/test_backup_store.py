@@ -0,0 +1,24 @@
+import os
+
+from backup_store import BackupStore
+from gpg_process import GpgProcess
+
+
+def test_blob_suffix_follows_the_content(gnupg_home, tmp_path):
+    path = str(tmp_path / "note.txt")
+    store = BackupStore(keep_count=None)
+    with open(path, "w") as f:
+        f.write("plain text")
+    plain_blob = store.backup(path)
+
+    gpg = GpgProcess(file_path=path, passphrase="passphrase")
+    gpg.encrypt("secret")
+    encrypted_blob = store.backup(path)
+
+    assert plain_blob.endswith(".bak") and encrypted_blob.endswith(".gpg")
+    assert [version["encrypted"] for version in store.versions(path)] == [False, True]
+    assert all(os.path.exists(version["path"]) for version in store.versions(path))
+
+    store.restore(path, 0)
+    with open(path) as f:
+        assert f.read() == "plain text"
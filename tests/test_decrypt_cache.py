@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from decrypt_cache import DecryptCache
+from gpg_process import GpgProcess
+
+
+def test_changed_ciphertext_misses_the_cache(gnupg_home, tmp_path):
+    path = str(tmp_path / "note.gpg")
+    gpg = GpgProcess(path, "passphrase", load_keys=False)
+    gpg.decrypt_cache = DecryptCache()
+    gpg.encrypt("first version")
+    assert gpg.decrypt() == "first version"
+    runs = len(gpg.tracer.records)
+    assert gpg.decrypt() == "first version"
+    assert len(gpg.tracer.records) == runs
+
+    # Replaced by another program: the inode, mtime or size differ
+    other = GpgProcess(str(tmp_path / "other.gpg"), "passphrase", load_keys=False)
+    other.encrypt("second version, longer")
+    os.replace(other.file_path, path)
+    assert gpg.decrypt() == "second version, longer"
+    assert gpg.decrypt_cache.stats()["hits"] == 1
+
+    # Our own encrypt drops the entry before overwriting the file
+    gpg.encrypt("third")
+    assert gpg.decrypt_cache.stats()["entries"] == 0
+    assert gpg.decrypt() == "third"
+
+
+def test_cached_document_needs_its_passphrase(gnupg_home, tmp_path):
+    gpg = GpgProcess(str(tmp_path / "note.gpg"), "passphrase", load_keys=False)
+    gpg.decrypt_cache = DecryptCache()
+    gpg.encrypt("secret")
+    assert gpg.decrypt() == "secret"
+
+    gpg.passphrase = "another passphrase"
+    with pytest.raises(ValueError):
+        gpg.decrypt()
@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+from gpg_agent import AgentSession
+
+
+def test_idle_session_is_flushed_without_a_further_operation(gnupg_home):
+    agent = AgentSession(ttl=None, idle_timeout=0.2)
+    with agent.operation():
+        pass
+    assert agent.flush_count == 1
+    time.sleep(0.5)
+    assert agent.flush_count == 2
+    agent.close()
+
+
+def test_failed_operation_still_ends(gnupg_home):
+    agent = AgentSession(ttl=None, idle_timeout=60)
+    with pytest.raises(RuntimeError):
+        with agent.operation():
+            raise RuntimeError("gpg failed")
+    assert agent.stats()["avg_cold_operation_seconds"] > 0
+    assert agent._active == 0
+    agent.close()
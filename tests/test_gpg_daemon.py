@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+
+import pytest
+
+from gpg_daemon import DaemonClient, GpgDaemon
+from gpg_process import GpgProcess
+from gpg_status import GpgError
+
+
+@pytest.fixture
+def daemon(gnupg_home):
+    gpg = GpgProcess()
+    server = GpgDaemon(gpg, os.path.join(gnupg_home, "S.test-daemon"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if os.path.exists(server.socket_path):
+            break
+        time.sleep(0.05)
+    yield server
+    server.shutdown()
+    thread.join()
+
+
+def test_clients_with_different_passphrases(daemon):
+    fingerprint = daemon.gpg.create_key("alice@example.org", "Alice", "alice passphrase")["fingerprint"]
+    with DaemonClient(daemon.socket_path) as alice, DaemonClient(daemon.socket_path) as mallory:
+        ciphertext = alice.encrypt(b"secret", recipients=[fingerprint])
+        assert alice.decrypt(ciphertext, "alice passphrase") == b"secret"
+        # Alice's request left the key unlocked in the shared gpg-agent
+        with pytest.raises(GpgError) as error:
+            mallory.decrypt(ciphertext, "another passphrase")
+        assert error.value.reason == "bad_passphrase"
+        assert alice.decrypt(ciphertext, "alice passphrase") == b"secret"
+
+
+def test_unexpected_error_keeps_the_connection(daemon, monkeypatch):
+    def broken(request):
+        raise RuntimeError("keyring exploded")
+
+    monkeypatch.setattr(daemon, "_op_list_keys", broken)
+    with DaemonClient(daemon.socket_path) as client:
+        with pytest.raises(GpgError, match="Internal error: RuntimeError: keyring exploded"):
+            client.list_keys()
+        assert client.request("ping") == {"ok": True}
+    assert daemon.metrics()["running"] == 0
@@ -0,0 +1,208 @@
+import os
+import subprocess
+import threading
+
+import pytest
+
+from gpg_process import COMPRESSION_SAMPLE_SIZE, LARGE_PAYLOAD_SIZE, GpgProcess
+from gpg_status import GpgError
+from preferences import Preferences
+
+
+def test_cancel_stops_the_remaining_steps_of_an_operation(gnupg_home, monkeypatch):
+    gpg = GpgProcess()
+    generate_key = gpg._generate_key
+
+    def generate_then_cancel(*args):
+        fingerprint = generate_key(*args)
+        gpg.cancel()
+        return fingerprint
+
+    # Generation finishes, setting the trust is the step that must not start
+    monkeypatch.setattr(gpg, "_generate_key", generate_then_cancel)
+    with pytest.raises(GpgError) as error:
+        gpg.create_key("bob@example.org", "Bob", "passphrase")
+    assert error.value.reason == "cancelled"
+    assert gpg.keys.lookup("bob@example.org") == []
+
+    gpg.list_secret_keys(force=True)
+    assert len(gpg.keys) == 1
+
+
+def test_cancel_is_not_cleared_by_an_operation_of_another_thread(gnupg_home, monkeypatch):
+    gpg = GpgProcess()
+    generate_key = gpg._generate_key
+    listing = []
+
+    def generate_then_cancel(*args):
+        fingerprint = generate_key(*args)
+        gpg.cancel()
+        # Started after cancel(), it runs to completion and leaves the cancelled operation alone
+        thread = threading.Thread(target=lambda: listing.append(gpg.list_secret_keys(force=True)))
+        thread.start()
+        thread.join()
+        return fingerprint
+
+    monkeypatch.setattr(gpg, "_generate_key", generate_then_cancel)
+    with pytest.raises(GpgError) as error:
+        gpg.create_key("bob@example.org", "Bob", "passphrase")
+    assert error.value.reason == "cancelled"
+    assert listing == [None]
+
+
+def test_reimported_secret_key_is_unchanged(gnupg_home, tmp_path):
+    gpg = GpgProcess()
+    fingerprint = gpg.create_key("carol@example.org", "Carol", "passphrase")["fingerprint"]
+    exported = str(tmp_path / "carol.asc")
+    gpg.export_keys([fingerprint], exported, passphrase="passphrase")
+
+    report = gpg.import_keys([exported], passphrase="passphrase")
+    assert [result.fingerprint for result in report.results] == [fingerprint]
+    assert report.results[0].secret and report.results[0].unchanged
+    assert report.imported == []
+
+
+def test_bulk_errors_do_not_show_the_passphrase(gnupg_home, tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    gpg = GpgProcess(passphrase="do not print me")
+
+    def fail(src, dst, use_key):
+        raise subprocess.CalledProcessError(2, gpg._symmetric_args() + [src])
+
+    monkeypatch.setattr(gpg, "_encrypt_path", fail)
+    report = gpg.encrypt_many(str(source))
+    assert not report.results[0].ok
+    assert "do not print me" not in report.results[0].error
+
+
+def test_trust_changed_outside_refreshes_the_keys(gnupg_home):
+    gpg = GpgProcess()
+    fingerprint = gpg.create_key("dave@example.org", "Dave", "passphrase")["fingerprint"]
+    assert gpg.keys.get(fingerprint).ownertrust == "u"
+
+    subprocess.run(["gpg", "--import-ownertrust"], input=f"{fingerprint}:4:\n", text=True, check=True)
+    gpg.list_secret_keys()
+    assert gpg.keys.get(fingerprint).ownertrust == "m"
+
+
+def test_stream_settings_are_checked_before_iterating(gnupg_home):
+    gpg = GpgProcess(load_keys=False)
+    with pytest.raises(ValueError, match="decrypt_stream: Passphrase is required"):
+        gpg.decrypt_stream([b"data"])
+    with pytest.raises(ValueError, match="encrypt_stream: No key selected"):
+        gpg.encrypt_stream([b"data"], use_key=True)
+
+
+def test_text_size_counts_encoded_bytes():
+    assert GpgProcess._text_size("abc") == 3
+    assert GpgProcess._text_size("é" * 100000) == 200000
+
+
+def test_encrypt_for_two_keys_decrypts_with_each(gnupg_home, tmp_path, monkeypatch):
+    other_home = tmp_path / "other"
+    other_home.mkdir(mode=0o700)
+    monkeypatch.setenv("GNUPGHOME", str(other_home))
+    try:
+        bob = GpgProcess(load_keys=False)
+        bob_key = bob.create_key("bob@example.org", "Bob", "bob passphrase")["fingerprint"]
+        bob.export_keys([bob_key], str(tmp_path / "bob.asc"))
+
+        monkeypatch.setenv("GNUPGHOME", gnupg_home)
+        alice = GpgProcess(load_keys=False)
+        alice_key = alice.create_key("alice@example.org", "Alice", "alice passphrase")["fingerprint"]
+        alice.import_keys([str(tmp_path / "bob.asc")])
+        assert (bob_key, "Bob <bob@example.org>") in alice.public_keys
+        alice.selected_keys = [(alice_key, "alice@example.org"), (bob_key, "bob@example.org")]
+        # Nobody certified Bob's imported key
+        with pytest.raises(ValueError):
+            alice.encrypt_bytes(b"for both of us", use_key=True)
+        alice.trust_recipients = True
+        ciphertext = alice.encrypt_bytes(b"for both of us", use_key=True)
+
+        alice.passphrase = "alice passphrase"
+        assert alice.decrypt_bytes(ciphertext) == b"for both of us"
+        monkeypatch.setenv("GNUPGHOME", str(other_home))
+        bob.passphrase = "bob passphrase"
+        assert bob.decrypt_bytes(ciphertext) == b"for both of us"
+    finally:
+        subprocess.run(["gpgconf", "--homedir", str(other_home), "--kill", "gpg-agent"], capture_output=True)
+
+
+def test_export_reports_why_keys_were_not_exported(gnupg_home, tmp_path):
+    gpg = GpgProcess(load_keys=False)
+    alice = gpg.create_key("alice@example.org", "Alice", "alice passphrase")["fingerprint"]
+    bob = gpg.create_key("bob@example.org", "Bob", "bob passphrase")["fingerprint"]
+
+    report = gpg.export_keys([alice, bob], str(tmp_path / "keys"), "alice passphrase", per_key=True)
+    assert list(report.outputs) == [alice]
+    assert report.missing == [bob]
+    assert report.problems == {bob: "Wrong passphrase"}
+
+    with pytest.raises(GpgError) as error:
+        gpg.export_keys([bob], str(tmp_path / "bob.asc"), "alice passphrase")
+    assert error.value.reason == "bad_passphrase"
+
+
+def full_listings(gpg):
+    return [record for record in gpg.tracer.records if record.argv[-2:] == ["--with-colons", "--with-secret"]]
+
+
+def test_key_listing_is_cached_and_patched(gnupg_home):
+    gpg = GpgProcess()
+    gpg.tracer.clear()
+    fingerprint = gpg.create_key("alice@example.org", "Alice", "passphrase")["fingerprint"]
+    assert gpg.keys.get(fingerprint).secret
+    gpg.list_secret_keys()
+    # create_key patched the registry with the new key, nothing listed the whole keyring
+    assert full_listings(gpg) == []
+
+    # A key added behind our back changes the keyring files
+    unprotected = [gpg.gpg_path, "--batch", "--pinentry-mode", "loopback", "--passphrase", ""]
+    subprocess.run(
+        unprotected + ["--quick-gen-key", "carol@example.org", "ed25519", "default", "never"],
+        check=True,
+        capture_output=True,
+    )
+    gpg.list_secret_keys()
+    assert len(full_listings(gpg)) == 1
+    assert [record.uid for record in gpg.keys.lookup("carol@example.org")] == ["carol@example.org"]
+
+    gpg.delete_key(fingerprint)
+    gpg.list_secret_keys()
+    assert gpg.keys.get(fingerprint) is None
+    assert len(full_listings(gpg)) == 1
+
+
+def test_compression_is_picked_from_a_sample(gnupg_home):
+    gpg = GpgProcess(load_keys=False)
+    text = b"the quick brown fox jumps over the lazy dog " * 2000
+    sample = text[:COMPRESSION_SAMPLE_SIZE]
+
+    assert gpg._compression_args(os.urandom(COMPRESSION_SAMPLE_SIZE), LARGE_PAYLOAD_SIZE) == [
+        "--compress-algo",
+        "none",
+        "-z",
+        "0",
+    ]
+    assert gpg.last_compression["sample_ratio"] > 0.9
+    assert "estimated_seconds_saved" in gpg.last_compression
+    assert gpg._compression_args(sample, LARGE_PAYLOAD_SIZE) == ["--compress-algo", "zlib", "-z", "9"]
+    assert gpg._compression_args(sample, len(sample)) == ["--compress-algo", "zlib", "-z", "6"]
+    assert gpg.last_compression["estimated_bytes_saved"] > 0
+    assert gpg._compression_args(b"", 0)[1] == "none"
+
+
+def test_compression_preference_overrides_the_sample(gnupg_home, tmp_path):
+    preferences = Preferences(str(tmp_path / "config.json"))
+    preferences.set_compression("bzip2")
+    gpg = GpgProcess(str(tmp_path / "note.gpg"), "passphrase", load_keys=False)
+    gpg.compression = preferences.get_compression()
+
+    gpg.encrypt(os.urandom(1000).hex())
+    assert gpg.last_compression["algo"] == "bzip2"
+    assert gpg.last_compression["sample_ratio"] is None
+    argv = gpg.tracer.records[-1].argv
+    assert argv[argv.index("--compress-algo") + 1] == "bzip2"
+    assert len(gpg.decrypt()) == 2000
@@ -0,0 +1,26 @@
+import pytest
+
+from gpg_process import GpgProcess
+from gpg_status import GpgError, failure_reason, parse_status_line
+
+
+def test_pkdecrypt_failed_code_is_bad_passphrase():
+    events = [
+        parse_status_line("[GNUPG:] ERROR pkdecrypt_failed 67108875"),
+        parse_status_line("[GNUPG:] DECRYPTION_FAILED"),
+    ]
+    assert failure_reason(events) == "bad_passphrase"
+
+
+def test_wrong_passphrase_on_public_key_file(gnupg_home, tmp_path):
+    gpg = GpgProcess()
+    fingerprint = gpg.create_key("alice@example.org", "Alice", "right passphrase")["fingerprint"]
+    gpg.selected_key = (fingerprint, "alice@example.org")
+    source = tmp_path / "note.txt"
+    source.write_text("secret")
+    encrypted = gpg.encrypt_file(str(source), use_key=True)
+
+    gpg.passphrase = "wrong passphrase"
+    with pytest.raises(GpgError) as error:
+        gpg.decrypt_file(encrypted, str(tmp_path / "out.txt"))
+    assert error.value.reason == "bad_passphrase"
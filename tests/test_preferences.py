@@ -0,0 +1,62 @@
+import json
+import time
+
+from preferences import SCHEMA_VERSION, Preferences
+
+
+def test_changes_are_written_together(tmp_path, monkeypatch):
+    config = tmp_path / "config.json"
+    preferences = Preferences(str(config), save_delay=0.2)
+    writes = []
+    write = preferences._write
+
+    def counted_write(changes):
+        writes.append(changes)
+        write(changes)
+
+    monkeypatch.setattr(preferences, "_write", counted_write)
+
+    preferences.set_compression("zlib")
+    preferences.set_key_algorithm("rsa4096")
+    # Setters return before anything reaches the disk
+    assert not config.exists()
+    for _ in range(50):
+        if writes:
+            break
+        time.sleep(0.05)
+    time.sleep(0.1)
+
+    assert writes == [{"compression": "zlib", "key_algorithm": "rsa4096"}]
+    saved = json.loads(config.read_text())
+    assert saved["compression"] == "zlib"
+    assert saved["schema_version"] == SCHEMA_VERSION
+
+
+def test_instances_keep_each_other_changes(tmp_path):
+    config = str(tmp_path / "config.json")
+    first = Preferences(config, save_delay=60)
+    second = Preferences(config, save_delay=60)
+    first.load()
+    second.load()
+
+    first.set_compression("bzip2")
+    second.set_key_algorithm("rsa4096")
+    first.flush()
+    second.flush()
+
+    assert Preferences(config).get_compression() == "bzip2"
+    assert Preferences(config).get_key_algorithm() == "rsa4096"
+    # The second write picked up the first one
+    assert second.get_compression() == "bzip2"
+
+
+def test_corrupt_file_is_moved_aside(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text("{not json")
+    preferences = Preferences(str(config), save_delay=60)
+
+    assert preferences.get_compression() == "auto"
+    assert [path.name.startswith("config.json.corrupt-") for path in tmp_path.iterdir()] == [True]
+    preferences.set_compression("none")
+    preferences.flush()
+    assert json.loads(config.read_text())["compression"] == "none"
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from gpg_process import GpgProcess
+from gpg_status import GpgError
+from search_index import SearchIndex
+
+
+def test_cancel_stops_an_index_update(gnupg_home, tmp_path):
+    gpg = GpgProcess(passphrase="passphrase", load_keys=False)
+    for i in range(4):
+        with open(tmp_path / f"note{i}.gpg", "wb") as f:
+            f.write(gpg.encrypt_bytes(f"note number {i}".encode()))
+    index = SearchIndex(gpg, str(tmp_path))
+    done = []
+
+    def cancel_after_first(count, total):
+        done.append(count)
+        gpg.cancel()
+
+    with pytest.raises(GpgError) as error:
+        index.update(workers=1, progress=cancel_after_first)
+    assert error.value.reason == "cancelled"
+    assert done == [1]
+    assert not os.path.exists(index.index_path)
+
+    # The cancel does not outlive the update
+    report = index.update(workers=1)
+    assert report["indexed"] == 4
+    assert [name for name, _ in index.search("number")] == [f"note{i}.gpg" for i in range(4)]